@@ -0,0 +1,4 @@
+"""
+基准测试工具
+使用可控规模的合成vault测量导出流程各阶段的耗时，并与保存的JSON基线比较
+"""
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+导出流程基准测试
+在不同规模的合成vault上测量各阶段耗时，结果保存为JSON基线，并可与已有基线比较以发现性能回退
+
+用法:
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --save-baseline local
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --compare local
+"""
+
+from pathlib import Path
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import obsidian_export
+from benchmarks.synthetic_vault import generate_vault
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+# 默认测试规模（笔记数）
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# 每个阶段重复运行的次数，取最快的一次
+DEFAULT_REPEATS = 3
+
+# 与基线比较时允许的变慢比例（0.25表示慢25%以内不算回退）
+DEFAULT_TOLERANCE = 0.25
+
+# 耗时低于此值（秒）的阶段不参与回退判断，避免计时噪声
+MIN_COMPARABLE_SECONDS = 0.005
+
+# 基线文件目录
+BASELINE_DIRECTORY = Path(__file__).parent / "baselines"
+
+# 离线Pandoc替身
+STUB_PANDOC = Path(__file__).parent / "stub_pandoc.py"
+
+# =============================================================================
+# 基准测试
+# =============================================================================
+
+
+def time_stage(function, repeats):
+    """
+    重复运行一个阶段并记录最快耗时（阶段内的打印输出被丢弃）
+
+    Args:
+        function (callable): 无参数的阶段函数，返回值作为下一阶段的输入
+        repeats (int): 重复次数
+
+    Returns:
+        tuple: (最快耗时（秒）, 最后一次运行的返回值)
+    """
+    best = None
+    result = None
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_size(note_count, work_dir, repeats, jobs, build):
+    """
+    在一个规模的合成vault上测量各阶段耗时
+
+    Args:
+        note_count (int): 笔记数量
+        work_dir (Path): 工作目录（存放vault和输出）
+        repeats (int): 每个阶段的重复次数
+        jobs (int): 元数据提取的线程数
+        build (bool): 是否同时测量使用Pandoc替身的分章节构建
+
+    Returns:
+        dict: {"vault": 生成统计, "stages": 阶段名 -> {"seconds", "per_note_us"}}
+    """
+    vault_path = work_dir / f"vault_{note_count}"
+    output_dir = work_dir / f"output_{note_count}"
+    shutil.rmtree(output_dir, ignore_errors=True)
+    output_dir.mkdir(parents=True)
+
+    print(f"\n📦 正在生成 {note_count} 篇笔记的合成vault...")
+    vault_stats = generate_vault(vault_path, note_count)
+    obsidian_export.VAULT_PATH = vault_path
+
+    stages = {}
+
+    def record(name, seconds):
+        stages[name] = {
+            "seconds": round(seconds, 6),
+            "per_note_us": round(seconds / note_count * 1e6, 3),
+        }
+        print(f"   {name:<36} {seconds:9.4f} 秒  ({stages[name]['per_note_us']:.2f} µs/篇)")
+
+    seconds, md_files = time_stage(
+        lambda: obsidian_export.find_all_md_files(vault_path), repeats)
+    record("find_all_md_files", seconds)
+
+    # 阶段名保持不变以便与旧基线比较；提取结果为紧凑的笔记表
+    seconds, note_table = time_stage(
+        lambda: obsidian_export.analyze_files_with_all_metadata(md_files, ("tag",), jobs=jobs),
+        repeats)
+    record("analyze_files_with_metadata", seconds)
+
+    # 扫描缓存命中时的增量扫描
+    scan_cache = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        obsidian_export.analyze_files_with_all_metadata(md_files, ("tag",), scan_cache, jobs=jobs)
+    seconds, _ = time_stage(
+        lambda: obsidian_export.analyze_files_with_all_metadata(
+            md_files, ("tag",), dict(scan_cache), jobs=jobs), repeats)
+    record("analyze_files_with_metadata_cached", seconds)
+
+    seconds, tag_index = time_stage(
+        lambda: obsidian_export.collect_all_metadata(note_table, "tag"), repeats)
+    record("collect_all_metadata", seconds)
+
+    seconds, chapter_structure = time_stage(
+        lambda: obsidian_export.generate_chapter_structure(note_table, tag_index, "tag"), repeats)
+    record("generate_chapter_structure", seconds)
+
+    seconds, _ = time_stage(
+        lambda: obsidian_export.save_chapter_index(chapter_structure, output_dir, "tag"), repeats)
+    record("save_chapter_index", seconds)
+    seconds, _ = time_stage(
+        lambda: obsidian_export.load_chapter_index(output_dir, "tag"), repeats)
+    record("load_chapter_index", seconds)
+
+    compact_dir = output_dir / "compact_index"
+    seconds, _ = time_stage(
+        lambda: obsidian_export.save_chapter_index(
+            chapter_structure, compact_dir, "tag", index_format="compact"), repeats)
+    record("save_chapter_index_compact", seconds)
+    seconds, _ = time_stage(
+        lambda: obsidian_export.load_chapter_index(compact_dir, "tag"), repeats)
+    record("load_chapter_index_compact", seconds)
+
+    if build:
+        # 第一次为冷启动（全部渲染），之后的重复运行测量的是跳过未变化分组的增量构建
+        obsidian_export.PANDOC_BINARY = str(STUB_PANDOC)
+        obsidian_export.get_pandoc_version.cache_clear()
+        seconds, _ = time_stage(
+            lambda: obsidian_export.generate_epub_by_chapters(
+                chapter_structure, output_dir, "tag",
+                jobs=obsidian_export.EPUB_BUILD_JOBS), 1)
+        record("generate_epub_by_chapters_cold", seconds)
+        seconds, _ = time_stage(
+            lambda: obsidian_export.generate_epub_by_chapters(
+                chapter_structure, output_dir, "tag",
+                jobs=obsidian_export.EPUB_BUILD_JOBS), repeats)
+        record("generate_epub_by_chapters_warm", seconds)
+        seconds, _ = time_stage(
+            lambda: obsidian_export.generate_html_site(
+                chapter_structure, output_dir, "tag", jobs=obsidian_export.EPUB_BUILD_JOBS), 1)
+        record("generate_html_site_cold", seconds)
+        seconds, _ = time_stage(
+            lambda: obsidian_export.generate_html_site(
+                chapter_structure, output_dir, "tag", jobs=obsidian_export.EPUB_BUILD_JOBS), repeats)
+        record("generate_html_site_warm", seconds)
+
+        # 清空渲染缓存和构建清单后，用本机替身pandoc server重新冷构建，比较两种转换后端
+        shutil.rmtree(output_dir / obsidian_export.RENDER_CACHE_DIRNAME, ignore_errors=True)
+        (output_dir / obsidian_export.BUILD_MANIFEST_FILENAME).unlink()
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        obsidian_export.PANDOC_BACKEND = "server"
+        obsidian_export.PANDOC_SERVER_URL = f"http://127.0.0.1:{port}"
+        obsidian_export.get_pandoc_version.cache_clear()
+        try:
+            seconds, _ = time_stage(
+                lambda: obsidian_export.generate_epub_by_chapters(
+                    chapter_structure, output_dir, "tag",
+                    jobs=obsidian_export.EPUB_BUILD_JOBS), 1)
+            record("generate_epub_by_chapters_cold_server", seconds)
+        finally:
+            obsidian_export.stop_pandoc_server()
+            obsidian_export.PANDOC_BACKEND = "subprocess"
+            obsidian_export.get_pandoc_version.cache_clear()
+
+    return {"vault": vault_stats, "stages": stages}
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    与基线比较，找出变慢超过容忍度的阶段
+
+    Args:
+        results (dict): 本次结果
+        baseline (dict): 基线结果
+        tolerance (float): 允许的变慢比例
+
+    Returns:
+        list: 回退描述列表，为空表示没有回退
+    """
+    regressions = []
+    for size, size_results in results["sizes"].items():
+        baseline_stages = baseline.get("sizes", {}).get(size, {}).get("stages", {})
+        for stage, timing in size_results["stages"].items():
+            baseline_timing = baseline_stages.get(stage)
+            if baseline_timing is None or baseline_timing["seconds"] < MIN_COMPARABLE_SECONDS:
+                continue
+
+            ratio = timing["seconds"] / baseline_timing["seconds"]
+            marker = "❌" if ratio > 1 + tolerance else "  "
+            print(f"{marker} {size:>7} 篇 {stage:<36} 基线 {baseline_timing['seconds']:.4f} 秒 "
+                  f"-> {timing['seconds']:.4f} 秒 ({ratio:.2f}x)")
+            if ratio > 1 + tolerance:
+                regressions.append(f"{size} 篇 {stage}: {ratio:.2f}x")
+    return regressions
+
+
+def print_scaling(results):
+    """
+    打印各阶段的单篇耗时随规模的变化（线性扩展时应基本保持不变）
+
+    Args:
+        results (dict): 本次结果
+    """
+    sizes = sorted(results["sizes"], key=int)
+    if len(sizes) < 2:
+        return
+
+    print("\n📈 单篇耗时随规模变化 (µs/篇):")
+    stages = results["sizes"][sizes[0]]["stages"]
+    print(f"   {'阶段':<34}" + "".join(f"{size:>12}" for size in sizes))
+    for stage in stages:
+        values = [results["sizes"][size]["stages"].get(stage, {}).get("per_note_us")
+                  for size in sizes]
+        print(f"   {stage:<36}" + "".join(
+            f"{value:>12.2f}" if value is not None else f"{'-':>12}" for value in values))
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="在合成vault上测量导出流程各阶段的耗时")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help=f"测试规模（笔记数），默认: {' '.join(map(str, DEFAULT_SIZES))}")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="每个阶段的重复次数")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="元数据提取的线程数")
+    parser.add_argument("--build", action="store_true",
+                        help="同时测量使用离线Pandoc替身的分章节构建")
+    parser.add_argument("--work-dir", type=Path,
+                        help="工作目录（默认使用临时目录，运行结束后删除）")
+    parser.add_argument("-o", "--output", type=Path, help="把结果另存为JSON文件")
+    parser.add_argument("--save-baseline", metavar="NAME", help="把结果保存为基线")
+    parser.add_argument("--compare", metavar="NAME", help="与指定基线比较，有回退时返回非零退出码")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"允许的变慢比例（默认: {DEFAULT_TOLERANCE}）")
+    args = parser.parse_args(argv)
+
+    results = {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "jobs": args.jobs,
+        "sizes": {},
+    }
+
+    temporary_dir = None
+    work_dir = args.work_dir
+    if work_dir is None:
+        temporary_dir = tempfile.TemporaryDirectory(prefix="obsidian_export_bench_")
+        work_dir = Path(temporary_dir.name)
+
+    try:
+        for note_count in args.sizes:
+            results["sizes"][str(note_count)] = benchmark_size(
+                note_count, work_dir, args.repeats, args.jobs, args.build)
+    finally:
+        if temporary_dir is not None:
+            temporary_dir.cleanup()
+
+    print_scaling(results)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n💾 结果已保存: {args.output.absolute()}")
+
+    if args.save_baseline:
+        BASELINE_DIRECTORY.mkdir(parents=True, exist_ok=True)
+        baseline_path = BASELINE_DIRECTORY / f"{args.save_baseline}.json"
+        baseline_path.write_text(json.dumps(results, ensure_ascii=False, indent=2),
+                                 encoding='utf-8')
+        print(f"\n💾 基线已保存: {baseline_path}")
+
+    if args.compare:
+        baseline_path = BASELINE_DIRECTORY / f"{args.compare}.json"
+        if not baseline_path.exists():
+            print(f"错误：基线文件不存在: {baseline_path}")
+            return 2
+
+        print(f"\n🔍 与基线 {baseline_path.name} 比较（容忍度 {args.tolerance:.0%}）:")
+        regressions = compare_with_baseline(
+            results, json.loads(baseline_path.read_text(encoding='utf-8')), args.tolerance)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 处性能回退:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print("\n✅ 没有发现性能回退")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+离线Pandoc替身
+只实现导出脚本用到的参数，输出结构正确但内容简化的结果，用于在没有Pandoc的环境中运行基准测试。
+`stub_pandoc.py server --port N` 启动一个模拟 `pandoc server` HTTP接口的本机替身服务器
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import html
+import json
+import sys
+
+# 模拟的Pandoc版本（参与渲染缓存键的计算）
+STUB_VERSION = "pandoc 0.0-stub"
+PANDOC_API_VERSION = [1, 23, 1]
+
+# 包含此标记的输入会转换失败，用于模拟格式错误的笔记（测试失败隔离）
+FAIL_MARKER = "<!-- stub-pandoc-fail -->"
+
+
+def convert(data, to_format):
+    """
+    把输入文本转换为简化的JSON AST或HTML片段
+
+    Args:
+        data (str): 输入文本
+        to_format (str): 输出格式
+
+    Returns:
+        str: 转换结果
+
+    Raises:
+        ValueError: 输入包含 FAIL_MARKER
+    """
+    if FAIL_MARKER in data:
+        raise ValueError("stub: malformed note")
+    paragraphs = [paragraph for paragraph in data.split("\n\n") if paragraph.strip()]
+    if to_format == "json":
+        blocks = [{"t": "Para", "c": [{"t": "Str", "c": paragraph}]} for paragraph in paragraphs]
+        return json.dumps({"pandoc-api-version": PANDOC_API_VERSION, "meta": {}, "blocks": blocks},
+                          ensure_ascii=False)
+    return "".join(f"<p>{html.escape(paragraph)}</p>\n" for paragraph in paragraphs)
+
+
+class StubServerHandler(BaseHTTPRequestHandler):
+    """模拟 `pandoc server`：GET /version 返回版本，POST / 接收JSON转换请求（支持keep-alive）"""
+
+    protocol_version = "HTTP/1.1"
+
+    def send_body(self, status, body, content_type="application/json"):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/version":
+            self.send_body(200, STUB_VERSION.split()[-1], "text/plain")
+        else:
+            self.send_body(404, json.dumps({"error": "not found"}))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            output = convert(request["text"], request.get("to", "html5"))
+        except (ValueError, KeyError) as e:
+            self.send_body(400, json.dumps({"error": str(e)}))
+            return
+        self.send_body(200, json.dumps({"output": output, "base64": False, "messages": []},
+                                       ensure_ascii=False))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(args):
+    """按 `pandoc server --port N` 的约定运行替身服务器，直到进程被终止"""
+    port = int(args[args.index("--port") + 1]) if "--port" in args else 3030
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubServerHandler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    """按Pandoc的命令行约定处理输入，返回退出码"""
+    args = sys.argv[1:] if argv is None else argv
+    if "--version" in args:
+        print(STUB_VERSION)
+        return 0
+    if args[:1] == ["server"]:
+        return serve(args[1:])
+
+    output_path = args[args.index("-o") + 1] if "-o" in args else None
+    to_format = next((arg.split("=", 1)[1] for arg in args if arg.startswith("--to=")), None)
+    inputs = [arg for arg in args
+              if not arg.startswith("-") and arg != output_path]
+
+    if inputs:
+        data = "".join(open(path, encoding='utf-8').read() for path in inputs)
+    else:
+        data = sys.stdin.read()
+
+    if FAIL_MARKER in data:
+        sys.stderr.write("stub: malformed note\n")
+        return 64
+
+    if output_path:
+        # 生成EPUB等文件：写入一个占位文件
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(f"{STUB_VERSION}\n{len(data)}\n")
+        return 0
+
+    sys.stdout.write(convert(data, to_format))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
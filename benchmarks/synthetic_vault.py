@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+合成vault生成器
+按指定的笔记数量、大小分布、标签层级和多标签比例生成可复现的测试vault
+"""
+
+from pathlib import Path
+import argparse
+import json
+import math
+import random
+import shutil
+import sys
+
+# =============================================================================
+# 配置
+# =============================================================================
+
+# 默认参数
+DEFAULT_NOTE_COUNT = 1000
+DEFAULT_TAG_DEPTH = 3
+DEFAULT_FAN_OUT = 6
+DEFAULT_MULTI_TAG_RATIO = 0.3
+DEFAULT_MEAN_NOTE_SIZE = 3000
+DEFAULT_SIZE_SIGMA = 0.8
+DEFAULT_SEED = 42
+
+# 每个目录最多存放的笔记数（模拟按文件夹整理的vault）
+NOTES_PER_DIRECTORY = 400
+
+# 每篇笔记最多的标签数（多标签笔记在2~MAX_TAGS_PER_NOTE之间随机）
+MAX_TAGS_PER_NOTE = 5
+
+# 笔记正文中引用其他笔记的概率
+LINK_PROBABILITY = 0.2
+
+# 标签和正文使用的中文词语
+TOPIC_WORDS = [
+    "个人成长", "内在建设", "亲密关系", "家庭伦理", "职业发展", "社会观察", "自强", "沟通",
+    "情绪管理", "学习方法", "阅读", "写作", "时间管理", "健康", "财务", "哲学", "心理学",
+    "历史", "教育", "技术", "创业", "习惯", "思考", "记忆",
+]
+SENTENCE_WORDS = [
+    "我们", "应该", "如何", "理解", "这个", "问题", "其实", "本质上", "是一种", "选择",
+    "关系", "需要", "时间", "慢慢", "建立", "信任", "每个人", "都有", "自己的", "节奏",
+    "所以", "不要", "急于", "下结论", "而是", "观察", "记录", "反思", "然后", "行动",
+]
+SENTENCE_ENDINGS = ["。", "！", "？", "；"]
+
+# =============================================================================
+# 生成函数
+# =============================================================================
+
+
+def build_tag_tree(tag_depth, fan_out, rng):
+    """
+    生成标签树的全部叶子标签
+
+    Args:
+        tag_depth (int): 标签层级深度
+        fan_out (int): 每个标签的子标签数
+        rng (random.Random): 随机数生成器
+
+    Returns:
+        list: 叶子标签列表，如 "#1-个人成长/2-沟通/3C-自强"
+    """
+    tags = [""]
+    for depth in range(1, tag_depth + 1):
+        next_tags = []
+        for parent in tags:
+            for index in range(1, fan_out + 1):
+                # 第三层起带字母后缀，覆盖 LEVEL_PATTERN 的数字+字母+文字格式
+                letter = chr(ord("A") + rng.randrange(26)) if depth >= 3 else ""
+                level = f"{index}{letter}-{rng.choice(TOPIC_WORDS)}"
+                next_tags.append(f"{parent}/{level}" if parent else level)
+        tags = next_tags
+    return [f"#{tag}" for tag in tags]
+
+
+def generate_paragraphs(target_size, rng):
+    """
+    生成约为目标字节数的中文正文
+
+    Args:
+        target_size (int): 目标字节数（UTF-8）
+        rng (random.Random): 随机数生成器
+
+    Returns:
+        str: 正文内容
+    """
+    paragraphs = []
+    size = 0
+    while size < target_size:
+        sentences = []
+        for _ in range(rng.randint(2, 6)):
+            words = rng.choices(SENTENCE_WORDS, k=rng.randint(6, 18))
+            sentences.append("".join(words) + rng.choice(SENTENCE_ENDINGS))
+        paragraph = "".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph.encode('utf-8')) + 2
+    return "\n\n".join(paragraphs)
+
+
+def generate_vault(vault_path, note_count=DEFAULT_NOTE_COUNT, tag_depth=DEFAULT_TAG_DEPTH,
+                   fan_out=DEFAULT_FAN_OUT, multi_tag_ratio=DEFAULT_MULTI_TAG_RATIO,
+                   mean_note_size=DEFAULT_MEAN_NOTE_SIZE, size_sigma=DEFAULT_SIZE_SIGMA,
+                   seed=DEFAULT_SEED):
+    """
+    生成合成vault（相同参数和随机种子生成的内容完全相同）
+
+    Args:
+        vault_path (Path): vault目录，已存在时会被清空
+        note_count (int): 笔记数量
+        tag_depth (int): 标签层级深度
+        fan_out (int): 每个标签的子标签数
+        multi_tag_ratio (float): 带有多个标签的笔记比例
+        mean_note_size (int): 笔记正文的平均字节数（对数正态分布）
+        size_sigma (float): 笔记大小分布的离散程度
+        seed (int): 随机种子
+
+    Returns:
+        dict: 生成结果统计
+    """
+    rng = random.Random(seed)
+    vault_path = Path(vault_path)
+    if vault_path.exists():
+        shutil.rmtree(vault_path)
+    vault_path.mkdir(parents=True)
+
+    # 模拟Obsidian配置目录，应被扫描忽略
+    (vault_path / ".obsidian").mkdir()
+    (vault_path / ".obsidian" / "app.json").write_text("{}", encoding='utf-8')
+
+    leaf_tags = build_tag_tree(tag_depth, fan_out, rng)
+    categories = [f"#{index}-{word}" for index, word in enumerate(TOPIC_WORDS[:8], 1)]
+    note_names = [f"笔记{index:06d}" for index in range(note_count)]
+
+    # 对数正态分布的均值为 exp(mu + sigma^2 / 2)
+    mu = max(1.0, math.log(mean_note_size) - size_sigma ** 2 / 2)
+
+    total_bytes = 0
+    multi_tagged = 0
+    untagged = 0
+    for index, note_name in enumerate(note_names):
+        directory = vault_path / f"{index // NOTES_PER_DIRECTORY:04d}-{rng.choice(TOPIC_WORDS)}"
+        directory.mkdir(exist_ok=True)
+
+        # 约5%的笔记没有标签
+        if rng.random() < 0.05:
+            tags = []
+            untagged += 1
+        elif rng.random() < multi_tag_ratio:
+            tags = rng.sample(leaf_tags, min(len(leaf_tags), rng.randint(2, MAX_TAGS_PER_NOTE)))
+            multi_tagged += 1
+        else:
+            tags = [rng.choice(leaf_tags)]
+
+        lines = [f"# {note_name}"]
+        if tags:
+            lines.append(f"> Tag: {' '.join(tags)}")
+        lines.append(f"> Category: {rng.choice(categories)}")
+        lines.append("")
+
+        body = generate_paragraphs(int(rng.lognormvariate(mu, size_sigma)), rng)
+        if rng.random() < LINK_PROBABILITY:
+            body += f"\n\n参见 [[{rng.choice(note_names)}]]"
+        lines.append(body)
+
+        content = "\n".join(lines) + "\n"
+        note_path = directory / f"{note_name}.md"
+        note_path.write_text(content, encoding='utf-8')
+        total_bytes += len(content.encode('utf-8'))
+
+    return {
+        "note_count": note_count,
+        "total_bytes": total_bytes,
+        "leaf_tags": len(leaf_tags),
+        "multi_tagged": multi_tagged,
+        "untagged": untagged,
+        "seed": seed,
+    }
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="生成用于基准测试的合成Obsidian vault")
+    parser.add_argument("vault", type=Path, help="输出vault目录（已存在时会被清空）")
+    parser.add_argument("-n", "--notes", type=int, default=DEFAULT_NOTE_COUNT, help="笔记数量")
+    parser.add_argument("--tag-depth", type=int, default=DEFAULT_TAG_DEPTH, help="标签层级深度")
+    parser.add_argument("--fan-out", type=int, default=DEFAULT_FAN_OUT, help="每个标签的子标签数")
+    parser.add_argument("--multi-tag-ratio", type=float, default=DEFAULT_MULTI_TAG_RATIO,
+                        help="带有多个标签的笔记比例")
+    parser.add_argument("--mean-size", type=int, default=DEFAULT_MEAN_NOTE_SIZE,
+                        help="笔记正文平均字节数")
+    parser.add_argument("--size-sigma", type=float, default=DEFAULT_SIZE_SIGMA,
+                        help="笔记大小分布的离散程度")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="随机种子")
+    args = parser.parse_args(argv)
+
+    stats = generate_vault(args.vault, args.notes, args.tag_depth, args.fan_out,
+                           args.multi_tag_ratio, args.mean_size, args.size_sigma, args.seed)
+    print(f"✅ 已生成合成vault: {args.vault.absolute()}")
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
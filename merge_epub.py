@@ -7,7 +7,14 @@ EPUB合并脚本
 from pathlib import Path
 import subprocess
 import sys
-from datetime import datetime
+import shutil
+import posixpath
+import uuid
+import zipfile
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote, quote
+from xml.sax.saxutils import escape, quoteattr
+from datetime import datetime, timezone
 
 # =============================================================================
 # 配置
@@ -20,6 +27,17 @@ INPUT_DIRECTORY = Path("./output")
 OUTPUT_FILENAME = "Obsidian_完整合集_合并版.epub"
 OUTPUT_DIRECTORY = Path("./output")
 
+# 合并引擎："native" 直接在zip层面拼接EPUB（快速、低内存），"pandoc" 交给Pandoc重新渲染
+MERGE_ENGINE = "native"
+
+# Pandoc可执行文件（仅 "pandoc" 合并引擎使用）
+PANDOC_BINARY = "pandoc"
+
+# 合并后的书名和作者
+MERGED_TITLE = "Obsidian完整知识合集（合并版）"
+MERGED_AUTHOR = "知识整理者"
+MERGED_LANGUAGE = "zh-CN"
+
 # 要合并的EPUB文件顺序（按逻辑顺序排列）
 EPUB_FILES_ORDER = [
     "Obsidian_0-致读者.epub",
@@ -36,6 +54,19 @@ EPUB_FILES_ORDER = [
     "Obsidian_【答集】.epub",
 ]
 
+# EPUB相关的XML命名空间
+CONTAINER_NS = "urn:oasis:names:tc:opendocument:xmlns:container"
+OPF_NS = "http://www.idpf.org/2007/opf"
+DC_NS = "http://purl.org/dc/elements/1.1/"
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+OPS_NS = "http://www.idpf.org/2007/ops"
+
+# 本身已压缩的媒体类型，流式复制时不再压缩
+STORED_MEDIA_PREFIXES = ("image/", "audio/", "video/", "font/")
+
+# 复制zip条目时的缓冲区大小
+COPY_CHUNK_SIZE = 1024 * 1024
+
 # =============================================================================
 # 核心函数
 # =============================================================================
@@ -70,7 +101,452 @@ def find_existing_epub_files(input_dir):
     return found_files, missing_files
 
 
+def read_epub_package(epub_zip):
+    """
+    读取EPUB的包文档（OPF）信息
+
+    Args:
+        epub_zip (zipfile.ZipFile): 已打开的EPUB文件
+
+    Returns:
+        dict: 包含 opf_dir、title、manifest（id -> 条目信息）、spine（(idref, linear)列表）
+            和 nav_href 的字典
+    """
+    container = ET.fromstring(epub_zip.read("META-INF/container.xml"))
+    rootfile = container.find(f".//{{{CONTAINER_NS}}}rootfile")
+    opf_path = rootfile.get("full-path")
+    opf_dir = posixpath.dirname(opf_path)
+
+    package = ET.fromstring(epub_zip.read(opf_path))
+
+    title_element = package.find(f"{{{OPF_NS}}}metadata/{{{DC_NS}}}title")
+    title = title_element.text.strip() if title_element is not None and title_element.text else ""
+
+    manifest = {}
+    nav_href = None
+    ncx_id = None
+    for item in package.iterfind(f"{{{OPF_NS}}}manifest/{{{OPF_NS}}}item"):
+        href = unquote(item.get("href"))
+        properties = (item.get("properties") or "").split()
+        manifest[item.get("id")] = {
+            "href": href,
+            "media_type": item.get("media-type"),
+            "properties": properties,
+        }
+        if "nav" in properties:
+            nav_href = href
+
+    spine_element = package.find(f"{{{OPF_NS}}}spine")
+    if spine_element is not None:
+        ncx_id = spine_element.get("toc")
+    spine = [(itemref.get("idref"), itemref.get("linear", "yes"))
+             for itemref in package.iterfind(f"{{{OPF_NS}}}spine/{{{OPF_NS}}}itemref")]
+
+    return {
+        "opf_dir": opf_dir,
+        "title": title,
+        "manifest": manifest,
+        "spine": spine,
+        "nav_href": nav_href,
+        "ncx_id": ncx_id,
+    }
+
+
+def parse_nav_toc(epub_zip, package):
+    """
+    解析EPUB导航文档中的目录树
+
+    Args:
+        epub_zip (zipfile.ZipFile): 已打开的EPUB文件
+        package (dict): read_epub_package 的返回值
+
+    Returns:
+        list: 目录节点列表，每个节点为 {"label", "href", "children"}，
+            href为相对于OPF所在目录的路径
+    """
+    if not package["nav_href"]:
+        return []
+
+    nav_path = posixpath.join(package["opf_dir"], package["nav_href"])
+    nav_dir = posixpath.dirname(package["nav_href"])
+    document = ET.fromstring(epub_zip.read(nav_path))
+
+    toc_nav = None
+    for nav in document.iter(f"{{{XHTML_NS}}}nav"):
+        if nav.get(f"{{{OPS_NS}}}type") == "toc":
+            toc_nav = nav
+            break
+    if toc_nav is None:
+        return []
+
+    def parse_list(ol_element):
+        nodes = []
+        for li in ol_element.findall(f"{{{XHTML_NS}}}li"):
+            anchor = li.find(f"{{{XHTML_NS}}}a")
+            if anchor is None:
+                anchor = li.find(f"{{{XHTML_NS}}}span")
+            if anchor is None:
+                continue
+
+            href = anchor.get("href")
+            if href:
+                path, _, fragment = href.partition("#")
+                path = posixpath.normpath(posixpath.join(nav_dir, unquote(path)))
+                href = path + (f"#{fragment}" if fragment else "")
+
+            child_list = li.find(f"{{{XHTML_NS}}}ol")
+            nodes.append({
+                "label": "".join(anchor.itertext()).strip(),
+                "href": href,
+                "children": parse_list(child_list) if child_list is not None else [],
+            })
+        return nodes
+
+    top_list = toc_nav.find(f"{{{XHTML_NS}}}ol")
+    return parse_list(top_list) if top_list is not None else []
+
+
+def prefix_toc_hrefs(toc_nodes, prefix):
+    """
+    为目录树中的所有链接加上目录前缀
+
+    Args:
+        toc_nodes (list): 目录节点列表
+        prefix (str): 前缀，如 "b01/"
+
+    Returns:
+        list: 新的目录节点列表
+    """
+    return [{
+        "label": node["label"],
+        "href": prefix + node["href"] if node["href"] else None,
+        "children": prefix_toc_hrefs(node["children"], prefix),
+    } for node in toc_nodes]
+
+
+def build_nav_document(title, toc_nodes, language=MERGED_LANGUAGE):
+    """
+    生成EPUB3导航文档（nav.xhtml）
+
+    Args:
+        title (str): 书名
+        toc_nodes (list): 目录节点列表，href相对于导航文档
+        language (str): 语言代码
+
+    Returns:
+        str: 导航文档内容
+    """
+    def render_list(nodes, depth):
+        indent = "  " * depth
+        lines = [f"{indent}<ol>"]
+        for node in nodes:
+            label = escape(node["label"] or "")
+            if node["href"]:
+                entry = f'<a href={quoteattr(quote(node["href"], safe="/#%"))}>{label}</a>'
+            else:
+                entry = f"<span>{label}</span>"
+            if node["children"]:
+                lines.append(f"{indent}  <li>{entry}")
+                lines.extend(render_list(node["children"], depth + 2))
+                lines.append(f"{indent}  </li>")
+            else:
+                lines.append(f"{indent}  <li>{entry}</li>")
+        lines.append(f"{indent}</ol>")
+        return lines
+
+    toc_lines = render_list(toc_nodes, 3) if toc_nodes else []
+
+    return "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<html xmlns="{XHTML_NS}" xmlns:epub="{OPS_NS}" '
+        f'xml:lang={quoteattr(language)} lang={quoteattr(language)}>',
+        "  <head>",
+        f"    <title>{escape(title)}</title>",
+        "  </head>",
+        "  <body>",
+        '    <nav epub:type="toc" id="toc">',
+        f"      <h1>{escape(title)}</h1>",
+        *toc_lines,
+        "    </nav>",
+        "  </body>",
+        "</html>",
+        "",
+    ])
+
+
+def build_ncx_document(title, book_id, toc_nodes):
+    """
+    生成EPUB2兼容的NCX目录（toc.ncx）
+
+    Args:
+        title (str): 书名
+        book_id (str): 书籍唯一标识
+        toc_nodes (list): 目录节点列表，href相对于NCX文档
+
+    Returns:
+        str: NCX文档内容
+    """
+    play_order = 0
+    max_depth = 0
+
+    def render_points(nodes, depth):
+        nonlocal play_order, max_depth
+        if nodes:
+            max_depth = max(max_depth, depth)
+        lines = []
+        indent = "  " * (depth + 1)
+        for node in nodes:
+            if not node["href"]:
+                # NCX要求每个节点都有链接，没有链接时指向第一个子节点
+                if not node["children"]:
+                    continue
+                node = dict(node, href=node["children"][0]["href"])
+            play_order += 1
+            lines.append(f'{indent}<navPoint id="navPoint-{play_order}" playOrder="{play_order}">')
+            lines.append(f"{indent}  <navLabel><text>{escape(node['label'] or '')}</text></navLabel>")
+            lines.append(f'{indent}  <content src={quoteattr(quote(node["href"], safe="/#%"))}/>')
+            lines.extend(render_points(node["children"], depth + 1))
+            lines.append(f"{indent}</navPoint>")
+        return lines
+
+    nav_points = render_points(toc_nodes, 1)
+
+    return "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">',
+        "  <head>",
+        f"    <meta name=\"dtb:uid\" content={quoteattr(book_id)}/>",
+        f'    <meta name="dtb:depth" content="{max(max_depth, 1)}"/>',
+        '    <meta name="dtb:totalPageCount" content="0"/>',
+        '    <meta name="dtb:maxPageNumber" content="0"/>',
+        "  </head>",
+        f"  <docTitle><text>{escape(title)}</text></docTitle>",
+        "  <navMap>",
+        *nav_points,
+        "  </navMap>",
+        "</ncx>",
+        "",
+    ])
+
+
+def build_opf_document(title, book_id, manifest_items, spine_items,
+                       author=MERGED_AUTHOR, language=MERGED_LANGUAGE):
+    """
+    生成EPUB3包文档（content.opf）
+
+    Args:
+        title (str): 书名
+        book_id (str): 书籍唯一标识
+        manifest_items (list): (id, href, media_type, properties列表) 元组列表
+        spine_items (list): (idref, linear) 元组列表
+        author (str): 作者
+        language (str): 语言代码
+
+    Returns:
+        str: OPF文档内容
+    """
+    modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    manifest_lines = []
+    for item_id, href, media_type, properties in manifest_items:
+        properties_attr = f" properties={quoteattr(' '.join(properties))}" if properties else ""
+        manifest_lines.append(
+            f"    <item id={quoteattr(item_id)} href={quoteattr(quote(href, safe='/'))} "
+            f"media-type={quoteattr(media_type)}{properties_attr}/>")
+
+    spine_lines = []
+    for idref, linear in spine_items:
+        linear_attr = ' linear="no"' if linear == "no" else ""
+        spine_lines.append(f"    <itemref idref={quoteattr(idref)}{linear_attr}/>")
+
+    return "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<package xmlns="{OPF_NS}" version="3.0" unique-identifier="book-id" '
+        f'xml:lang={quoteattr(language)}>',
+        f'  <metadata xmlns:dc="{DC_NS}">',
+        f'    <dc:identifier id="book-id">{escape(book_id)}</dc:identifier>',
+        f"    <dc:title>{escape(title)}</dc:title>",
+        f"    <dc:creator>{escape(author)}</dc:creator>",
+        f"    <dc:language>{escape(language)}</dc:language>",
+        f"    <dc:date>{datetime.now().strftime('%Y-%m-%d')}</dc:date>",
+        f'    <meta property="dcterms:modified">{modified}</meta>',
+        "  </metadata>",
+        "  <manifest>",
+        *manifest_lines,
+        "  </manifest>",
+        '  <spine toc="ncx">',
+        *spine_lines,
+        "  </spine>",
+        "</package>",
+        "",
+    ])
+
+
+def write_epub_skeleton(output_zip):
+    """
+    写入EPUB必需的mimetype（必须是第一个且不压缩）和container.xml
+
+    Args:
+        output_zip (zipfile.ZipFile): 以写模式打开的输出文件
+    """
+    output_zip.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip",
+                        compress_type=zipfile.ZIP_STORED)
+    output_zip.writestr("META-INF/container.xml", "\n".join([
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<container version="1.0" xmlns="{CONTAINER_NS}">',
+        "  <rootfiles>",
+        '    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>',
+        "  </rootfiles>",
+        "</container>",
+        "",
+    ]), compress_type=zipfile.ZIP_DEFLATED)
+
+
+def copy_zip_entry(input_zip, info, output_zip, arcname, media_type):
+    """
+    把一个zip条目分块流式复制到输出文件（内存占用只有一个缓冲区）
+
+    已压缩的媒体类型和源文件中未压缩的条目以STORED方式写入，避免无意义的压缩。
+
+    Args:
+        input_zip (zipfile.ZipFile): 源EPUB
+        info (zipfile.ZipInfo): 源条目
+        output_zip (zipfile.ZipFile): 以写模式打开的输出文件
+        arcname (str): 输出中的条目路径
+        media_type (str): 条目的媒体类型
+    """
+    new_info = zipfile.ZipInfo(arcname, date_time=info.date_time)
+    new_info.external_attr = info.external_attr
+
+    stored = ((media_type and media_type.startswith(STORED_MEDIA_PREFIXES))
+              or info.compress_type == zipfile.ZIP_STORED)
+    new_info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+    with input_zip.open(info) as source, output_zip.open(new_info, "w") as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+
+def merge_epub_files_native(epub_files, output_path):
+    """
+    在zip层面直接合并EPUB文件
+
+    每本书的内容（XHTML、CSS、图片等）原样复制到输出文件的独立子目录
+    OEBPS/bNN/ 下，清单ID加上相同前缀以避免冲突；重新生成OPF的manifest和spine，
+    并把各书的目录合并为一个导航文档和NCX。
+
+    Args:
+        epub_files (list): 要合并的EPUB文件路径列表
+        output_path (Path): 输出文件路径
+
+    Returns:
+        bool: 是否成功合并
+    """
+    if not epub_files:
+        print("错误：没有找到要合并的EPUB文件")
+        return False
+
+    book_id = "urn:uuid:" + str(uuid.uuid5(
+        uuid.NAMESPACE_URL, "|".join(file_path.name for file_path in epub_files)))
+    manifest_items = [
+        ("nav", "nav.xhtml", "application/xhtml+xml", ["nav"]),
+        ("ncx", "toc.ncx", "application/x-dtbncx+xml", []),
+    ]
+    spine_items = [("nav", "yes")]
+    toc_nodes = []
+
+    tmp_path = output_path.with_suffix(".tmp")
+    try:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        print(f"\n正在合并 {len(epub_files)} 个EPUB文件（native引擎）...")
+        print(f"输出路径: {output_path.absolute()}")
+
+        with zipfile.ZipFile(tmp_path, "w") as output_zip:
+            write_epub_skeleton(output_zip)
+
+            for book_number, epub_path in enumerate(epub_files, 1):
+                prefix = f"b{book_number:02d}"
+                print(f"📖 [{book_number}/{len(epub_files)}] {epub_path.name}")
+
+                with zipfile.ZipFile(epub_path) as input_zip:
+                    package = read_epub_package(input_zip)
+                    skip_ids = {item_id for item_id, item in package["manifest"].items()
+                                if "nav" in item["properties"]}
+                    if package["ncx_id"]:
+                        skip_ids.add(package["ncx_id"])
+
+                    for item_id, item in package["manifest"].items():
+                        if item_id in skip_ids:
+                            continue
+                        source_name = posixpath.join(package["opf_dir"], item["href"])
+                        try:
+                            info = input_zip.getinfo(source_name)
+                        except KeyError:
+                            print(f"⚠️  {epub_path.name} 缺少条目: {source_name}")
+                            continue
+
+                        target_href = f"{prefix}/{item['href']}"
+                        copy_zip_entry(input_zip, info, output_zip,
+                                       f"OEBPS/{target_href}", item["media_type"])
+                        # 多本书的封面属性会冲突，只保留内容相关的属性
+                        properties = [prop for prop in item["properties"]
+                                      if prop != "cover-image"]
+                        manifest_items.append((f"{prefix}-{item_id}", target_href,
+                                               item["media_type"], properties))
+
+                    first_href = None
+                    for idref, linear in package["spine"]:
+                        if idref in skip_ids or idref not in package["manifest"]:
+                            continue
+                        spine_items.append((f"{prefix}-{idref}", linear))
+                        if first_href is None and linear != "no":
+                            first_href = f"{prefix}/{package['manifest'][idref]['href']}"
+
+                    book_toc = prefix_toc_hrefs(parse_nav_toc(input_zip, package), f"{prefix}/")
+                    toc_nodes.append({
+                        "label": package["title"] or epub_path.stem,
+                        "href": first_href,
+                        "children": book_toc,
+                    })
+
+            output_zip.writestr("OEBPS/nav.xhtml", build_nav_document(MERGED_TITLE, toc_nodes),
+                                compress_type=zipfile.ZIP_DEFLATED)
+            output_zip.writestr("OEBPS/toc.ncx", build_ncx_document(MERGED_TITLE, book_id, toc_nodes),
+                                compress_type=zipfile.ZIP_DEFLATED)
+            output_zip.writestr("OEBPS/content.opf",
+                                build_opf_document(MERGED_TITLE, book_id, manifest_items, spine_items),
+                                compress_type=zipfile.ZIP_DEFLATED)
+
+        tmp_path.replace(output_path)
+
+        print("✅ EPUB文件合并成功!")
+        file_size = output_path.stat().st_size
+        print(f"📏 合并后文件大小: {file_size / (1024 * 1024):.2f} MB")
+        return True
+
+    except (OSError, KeyError, ET.ParseError, zipfile.BadZipFile) as e:
+        print(f"❌ 合并EPUB时出错: {e}")
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return False
+
+
 def merge_epub_files(epub_files, output_path):
+    """
+    合并EPUB文件，根据 MERGE_ENGINE 选择合并引擎
+
+    Args:
+        epub_files (list): 要合并的EPUB文件路径列表
+        output_path (Path): 输出文件路径
+
+    Returns:
+        bool: 是否成功合并
+    """
+    if MERGE_ENGINE == "native":
+        return merge_epub_files_native(epub_files, output_path)
+    return merge_epub_files_pandoc(epub_files, output_path)
+
+
+def merge_epub_files_pandoc(epub_files, output_path):
     """
     使用Pandoc合并EPUB文件
 
@@ -95,7 +571,7 @@ def merge_epub_files(epub_files, output_path):
         file_paths = [str(file_path) for file_path in epub_files]
 
         pandoc_cmd = [
-            "pandoc",
+            PANDOC_BINARY,
             # 输入文件（EPUB格式）
             *file_paths,
             # 输出格式和文件
@@ -106,8 +582,8 @@ def merge_epub_files(epub_files, output_path):
             "--toc",
             "--toc-depth=3",
             # 标题和作者信息
-            "--metadata=title:Obsidian完整知识合集（合并版）",
-            "--metadata=author:知识整理者",
+            f"--metadata=title:{MERGED_TITLE}",
+            f"--metadata=author:{MERGED_AUTHOR}",
             f"--metadata=date:{datetime.now().strftime('%Y-%m-%d')}",
             # 中文支持
             "--variable=lang:zh-CN",
@@ -9,8 +9,55 @@ import sys
 import re
 import subprocess
 import json
+import hashlib
+import os
+import argparse
+import tempfile
+import zipfile
+import mimetypes
+import uuid
+import gzip
+import atexit
+import base64
+import queue
+import http.client
+import socket
+import shutil
+import fnmatch
+import time
+import threading
+import cProfile
+import pstats
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from array import array
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlsplit
+from xml.sax.saxutils import escape, quoteattr
+import xml.etree.ElementTree as ET
+
+try:
+    # 可选依赖：安装Pillow后对EPUB中的图片进行缩放和重新压缩
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+try:
+    # 可选依赖：Linux下使用inotify监听文件变化，未安装时回退为轮询
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+from merge_epub import (
+    build_nav_document,
+    build_ncx_document,
+    build_opf_document,
+    write_epub_skeleton,
+)
 
 # =============================================================================
 # 配置
@@ -19,47 +66,379 @@ from collections import defaultdict
 # Obsidian vault路径
 VAULT_PATH = Path("./Sth-Matters")
 
+# 扫描时忽略的目录和文件（fnmatch通配符，匹配名称或相对vault的路径，
+# 匹配的目录不会被进入）
+IGNORE_PATTERNS = [".obsidian", ".git", ".trash"]
+
 # 标签前缀
 TAG_PREFIX = "> Tag:"
 CATEGORY_PREFIX = "> Category:"
 
+# 元数据行扫描窗口：设置为N时只在笔记开头的N行内查找元数据行，更靠后的标签会被忽略
+# （大vault中可减少读取量）；None表示扫描全文。窗口记录在扫描缓存中，修改后会重新扫描
+METADATA_HEADER_LINES = None
+
+# 元数据提取的并行线程数（1表示串行，可通过 --jobs 覆盖）
+EXTRACT_JOBS = os.cpu_count() or 1
+# 并行提取时每个线程最多预先提交的文件数（限制遍历目录时驻留内存的路径和任务）
+EXTRACT_PENDING_PER_JOB = 4
+
+# 生成EPUB时同时运行的pandoc进程数（分章节构建的并行分组数以及合集的笔记渲染，可通过 --build-jobs 覆盖）
+EPUB_BUILD_JOBS = max(1, (os.cpu_count() or 1) // 2)
+
+# 构建清单：记录每个EPUB的指纹，未变化的分组跳过重建（可通过 --force 强制重建）
+BUILD_MANIFEST_FILENAME = "build_manifest.json"
+BUILD_MANIFEST_VERSION = 2
+
+# 失败隔离：分组EPUB生成失败时，用快速转换二分定位出错的笔记，记录到隔离清单后不含它们重新生成；
+# 隔离清单中的笔记在内容变化之前会被直接跳过（可通过 --no-isolate 关闭）。
+# 找不到Pandoc、无法连接pandoc server、转换超时或所有笔记都无法转换时视为环境问题，不隔离任何笔记
+FAILURE_ISOLATION = True
+FAILURE_ISOLATION_TIMEOUT = 60
+QUARANTINE_FILENAME = "quarantine.json"
+QUARANTINE_VERSION = 1
+
+# 单篇笔记渲染缓存：每篇笔记的Pandoc AST按内容哈希缓存，构建时只渲染有变化的笔记
+RENDER_CACHE_ENABLED = True
+RENDER_CACHE_DIRNAME = ".render_cache"
+# 渲染缓存的容量上限（字节），超出时按最近使用时间淘汰；None表示不限制
+RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Pandoc可执行文件（可替换为其他路径，例如基准测试中使用的离线替身）
+PANDOC_BINARY = "pandoc"
+
+# Pandoc读取markdown时使用的格式（跳过YAML frontmatter解析，避免格式错误）
+PANDOC_READER_FORMAT = "markdown-yaml_metadata_block"
+
+# Pandoc转换后端："subprocess" 每次转换启动一个Pandoc进程；"server" 把单篇笔记的转换发送给本机常驻的
+# `pandoc server`（复用HTTP连接，地址为本机且未运行时自动用 PANDOC_BINARY 启动）。
+# 生成EPUB文件的调用需要读取图片和metadata.xml，始终使用子进程
+PANDOC_BACKEND = "subprocess"
+PANDOC_SERVER_URL = "http://127.0.0.1:3030"
+# 连接池中保留的空闲连接数上限，以及单次转换的超时时间（秒）
+PANDOC_SERVER_POOL_SIZE = 8
+PANDOC_SERVER_TIMEOUT = 300
+
+# 由Pandoc生成的书在笔记前插入标签标题（层级数，与 --toc-depth 一致），更深的标签合并到最后一级标题；
+# 笔记自身的标题整体下移到这些层级之下，使目录与章节索引一致
+TAG_HEADING_LEVELS = 3
+
+# 完整合集EPUB的生成方式："native" 使用内置的流式EPUB写入器（只把单篇笔记的转换交给Pandoc），
+# "pandoc" 由一个Pandoc进程渲染整个合集
+COLLECTION_EPUB_WRITER = "native"
+
+# 静态HTML网站（导出方式 site）：每个标签一个页面，笔记页面在各标签间共享；
+# 只重写输入哈希发生变化的页面，记录保存在网站目录的 site_manifest.json 中
+SITE_DIRNAME = "site"
+SITE_MANIFEST_FILENAME = "site_manifest.json"
+# 页面模板的版本，修改模板后递增以重写全部页面
+SITE_MANIFEST_VERSION = 2
+
+# 配置文件（JSON）：存在时读取其中的路径、处理模式和导出方式，命令行参数优先
+CONFIG_FILENAME = "obsidian_export.json"
+
+# 监听模式（--watch）：连续保存时等待无新变化的时间（秒）和轮询间隔（秒）
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_POLL_INTERVAL = 2.0
+
+# 分卷：分章节生成时把超出预算的一级目录在二级/三级目录边界处拆分为多卷，
+# 并把相邻的小分组合并为一卷；各项为None表示不限制，全部为None时不分卷（输出文件名保持不变）
+VOLUME_MAX_BYTES = None
+VOLUME_MAX_NOTES = None
+VOLUME_MAX_RENDER_SECONDS = None
+# 估算渲染时间所用的参数：每篇笔记的固定开销（秒）和Pandoc的处理速度（字节/秒）
+RENDER_SECONDS_PER_NOTE = 0.02
+RENDER_BYTES_PER_SECOND = 1024 * 1024
+
+# 多标签笔记去重：开启后每篇笔记在每本书中只输出一次，其余标签章节只保留指向它的链接
+DEDUPE_NOTES = False
+# 去重时笔记的首选位置：依次匹配这些标签（包括其子标签），都不匹配时放在排序最靠前的章节
+PRIMARY_TAGS = []
+
+# 图片优化（需要Pillow）：缩放到最长边不超过max_size像素并重新压缩，结果按源图片哈希缓存；
+# 设置为None关闭优化
+IMAGE_PROFILE = {"max_size": 1600, "quality": 80}
+IMAGE_CACHE_DIRNAME = ".image_cache"
+# 图片优化方式变化时递增（如按EXIF方向旋转），使旧的优化结果和EPUB失效
+IMAGE_CACHE_VERSION = 2
+
 # 输出文件配置
 OUTPUT_FILENAME = "Obsidian_导出_合集.epub"
 OUTPUT_DIRECTORY = Path("./output")
 INDEX_FILENAME = "chapter_index.json"
 
+# 章节索引格式："full" 为完整的缩进JSON；"compact" 使用去重的文件表、整数文件引用和标签树，
+# 体积更小、加载更快（load_chapter_index 两种格式都能读取）。CHAPTER_INDEX_GZIP 为True时另外gzip压缩
+CHAPTER_INDEX_FORMAT = "full"
+CHAPTER_INDEX_GZIP = False
+COMPACT_INDEX_VERSION = 1
+
+# 构建报告：记录每个阶段和每次Pandoc调用的耗时、处理量和子进程峰值内存（与chapter_index_*.json保存在同一目录）
+BUILD_REPORT_FILENAME = "build_report.json"
+
+# 性能分析：对名称匹配这些通配符的阶段启用cProfile（如 "extract"、"build:*"），
+# 也可以通过环境变量 OBSIDIAN_EXPORT_PROFILE（逗号分隔）或 --profile 指定
+PROFILE_STAGES = []
+PROFILE_ENV_VAR = "OBSIDIAN_EXPORT_PROFILE"
+
+# 扫描缓存配置（与chapter_index_*.json保存在同一目录）
+SCAN_CACHE_FILENAME = "scan_cache.json"
+SCAN_CACHE_VERSION = 2
+# mtime/size变化时是否再比对内容哈希（避免仅修改时间变化导致重新提取）
+SCAN_CACHE_USE_HASH = False
+
+# 元数据类型与前缀的对应关系
+METADATA_PREFIXES = {
+    "tag": TAG_PREFIX,
+    "category": CATEGORY_PREFIX,
+}
+
+# frontmatter中的别名作为一种特殊的元数据类型提取，用于解析 [[别名]] 链接
+ALIAS_METADATA_TYPE = "alias"
+FRONTMATTER_ALIAS_KEYS = ("aliases", "alias")
+
+# 内置EPUB写入器使用的样式表
+EPUB_STYLESHEET = """body { margin: 0 5%; line-height: 1.6; }
+h1, h2, h3, h4 { line-height: 1.3; }
+img { max-width: 100%; }
+blockquote { margin-left: 1em; padding-left: 1em; border-left: 3px solid #ccc; }
+pre { white-space: pre-wrap; }
+"""
+
+# 静态网站使用的样式表
+SITE_STYLESHEET = EPUB_STYLESHEET + """body { max-width: 48em; margin: 0 auto; padding: 1em; }
+nav.breadcrumb { font-size: 0.9em; color: #666; }
+ul.tags { list-style: none; padding: 0; }
+ul.tags li { display: inline; margin-right: 0.8em; }
+.count { color: #888; }
+"""
+
+# 导出方式名称与交互菜单选项的对应关系
+BUILD_CHOICES = {
+    "chapters": "1",
+    "single": "2",
+    "merged": "3",
+    "none": "4",
+    "site": "5",
+}
+
+# 配置文件中允许的键
+CONFIG_KEYS = {"vault", "output", "modes", "builds", "jobs", "build_jobs", "force", "ignore",
+               "watch", "profile", "index_format", "index_gzip", "dedupe", "primary_tags", "volume_max_bytes", "volume_max_notes",
+               "volume_max_render_seconds", "pandoc_backend", "pandoc_server",
+               "isolate_failures"}
+
+# 预编译的正则表达式
+ITEM_PATTERN = re.compile(r'#[^\s#]+(?:/[^\s#]+)*')
+LEVEL_PATTERN = re.compile(r'^(\d*)([A-Za-z]*)(.*)$')
+IMG_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]+)(")')
+WIKI_EMBED_PATTERN = re.compile(r'!\[\[([^\]|#]+)(?:#[^\]|]*)?(?:\|([^\]]*))?\]\]')
+MD_IMAGE_PATTERN = re.compile(r'!\[([^\]]*)\]\((<[^>]+>|[^)\s]+)((?:\s+"[^"]*")?)\)')
+URL_SCHEME_PATTERN = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*:')
+EMBED_SIZE_PATTERN = re.compile(r'^\s*(\d+)(?:x(\d+))?\s*$')
+WIKILINK_PATTERN = re.compile(r'(?<!!)\[\[([^\]|#]*)(?:#([^\]|]*))?(?:\|([^\]]*))?\]\]')
+NOTE_HREF_PATTERN = re.compile(r'href="#(note-[0-9a-f]+)(-h-[0-9a-f]+)?"')
+ATX_HEADING_PATTERN = re.compile(r'^( {0,3})(#{1,6})(?=[ \t\r\n]|$)')
+SETEXT_UNDERLINE_PATTERN = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+CODE_FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+CODE_SPAN_PATTERN = re.compile(r'(`+)(?!`)(?:(?!\n[ \t]*\n).)*?(?<!`)\1(?!`)', re.S)
+ATX_CLOSING_PATTERN = re.compile(r'(?:^|[ \t]+)#+[ \t]*$')
+HEADING_ATTRIBUTES_PATTERN = re.compile(r'\{[^{}]*\}[ \t]*$')
+PARAGRAPH_START_PATTERN = re.compile(r'^ {0,3}(?:[-*+>|]|\d+[.)])(?:\s|$)')
+MARKDOWN_ESCAPE_PATTERN = re.compile(r'([\\`*_{}\[\]<>#|~^$@!])')
+XML_NAME_PATTERN = re.compile(r'^[A-Za-z_][\w.-]*(?::[A-Za-z_][\w.-]*)?$')
+
+# HTML中没有结束标签的元素（XHTML中需要自闭合）
+HTML_VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                      "param", "source", "track", "wbr"}
+
+# 可以作为图片嵌入的附件类型，以及可以被优化的类型
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".svg", ".bmp"}
+OPTIMIZABLE_IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+# =============================================================================
+# 运行时索引（每次扫描vault时重建）
+# =============================================================================
+
+# 附件索引：文件名 -> 路径，用于解析 ![[image.png]] 这类只写文件名的嵌入
+ATTACHMENT_INDEX = {}
+
+# 笔记索引：小写的文件名、路径后缀（均不含.md）和别名 -> 笔记路径，用于解析 [[笔记]] 链接
+NOTE_INDEX = {}
+
+# 本次运行的构建报告（各阶段和各次Pandoc调用的记录）
+BUILD_REPORT = {"stages": [], "pandoc_runs": [], "quarantined": []}
+BUILD_REPORT_LOCK = threading.Lock()
+
+# 并行构建的分组共用隔离清单文件
+QUARANTINE_LOCK = threading.Lock()
+
+# 图片优化记录：源图片 (路径, mtime, 大小) -> 缓存中的优化结果文件名，持久化在图片缓存目录中
+IMAGE_CACHE_RECORDS = {}
+IMAGE_CACHE_LOCK = threading.Lock()
+
+# pandoc server的空闲连接池，以及由本脚本启动的服务器进程
+PANDOC_SERVER_POOL = queue.LifoQueue()
+PANDOC_SERVER_PROCESS = None
+
 # =============================================================================
 # 核心函数
 # =============================================================================
 
 
-def find_all_md_files(vault_path):
+def is_ignored(name, relative_path, ignore_patterns):
     """
-    递归查找vault中的所有.md文件
+    判断目录或文件是否被忽略
 
     Args:
-        vault_path (Path): Obsidian vault的路径
+        name (str): 目录或文件名
+        relative_path (str): 相对vault的路径（使用/分隔）
+        ignore_patterns (list): fnmatch通配符列表
 
     Returns:
-        list: 所有.md文件的路径列表
+        bool: 是否忽略
+    """
+    return any(fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(relative_path, pattern)
+               for pattern in ignore_patterns)
+
+
+def iter_md_files(vault_path, ignore_patterns=None, attachment_index=None):
+    """
+    使用os.scandir遍历vault，逐个产出.md文件路径
+
+    被忽略的目录在进入之前即被剪除；产出顺序为遍历顺序，不做排序，
+    调用方可以在遍历过程中就开始处理文件。
+
+    Args:
+        vault_path (Path): Obsidian vault的路径
+        ignore_patterns (list): 忽略的通配符列表，默认使用 IGNORE_PATTERNS
+        attachment_index (dict): 提供时在同一次遍历中记录非markdown附件
+            （文件名 -> 路径，同名文件取路径最小者）
+
+    Yields:
+        Path: .md文件路径
     """
     if not vault_path.exists():
         print(f"错误：路径 {vault_path} 不存在")
-        return []
+        return
 
     if not vault_path.is_dir():
         print(f"错误：路径 {vault_path} 不是目录")
-        return []
+        return
+
+    if ignore_patterns is None:
+        ignore_patterns = IGNORE_PATTERNS
+
+    pending_dirs = [(str(vault_path), "")]
+    while pending_dirs:
+        dir_path, relative_dir = pending_dirs.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    relative_path = f"{relative_dir}{entry.name}"
+                    if is_ignored(entry.name, relative_path, ignore_patterns):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append((entry.path, f"{relative_path}/"))
+                        elif entry.name.endswith(".md") and entry.is_file():
+                            yield Path(entry.path)
+                        elif attachment_index is not None and entry.is_file():
+                            known_path = attachment_index.get(entry.name)
+                            if known_path is None or entry.path < str(known_path):
+                                attachment_index[entry.name] = Path(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"⚠️  无法读取目录 {dir_path}: {e}")
+
+
+def find_all_md_files(vault_path, ignore_patterns=None):
+    """
+    递归查找vault中的所有.md文件
+
+    Args:
+        vault_path (Path): Obsidian vault的路径
+        ignore_patterns (list): 忽略的通配符列表，默认使用 IGNORE_PATTERNS
+
+    Returns:
+        list: 所有.md文件的路径列表（已排序）
+    """
+    return sorted(iter_md_files(vault_path, ignore_patterns))
+
 
-    md_files = []
+def scan_metadata_header(file_path, metadata_types=("tag",)):
+    """
+    流式扫描笔记开头的元数据行，找到所需的全部元数据行或超出扫描窗口后立即停止
 
-    # 使用递归glob模式查找所有.md文件
-    for md_file in vault_path.rglob("*.md"):
-        # 跳过.obsidian目录中的文件
-        if ".obsidian" not in str(md_file):
-            md_files.append(md_file)
+    Args:
+        file_path (Path): markdown文件路径
+        metadata_types (tuple): 需要提取的元数据类型，如 ("tag", "category")；
+            包含 ALIAS_METADATA_TYPE 时同时读取开头frontmatter中的别名
 
-    return sorted(md_files)
+    Returns:
+        tuple: (以类型为键的元数据列表字典, 已读取的字节数)
+    """
+    prefixes = {}
+    for metadata_type in metadata_types:
+        if metadata_type == ALIAS_METADATA_TYPE:
+            continue
+        prefix = METADATA_PREFIXES.get(metadata_type.lower())
+        if prefix is None:
+            raise ValueError(f"不支持的元数据类型: {metadata_type}")
+        prefixes[metadata_type] = prefix
+
+    found = {metadata_type: [] for metadata_type in metadata_types}
+    pending = dict(prefixes)
+    want_aliases = ALIAS_METADATA_TYPE in found
+    in_frontmatter = False
+    in_alias_list = False
+    bytes_read = 0
+
+    with open(file_path, 'rb') as f:
+        for line_no, raw_line in enumerate(f, 1):
+            bytes_read += len(raw_line)
+            # 首行可能带有BOM
+            line = raw_line.decode(
+                'utf-8-sig' if line_no == 1 else 'utf-8').strip()
+
+            frontmatter_line = False
+            if want_aliases:
+                if line_no == 1 and line == "---":
+                    in_frontmatter = True
+                    frontmatter_line = True
+                elif in_frontmatter:
+                    frontmatter_line = True
+                    if line in ("---", "..."):
+                        in_frontmatter = False
+                    elif not raw_line[:1].isspace() and not line.startswith("-"):
+                        # 顶层键：aliases: [a, b] / aliases: a / aliases:（后跟列表）
+                        key, _, value = line.partition(":")
+                        in_alias_list = key.strip().lower() in FRONTMATTER_ALIAS_KEYS
+                        if in_alias_list and value.strip():
+                            found[ALIAS_METADATA_TYPE] = [
+                                alias.strip().strip("\"'")
+                                for alias in value.strip().strip("[]").split(",")
+                                if alias.strip().strip("\"'")]
+                            in_alias_list = False
+                    elif in_alias_list and line.startswith("- "):
+                        alias = line[2:].strip().strip("\"'")
+                        if alias:
+                            found[ALIAS_METADATA_TYPE].append(alias)
+
+            for metadata_type, prefix in list(pending.items()):
+                if not frontmatter_line and line.startswith(prefix):
+                    # 提取内容（去掉前缀）并匹配所有以#开头的项目
+                    content_text = line[len(prefix):].strip()
+                    found[metadata_type] = ITEM_PATTERN.findall(content_text)
+                    del pending[metadata_type]
+
+            if not pending and not in_frontmatter:
+                break
+            if METADATA_HEADER_LINES is not None and line_no >= METADATA_HEADER_LINES:
+                break
+
+    return found, bytes_read
 
 
 def extract_metadata_from_file(file_path, metadata_type="tag"):
@@ -68,43 +447,125 @@ def extract_metadata_from_file(file_path, metadata_type="tag"):
 
     Args:
         file_path (Path): markdown文件路径
-        metadata_type (str): "tag" 或 "category"
+        metadata_type (str | tuple): "tag"、"category"，或多个类型组成的元组
+            （如 ("tag", "category")，在同一次读取中全部提取）
 
     Returns:
-        list: 提取到的元数据列表
+        list | dict: 单个类型时返回元数据列表；多个类型时返回以类型为键的字典
     """
+    multiple = isinstance(metadata_type, (tuple, list))
+    metadata_types = tuple(metadata_type) if multiple else (metadata_type,)
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        found, _ = scan_metadata_header(file_path, metadata_types)
+        return found if multiple else found[metadata_type]
 
-        # 根据类型选择前缀
-        if metadata_type.lower() == "tag":
-            prefix = TAG_PREFIX
-            field_name = "标签"
-        elif metadata_type.lower() == "category":
-            prefix = CATEGORY_PREFIX
-            field_name = "分类"
-        else:
-            raise ValueError(f"不支持的元数据类型: {metadata_type}")
+    except Exception as e:
+        print(f"读取文件 {file_path} 时出错: {e}")
+        return {t: [] for t in metadata_types} if multiple else []
 
-        # 查找元数据行
-        for line in content.split('\n'):
-            line = line.strip()
-            if line.startswith(prefix):
-                # 提取内容（去掉前缀）
-                content_text = line[len(prefix):].strip()
 
-                # 使用正则表达式提取所有以#开头的项目
-                items = re.findall(r'#[^\s#]+(?:/[^\s#]+)*', content_text)
+def compute_file_hash(file_path):
+    """
+    计算文件内容的SHA-1哈希（分块读取，避免一次性载入大文件）
 
-                return items
+    Args:
+        file_path (Path): 文件路径
 
-        # 如果没有找到对应行，返回空列表
-        return []
+    Returns:
+        str: 十六进制哈希字符串
+    """
+    hasher = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
-    except Exception as e:
-        print(f"读取文件 {file_path} 时出错: {e}")
-        return []
+
+def load_scan_cache(output_dir):
+    """
+    加载扫描缓存清单
+
+    Args:
+        output_dir (Path): 输出目录
+
+    Returns:
+        dict: 以文件路径为键的缓存条目字典，缓存不存在或无效时返回空字典
+    """
+    cache_path = output_dir / SCAN_CACHE_FILENAME
+    if not cache_path.exists():
+        return {}
+
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  扫描缓存 {cache_path} 无法读取，将重新扫描: {e}")
+        return {}
+
+    # 扫描窗口不同时，缓存的元数据可能缺少窗口外的标签
+    if (data.get("version") != SCAN_CACHE_VERSION
+            or data.get("header_lines") != METADATA_HEADER_LINES):
+        return {}
+
+    return data.get("files", {})
+
+
+def save_scan_cache(scan_cache, output_dir):
+    """
+    保存扫描缓存清单（先写临时文件再替换，避免中断时损坏缓存）
+
+    Args:
+        scan_cache (dict): 缓存条目字典
+        output_dir (Path): 输出目录
+
+    Returns:
+        Path: 缓存文件路径
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache_path = output_dir / SCAN_CACHE_FILENAME
+    tmp_path = cache_path.with_suffix(".tmp")
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": SCAN_CACHE_VERSION, "header_lines": METADATA_HEADER_LINES,
+                   "files": scan_cache}, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+    return cache_path
+
+
+def lookup_scan_cache(scan_cache, file_path, stat_result, metadata_types):
+    """
+    在扫描缓存中查找文件的元数据
+
+    Args:
+        scan_cache (dict): 缓存条目字典
+        file_path (Path): markdown文件路径
+        stat_result (os.stat_result): 文件的stat结果
+        metadata_types (tuple): 需要的元数据类型
+
+    Returns:
+        tuple: (缓存条目或None, 以类型为键的元数据字典或None)；
+            缺少任一类型时元数据为None，表示未命中
+    """
+    entry = scan_cache.get(str(file_path))
+    if entry is None or entry.get("size") != stat_result.st_size:
+        return None, None
+
+    if entry.get("mtime") != stat_result.st_mtime_ns:
+        # mtime变化但大小相同：启用哈希时比对内容，内容未变则视为命中
+        if not (SCAN_CACHE_USE_HASH and entry.get("hash")):
+            return None, None
+        if compute_file_hash(file_path) != entry["hash"]:
+            return None, None
+        entry = dict(entry, mtime=stat_result.st_mtime_ns)
+
+    cached_items = entry.get("items", {})
+    if not all(metadata_type in cached_items for metadata_type in metadata_types):
+        return entry, None
+
+    return entry, {metadata_type: cached_items[metadata_type]
+                   for metadata_type in metadata_types}
 
 
 def parse_hierarchy(item):
@@ -128,9 +589,8 @@ def parse_hierarchy(item):
     sort_key = []
     for level in levels:
         # 提取数字部分和文字部分分别处理
-        import re
         # 匹配开头的数字、字母、中文等
-        match = re.match(r'^(\d*)([A-Za-z]*)(.*)$', level)
+        match = LEVEL_PATTERN.match(level)
         if match:
             num_part, alpha_part, text_part = match.groups()
             # 构建排序键：(数字部分, 字母部分, 文字部分)
@@ -145,93 +605,328 @@ def parse_hierarchy(item):
     return item, levels, tuple(sort_key)
 
 
-def collect_all_metadata(files_with_metadata):
+def new_note_table(metadata_types):
+    """
+    创建紧凑的笔记表
+
+    笔记表是扫描vault到生成章节结构之间使用的内存模型：笔记路径以字符串保存一次，
+    之后各阶段都用整数ID（在 "paths" 中的下标）引用笔记；元数据项目字符串驻留在
+    "items" 中，以整数ID引用。每种元数据的 笔记 -> 项目 关系以CSR形式保存在两个整数数组中：
+    笔记i的项目ID为 refs[offsets[i]:offsets[i + 1]]。
+
+    Args:
+        metadata_types (tuple): 保存的元数据类型，如 ("tag", "category", "alias")
+
+    Returns:
+        dict: {"metadata_types", "paths", "items", "item_ids", "offsets", "refs"}
+    """
+    metadata_types = tuple(metadata_types)
+    return {
+        "metadata_types": metadata_types,
+        "paths": [],
+        "items": [],
+        "item_ids": {},
+        "offsets": {metadata_type: array('I', [0]) for metadata_type in metadata_types},
+        "refs": {metadata_type: array('I') for metadata_type in metadata_types},
+    }
+
+
+def add_note(note_table, file_path, metadata):
+    """
+    向笔记表追加一篇笔记（同一笔记中重复的项目只保存一次）
+
+    Args:
+        note_table (dict): 笔记表
+        file_path (Path | str): 笔记路径
+        metadata (dict): 以类型为键的元数据列表
+
+    Returns:
+        int: 笔记ID
+    """
+    note_id = len(note_table["paths"])
+    note_table["paths"].append(str(file_path))
+
+    item_ids = note_table["item_ids"]
+    items = note_table["items"]
+    for metadata_type in note_table["metadata_types"]:
+        refs = note_table["refs"][metadata_type]
+        for item in dict.fromkeys(metadata[metadata_type]):
+            item_id = item_ids.get(item)
+            if item_id is None:
+                item_id = item_ids[item] = len(items)
+                items.append(sys.intern(item))
+            refs.append(item_id)
+        note_table["offsets"][metadata_type].append(len(refs))
+
+    return note_id
+
+
+def note_items(note_table, metadata_type, note_id):
+    """
+    获取一篇笔记的元数据项目
+
+    Args:
+        note_table (dict): 笔记表
+        metadata_type (str): 元数据类型
+        note_id (int): 笔记ID
+
+    Returns:
+        list: 项目字符串列表
+    """
+    offsets = note_table["offsets"][metadata_type]
+    refs = note_table["refs"][metadata_type]
+    items = note_table["items"]
+    return [items[item_id] for item_id in refs[offsets[note_id]:offsets[note_id + 1]]]
+
+
+def iter_note_entries(note_table, metadata_type):
+    """
+    按笔记ID顺序产出 (笔记路径, 元数据列表)，供需要旧式列表的调用方使用
+
+    Args:
+        note_table (dict): 笔记表
+        metadata_type (str): 元数据类型
+
+    Yields:
+        tuple: (Path, 项目字符串列表)
+    """
+    for note_id, file_path in enumerate(note_table["paths"]):
+        yield Path(file_path), note_items(note_table, metadata_type, note_id)
+
+
+def build_item_file_index(note_table, metadata_type):
     """
-    收集所有元数据并进行层级解析和排序
+    构建 项目ID -> 笔记ID数组 的倒排索引
 
     Args:
-        files_with_metadata (list): 包含(文件路径, 元数据列表)的元组列表
+        note_table (dict): 笔记表
+        metadata_type (str): 元数据类型
 
     Returns:
-        tuple: (排序后的元数据列表, 元数据层级字典, 文件元数据映射)
+        dict: 以项目ID为键、笔记ID数组为值的字典；数组内的笔记按路径排序
+            （与扫描顺序无关）
+    """
+    paths = note_table["paths"]
+    offsets = note_table["offsets"][metadata_type]
+    refs = note_table["refs"][metadata_type]
+
+    # 按路径各部分排序，与Path对象的排序一致
+    tagged_notes = [note_id for note_id in range(len(paths))
+                    if offsets[note_id + 1] > offsets[note_id]]
+    tagged_notes.sort(key=lambda note_id: paths[note_id].split(os.sep))
+
+    item_file_index = {}
+    for note_id in tagged_notes:
+        for item_id in refs[offsets[note_id]:offsets[note_id + 1]]:
+            note_ids = item_file_index.get(item_id)
+            if note_ids is None:
+                note_ids = item_file_index[item_id] = array('I')
+            note_ids.append(note_id)
+    return item_file_index
+
+
+def collect_all_metadata(note_table, metadata_type):
     """
-    all_items = set()
-    item_hierarchy = {}
-    file_item_mapping = {}
+    收集一种元数据的所有项目，进行层级解析和排序
+
+    Args:
+        note_table (dict): 笔记表（见 new_note_table）
+        metadata_type (str): "tag" 或 "category"
 
-    # 收集所有元数据项目
-    for file_path, items in files_with_metadata:
-        if items:
-            file_item_mapping[file_path] = items
-            for item in items:
-                all_items.add(item)
+    Returns:
+        dict: 标签索引 {"sorted_items": 排序后的项目ID数组, "levels": 项目ID -> 层级列表,
+            "item_files": 项目ID -> 笔记ID数组, "tagged_notes": 有该元数据的笔记数}
+    """
+    item_file_index = build_item_file_index(note_table, metadata_type)
+    offsets = note_table["offsets"][metadata_type]
+    tagged_notes = sum(1 for note_id in range(len(note_table["paths"]))
+                       if offsets[note_id + 1] > offsets[note_id])
 
-    print(f"总共发现 {len(all_items)} 个不同的项目")
+    print(f"总共发现 {len(item_file_index)} 个不同的项目")
 
     # 解析层级
-    item_info = []
-    for item in all_items:
-        full_item, levels, sort_key = parse_hierarchy(item)
-        item_info.append((full_item, levels, sort_key))
-        item_hierarchy[full_item] = levels
+    item_levels = {}
+    sort_keys = {}
+    for item_id in item_file_index:
+        _, levels, sort_key = parse_hierarchy(note_table["items"][item_id])
+        item_levels[item_id] = levels
+        sort_keys[item_id] = sort_key
 
     # 按排序键排序
-    item_info.sort(key=lambda x: x[2])
-    sorted_items = [info[0] for info in item_info]
+    sorted_items = array('I', sorted(item_file_index, key=sort_keys.__getitem__))
 
-    return sorted_items, item_hierarchy, file_item_mapping
+    return {
+        "sorted_items": sorted_items,
+        "levels": item_levels,
+        "item_files": item_file_index,
+        "tagged_notes": tagged_notes,
+    }
 
 
-def generate_chapter_structure(sorted_items, item_hierarchy, file_item_mapping, metadata_type):
+def generate_chapter_structure(note_table, tag_index, metadata_type):
     """
     生成章节结构
 
     Args:
-        sorted_items (list): 排序后的元数据列表
-        item_hierarchy (dict): 元数据层级字典
-        file_item_mapping (dict): 文件元数据映射
+        note_table (dict): 笔记表
+        tag_index (dict): collect_all_metadata 返回的标签索引
         metadata_type (str): "tag" 或 "category"
 
     Returns:
-        dict: 章节结构字典
+        dict: 章节结构字典（文件路径字符串与笔记表共享，不重复创建）
     """
+    paths = note_table["paths"]
+    items = note_table["items"]
+
     chapter_structure = {
         "metadata": {
             "generated_at": datetime.now().isoformat(),
             "metadata_type": metadata_type,
-            "total_items": len(sorted_items),
-            "total_files": len(file_item_mapping)
+            "total_items": len(tag_index["sorted_items"]),
+            "total_files": tag_index["tagged_notes"]
         },
         "chapters": []
     }
 
-    # 按元数据组织文件
-    for item in sorted_items:
-        levels = item_hierarchy[item]
+    # 按元数据组织文件（直接查倒排索引，无需遍历所有文件）
+    for item_id in tag_index["sorted_items"]:
+        levels = tag_index["levels"][item_id]
+
+        # 使用此元数据的文件
+        files_with_item = [paths[note_id] for note_id in tag_index["item_files"][item_id]]
+
+        chapter_info = {
+            "item": items[item_id],
+            "levels": levels,
+            "level_1": levels[0] if len(levels) > 0 else "",
+            "level_2": levels[1] if len(levels) > 1 else "",
+            "level_3": levels[2] if len(levels) > 2 else "",
+            "level_4": levels[3] if len(levels) > 3 else "",
+            "files": files_with_item,
+            "file_count": len(files_with_item)
+        }
+        chapter_structure["chapters"].append(chapter_info)
+
+    return chapter_structure
+
+
+def chapter_index_path(output_dir, metadata_type, compress=False):
+    """
+    获取章节索引文件路径
+
+    Args:
+        output_dir (Path): 输出目录
+        metadata_type (str): "tag" 或 "category"
+        compress (bool): 是否为gzip压缩的索引
+
+    Returns:
+        Path: 索引文件路径
+    """
+    index_filename = f"chapter_index_{metadata_type}.json"
+    return output_dir / (f"{index_filename}.gz" if compress else index_filename)
+
+
+def build_compact_tag_tree(chapters):
+    """
+    把章节列表转换为紧凑索引的文件表和标签树
+
+    Args:
+        chapters (list): 章节列表
+
+    Returns:
+        tuple: (文件路径列表, 标签树根节点列表)；节点为
+            {"name", "children"}，对应章节的节点另有 "item"、"seq"（章节顺序）和 "files"（文件序号）
+    """
+    file_ids = {}
+    roots = []
+    nodes = {}
+
+    for seq, chapter in enumerate(chapters):
+        siblings = roots
+        node = None
+        for depth in range(1, len(chapter["levels"]) + 1):
+            key = tuple(chapter["levels"][:depth])
+            node = nodes.get(key)
+            if node is None:
+                node = {"name": chapter["levels"][depth - 1], "children": []}
+                nodes[key] = node
+                siblings.append(node)
+            siblings = node["children"]
+
+        node["item"] = chapter["item"]
+        node["seq"] = seq
+        node["files"] = [file_ids.setdefault(file_path, len(file_ids))
+                         for file_path in chapter["files"]]
+
+    return list(file_ids), roots
+
+
+def write_compact_chapter_index(chapter_structure, output_file):
+    """
+    以紧凑格式流式写入章节索引
+
+    Args:
+        chapter_structure (dict): 章节结构
+        output_file (file): 以文本模式打开的输出文件
+    """
+    files, tree = build_compact_tag_tree(chapter_structure["chapters"])
+
+    output_file.write(f'{{"format":"compact","version":{COMPACT_INDEX_VERSION},"metadata":')
+    json.dump(chapter_structure["metadata"], output_file, ensure_ascii=False)
+
+    # 文件表逐项写入
+    output_file.write(',"files":[')
+    for file_id, file_path in enumerate(files):
+        if file_id:
+            output_file.write(',')
+        output_file.write(json.dumps(file_path, ensure_ascii=False))
+
+    # 标签树逐个一级目录写入
+    output_file.write('],"tree":[')
+    for node_id, node in enumerate(tree):
+        if node_id:
+            output_file.write(',\n')
+        json.dump(node, output_file, ensure_ascii=False, separators=(',', ':'))
+    output_file.write(']}\n')
+
 
-        # 查找使用此元数据的文件
-        files_with_item = []
-        for file_path, file_items in file_item_mapping.items():
-            if item in file_items:
-                files_with_item.append(str(file_path))
+def expand_compact_chapter_index(index_data):
+    """
+    把紧凑格式的索引还原为完整的章节结构
+
+    Args:
+        index_data (dict): 紧凑格式的索引
 
-        if files_with_item:  # 只包含有文件的项目
-            chapter_info = {
-                "item": item,
+    Returns:
+        dict: 与 generate_chapter_structure 返回值相同结构的章节结构
+    """
+    files = index_data["files"]
+    chapters = []
+    pending = [(node, [node["name"]]) for node in reversed(index_data["tree"])]
+
+    while pending:
+        node, levels = pending.pop()
+        if "item" in node:
+            chapter_files = [files[file_id] for file_id in node["files"]]
+            chapters.append((node["seq"], {
+                "item": node["item"],
                 "levels": levels,
                 "level_1": levels[0] if len(levels) > 0 else "",
                 "level_2": levels[1] if len(levels) > 1 else "",
                 "level_3": levels[2] if len(levels) > 2 else "",
                 "level_4": levels[3] if len(levels) > 3 else "",
-                "files": files_with_item,
-                "file_count": len(files_with_item)
-            }
-            chapter_structure["chapters"].append(chapter_info)
+                "files": chapter_files,
+                "file_count": len(chapter_files),
+            }))
+        for child in reversed(node["children"]):
+            pending.append((child, levels + [child["name"]]))
 
-    return chapter_structure
+    chapters.sort(key=lambda entry: entry[0])
+    return {"metadata": index_data["metadata"], "chapters": [chapter for _, chapter in chapters]}
 
 
-def save_chapter_index(chapter_structure, output_dir, metadata_type):
+def save_chapter_index(chapter_structure, output_dir, metadata_type, index_format=None,
+                       compress=None):
     """
     保存章节索引到JSON文件
 
@@ -239,89 +934,297 @@ def save_chapter_index(chapter_structure, output_dir, metadata_type):
         chapter_structure (dict): 章节结构
         output_dir (Path): 输出目录
         metadata_type (str): "tag" 或 "category"
+        index_format (str): "full" 或 "compact"，默认使用 CHAPTER_INDEX_FORMAT
+        compress (bool): 是否gzip压缩，默认使用 CHAPTER_INDEX_GZIP
 
     Returns:
         Path: 索引文件路径
     """
+    index_format = index_format or CHAPTER_INDEX_FORMAT
+    compress = CHAPTER_INDEX_GZIP if compress is None else compress
+
     output_dir.mkdir(parents=True, exist_ok=True)
-    index_filename = f"chapter_index_{metadata_type}.json"
-    index_path = output_dir / index_filename
+    index_path = chapter_index_path(output_dir, metadata_type, compress)
+
+    # 先写临时文件再替换，下游工具不会读到写了一半的索引
+    tmp_path = index_path.with_name(f"{index_path.name}.tmp")
+    opener = gzip.open if compress else open
+    with opener(tmp_path, 'wt', encoding='utf-8') as f:
+        if index_format == "compact":
+            write_compact_chapter_index(chapter_structure, f)
+        else:
+            json.dump(chapter_structure, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, index_path)
 
-    with open(index_path, 'w', encoding='utf-8') as f:
-        json.dump(chapter_structure, f, ensure_ascii=False, indent=2)
+    # 删除另一种压缩方式的旧索引，避免读取到过期的内容
+    stale_path = chapter_index_path(output_dir, metadata_type, not compress)
+    if stale_path.exists():
+        stale_path.unlink()
 
     print(f"✅ 章节索引已保存到: {index_path}")
     return index_path
 
 
-def print_chapter_summary(chapter_structure, metadata_type):
+def read_chapter_index(index_path):
+    """
+    读取章节索引文件（完整或紧凑格式、可gzip压缩），返回完整的章节结构
+
+    Args:
+        index_path (Path): 索引文件路径
+
+    Returns:
+        dict: 章节结构
+    """
+    opener = gzip.open if index_path.suffix == ".gz" else open
+    with opener(index_path, 'rt', encoding='utf-8') as f:
+        index_data = json.load(f)
+
+    if index_data.get("format") == "compact":
+        return expand_compact_chapter_index(index_data)
+    return index_data
+
+
+def load_chapter_index(output_dir, metadata_type):
+    """
+    读取已保存的章节索引
+
+    Args:
+        output_dir (Path): 输出目录
+        metadata_type (str): "tag" 或 "category"
+
+    Returns:
+        dict: 章节结构，索引不存在或无法读取时返回None
+    """
+    for compress in (False, True):
+        index_path = chapter_index_path(output_dir, metadata_type, compress)
+        if index_path.exists():
+            break
+    else:
+        return None
+
+    try:
+        return read_chapter_index(index_path)
+    except (OSError, ValueError, KeyError, EOFError) as e:
+        print(f"⚠️  章节索引 {index_path} 无法读取: {e}")
+        return None
+
+
+def find_affected_groups(chapter_structure, changed_paths):
+    """
+    查找包含变化笔记的一级目录
+
+    Args:
+        chapter_structure (dict): 章节结构
+        changed_paths (set): 变化的笔记路径（字符串）集合
+
+    Returns:
+        set: 一级目录名称集合
+    """
+    return {chapter["level_1"] for chapter in chapter_structure["chapters"]
+            if not changed_paths.isdisjoint(chapter["files"])}
+
+
+def print_chapter_summary(chapter_structure, metadata_type, tag_trie=None):
     """
     打印章节结构摘要
 
     Args:
         chapter_structure (dict): 章节结构
         metadata_type (str): "tag" 或 "category"
+        tag_trie (dict): 已构建的标签树，未提供时由章节结构构建
     """
     print("\n" + "=" * 80)
     print(f"章节结构预览 (按{metadata_type.upper()}分组)")
     print("=" * 80)
 
-    # 按层级分组显示
-    level1_groups = defaultdict(list)
+    if tag_trie is None:
+        tag_trie = build_tag_trie(chapter_structure["chapters"])
 
-    for chapter in chapter_structure["chapters"]:
-        level1 = chapter["level_1"]
-        level1_groups[level1].append(chapter)
+    def print_node(node, depth):
+        indent = "  " * (depth - 1)
+        icon = "📁" if depth == 1 else ("📂" if depth == 2 or node["children"] else "📄")
+        prefix = "\n" if depth == 1 else ""
+        print(f"{prefix}{indent}{icon} {node['name']} ({len(trie_subtree_files(node))} 个文件)")
 
-    for level1, chapters in level1_groups.items():
-        print(f"\n📁 {level1} ({sum(ch['file_count'] for ch in chapters)} 个文件)")
+        # 一级目录，或既有直接文件又有子标签的节点，单独显示直接文件数
+        if node["files"] and (depth == 1 or node["children"]):
+            print(f"{indent}  📄 直接文件 ({len(node['files'])} 个文件)")
 
-        # 按二级目录分组
-        level2_groups = defaultdict(list)
-        for chapter in chapters:
-            level2 = chapter["level_2"]
-            level2_groups[level2].append(chapter)
-
-        for level2, level2_chapters in level2_groups.items():
-            if level2:
-                print(
-                    f"  📂 {level2} ({sum(ch['file_count'] for ch in level2_chapters)} 个文件)")
-
-                for chapter in level2_chapters:
-                    level3 = chapter["level_3"]
-                    if level3:
-                        print(f"    📄 {level3} ({chapter['file_count']} 个文件)")
-            else:
-                # 没有二级目录的直接显示
-                for chapter in level2_chapters:
-                    print(f"  📄 直接文件 ({chapter['file_count']} 个文件)")
+        for child in node["children"].values():
+            print_node(child, depth + 1)
+
+    for level1_node in tag_trie["children"].values():
+        print_node(level1_node, 1)
 
 
-def analyze_files_with_metadata(md_files, metadata_type):
+def analyze_single_file(file_path, metadata_types, scan_cache=None):
     """
-    分析所有文件并提取元数据
+    提取单个文件的元数据（优先使用扫描缓存），可在工作线程中并行调用
+
+    未命中缓存时一次读取即提取所有支持的元数据类型，切换Tag/Category视图时无需重新读取。
 
     Args:
-        md_files (list): markdown文件路径列表
-        metadata_type (str): "tag" 或 "category"
+        file_path (Path): markdown文件路径
+        metadata_types (tuple): 需要的元数据类型，如 ("tag", "category")
+        scan_cache (dict): 扫描缓存条目字典（只读）
 
     Returns:
-        list: 包含(文件路径, 元数据列表)的元组列表
+        tuple: (以类型为键的元数据字典, 新的缓存条目, 读取字节数, 是否命中缓存)；
+            读取失败时各类型的元数据均为[]且缓存条目为None
     """
-    files_with_metadata = []
-    field_name = "标签" if metadata_type == "tag" else "分类"
+    entry = None
+    bytes_read = 0
+    try:
+        if scan_cache is not None:
+            stat_result = file_path.stat()
+            entry, metadata = lookup_scan_cache(
+                scan_cache, file_path, stat_result, metadata_types)
+            if metadata is not None:
+                return metadata, entry, 0, True
+
+        found, bytes_read = scan_metadata_header(
+            file_path, tuple(METADATA_PREFIXES) + (ALIAS_METADATA_TYPE,))
+    except (OSError, UnicodeDecodeError) as e:
+        # 读取失败的文件不写入缓存，下次运行会重新尝试
+        print(f"读取文件 {file_path} 时出错: {e}")
+        return {metadata_type: [] for metadata_type in metadata_types}, None, bytes_read, False
+
+    metadata = {metadata_type: found[metadata_type]
+                for metadata_type in metadata_types}
+
+    if scan_cache is None:
+        return metadata, None, bytes_read, False
 
-    print(f"正在分析 {len(md_files)} 个文件的{field_name}...")
+    entry = {
+        "mtime": stat_result.st_mtime_ns,
+        "size": stat_result.st_size,
+        "items": found,
+    }
+    if SCAN_CACHE_USE_HASH:
+        entry["hash"] = compute_file_hash(file_path)
+
+    return metadata, entry, bytes_read, False
+
+
+def map_in_order(executor, func, items, max_pending):
+    """
+    在线程池中并行执行函数并按输入顺序产出结果，最多同时提交max_pending个任务
+
+    与 executor.map 不同，不会在产出第一个结果前提交（并遍历）全部输入，
+    适合按需产出的生成器输入。
+
+    Args:
+        executor (ThreadPoolExecutor): 线程池
+        func (callable): 对每个输入调用的函数
+        items (iterable): 输入列表或生成器
+        max_pending (int): 同时提交的最大任务数
+
+    Yields:
+        object: func的返回值，顺序与输入一致
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def analyze_files_with_all_metadata(md_files, metadata_types, scan_cache=None, jobs=1,
+                                    stats=None):
+    """
+    分析所有文件，在同一次读取中提取多种元数据
+
+    Args:
+        md_files (iterable): markdown文件路径列表或生成器（如 iter_md_files），
+            传入生成器时在遍历目录的同时即开始提取
+        metadata_types (tuple): 需要的元数据类型，如 ("tag", "category")
+        scan_cache (dict): 扫描缓存条目字典，提供时只重新读取新增或修改的文件，
+            并原地更新缓存（已删除的文件会被移除）
+        jobs (int): 并行提取的线程数，1表示串行
+        stats (dict): 提供时写入统计信息（files、bytes_read、cache_hits）
+
+    Returns:
+        dict: 笔记表（见 new_note_table），笔记ID顺序与md_files的产出顺序一致
+    """
+    metadata_types = tuple(metadata_types)
+    note_table = new_note_table(metadata_types)
+    field_names = {"tag": "标签", "category": "分类", ALIAS_METADATA_TYPE: "别名"}
+    field_name = "、".join(field_names[metadata_type] for metadata_type in metadata_types)
+    updated_cache = {}
+    cache_hits = 0
+    total_bytes_read = 0
+
+    total_files = len(md_files) if hasattr(md_files, "__len__") else None
+    processed_files = 0
+
+    if total_files is None:
+        print(f"正在扫描并分析文件的{field_name}...")
+    else:
+        print(f"正在分析 {total_files} 个文件的{field_name}...")
+    if jobs > 1:
+        print(f"并行线程数: {jobs}")
+
+    def analyze(file_path):
+        return file_path, analyze_single_file(file_path, metadata_types, scan_cache)
 
-    for i, file_path in enumerate(md_files, 1):
-        # 显示进度
-        if i % 500 == 0 or i == len(md_files):
-            print(f"进度: {i}/{len(md_files)}")
+    executor = ThreadPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        # 按提交顺序返回结果，保证输出顺序与串行一致；只预先提交有限个文件，保持流式遍历
+        results = map_in_order(executor, analyze, md_files,
+                               jobs * EXTRACT_PENDING_PER_JOB) if executor else map(
+            analyze, md_files)
+
+        for i, (file_path, result) in enumerate(results, 1):
+            # 显示进度
+            processed_files = i
+            if i % 500 == 0 or i == total_files:
+                print(f"进度: {i}/{total_files if total_files is not None else '?'}")
+
+            metadata, entry, bytes_read, cache_hit = result
+            total_bytes_read += bytes_read
+            cache_hits += cache_hit
+            if entry is not None:
+                updated_cache[str(file_path)] = entry
+            add_note(note_table, file_path, metadata)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if total_files is None:
+        print(f"进度: {processed_files}/{processed_files}")
+    print(f"元数据读取量: {total_bytes_read / 1024:.1f} KB")
+    if stats is not None:
+        stats.update(files=processed_files, bytes_read=total_bytes_read, cache_hits=cache_hits)
+
+    if scan_cache is not None:
+        removed = len(set(scan_cache) - set(updated_cache))
+        scan_cache.clear()
+        scan_cache.update(updated_cache)
+        print(f"扫描缓存: 命中 {cache_hits} 个，重新读取 "
+              f"{processed_files - cache_hits} 个，移除已删除 {removed} 个")
+
+    return note_table
+
+
+def analyze_files_with_metadata(md_files, metadata_type, scan_cache=None, jobs=1):
+    """
+    分析所有文件并提取元数据
 
-        metadata = extract_metadata_from_file(file_path, metadata_type)
-        files_with_metadata.append((file_path, metadata))
+    Args:
+        md_files (list): markdown文件路径列表
+        metadata_type (str): "tag" 或 "category"
+        scan_cache (dict): 扫描缓存条目字典，提供时只重新读取新增或修改的文件，
+            并原地更新缓存（已删除的文件会被移除）
+        jobs (int): 并行提取的线程数，1表示串行
 
-    return files_with_metadata
+    Returns:
+        list: 包含(文件路径, 元数据列表)的元组列表，顺序与md_files一致
+    """
+    return list(iter_note_entries(
+        analyze_files_with_all_metadata(md_files, (metadata_type,), scan_cache, jobs),
+        metadata_type))
 
 
 def generate_sorted_file_list(chapter_structure):
@@ -344,17 +1247,2291 @@ def generate_sorted_file_list(chapter_structure):
     return sorted_files
 
 
-def generate_epub(sorted_files, output_path, metadata_type):
+def primary_item_rank(item, primary_items):
     """
-    使用Pandoc生成EPUB文件
+    计算项目在首选列表中的位置（项目等于首选项目或为其子项目时匹配）
 
     Args:
-        sorted_files (list): 排序后的文件列表
-        output_path (Path): 输出文件路径
-        metadata_type (str): "tag" 或 "category"
+        item (str): 项目字符串，如 "#1-个人成长/1-内在建设"
+        primary_items (list): 首选项目列表（可省略开头的#）
 
     Returns:
-        bool: 是否成功生成
+        int: 匹配的位置，不匹配时为 len(primary_items)
+    """
+    for rank, primary_item in enumerate(primary_items):
+        primary_item = primary_item if primary_item.startswith("#") else f"#{primary_item}"
+        if item == primary_item or item.startswith(primary_item.rstrip("/") + "/"):
+            return rank
+    return len(primary_items)
+
+
+def dedupe_chapters(chapters, primary_items=None):
+    """
+    多标签笔记去重：每篇笔记只保留在一个规范章节中，其他章节改为链接
+
+    规范章节为首选标签（PRIMARY_TAGS）中最靠前的匹配章节，都不匹配时为
+    排序最靠前的章节。去重只在传入的章节范围（一本书）内进行。
+
+    Args:
+        chapters (list): 按输出顺序排列的章节列表
+        primary_items (list): 首选项目列表，默认使用 PRIMARY_TAGS
+
+    Returns:
+        list: 新的章节列表，"files"只包含规范位置的笔记，
+            "links"为在其他章节输出的笔记
+    """
+    if primary_items is None:
+        primary_items = PRIMARY_TAGS
+
+    # 笔记路径 -> (首选位置, 章节序号)，位置相同时保留最先出现的章节
+    canonical = {}
+    for chapter_index, chapter in enumerate(chapters):
+        rank = primary_item_rank(chapter["item"], primary_items)
+        for file_path in chapter["files"]:
+            current = canonical.get(file_path)
+            if current is None or rank < current[0]:
+                canonical[file_path] = (rank, chapter_index)
+
+    deduped_chapters = []
+    for chapter_index, chapter in enumerate(chapters):
+        files = [file_path for file_path in chapter["files"]
+                 if canonical[file_path][1] == chapter_index]
+        links = [file_path for file_path in chapter["files"]
+                 if canonical[file_path][1] != chapter_index]
+        deduped_chapters.append(dict(chapter, files=files, links=links,
+                                     file_count=len(files)))
+
+    return deduped_chapters
+
+
+def build_pandoc_options(title, from_format=PANDOC_READER_FORMAT):
+    """
+    生成EPUB构建通用的Pandoc选项（不含输入和输出文件）
+
+    Args:
+        title (str): 书名
+        from_format (str): 输入格式
+
+    Returns:
+        list: Pandoc命令行选项列表
+    """
+    pandoc_options = [
+        # EPUB相关选项
+        "--to=epub3",
+        "--epub-metadata=metadata.xml" if Path(
+            "metadata.xml").exists() else None,
+        # 目录选项
+        "--toc",
+        f"--toc-depth={TAG_HEADING_LEVELS}",  # 目录深度与插入的标签标题层级一致
+        # 输入格式
+        f"--from={from_format}",
+        # 资源路径（让Pandoc能找到图片等资源）
+        f"--resource-path={VAULT_PATH.absolute()}",
+        # 标题和作者信息
+        f"--metadata=title:{title}",
+        "--metadata=author:知识整理者",
+        f"--metadata=date:{datetime.now().strftime('%Y-%m-%d')}",
+        # 中文支持
+        "--variable=lang:zh-CN",
+    ]
+
+    # 过滤掉None值
+    return [arg for arg in pandoc_options if arg is not None]
+
+
+def single_epub_title(category_name, metadata_type):
+    """
+    生成分组EPUB的书名
+
+    Args:
+        category_name (str): 分类名称
+        metadata_type (str): "tag" 或 "category"
+
+    Returns:
+        str: 书名
+    """
+    field_name = "标签" if metadata_type == "tag" else "分类"
+    return f"Obsidian导出 - {category_name} (按{field_name})"
+
+
+def load_build_manifest(output_dir):
+    """
+    加载构建清单
+
+    Args:
+        output_dir (Path): 输出目录
+
+    Returns:
+        dict: 构建清单，包含 notes（笔记哈希缓存）、attachments（附件哈希缓存）
+            和 outputs（输出文件指纹）
+    """
+    manifest_path = output_dir / BUILD_MANIFEST_FILENAME
+    empty_manifest = {"version": BUILD_MANIFEST_VERSION,
+                      "notes": {}, "attachments": {}, "outputs": {}}
+    if not manifest_path.exists():
+        return empty_manifest
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  构建清单 {manifest_path} 无法读取，将全部重建: {e}")
+        return empty_manifest
+
+    if manifest.get("version") != BUILD_MANIFEST_VERSION:
+        return empty_manifest
+
+    return manifest
+
+
+def save_build_manifest(manifest, output_dir):
+    """
+    保存构建清单（先写临时文件再替换）
+
+    Args:
+        manifest (dict): 构建清单
+        output_dir (Path): 输出目录
+
+    Returns:
+        Path: 构建清单路径
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / BUILD_MANIFEST_FILENAME
+    tmp_path = manifest_path.with_suffix(".tmp")
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+    return manifest_path
+
+
+def load_quarantine(output_dir):
+    """
+    加载隔离清单
+
+    Args:
+        output_dir (Path): 输出目录
+
+    Returns:
+        dict: {"version", "notes": 笔记路径 -> {"hash", "error", "book", "quarantined_at"}}
+    """
+    quarantine_path = output_dir / QUARANTINE_FILENAME
+    empty_quarantine = {"version": QUARANTINE_VERSION, "notes": {}}
+    if not quarantine_path.exists():
+        return empty_quarantine
+
+    try:
+        with open(quarantine_path, 'r', encoding='utf-8') as f:
+            quarantine = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  隔离清单 {quarantine_path} 无法读取，将忽略: {e}")
+        return empty_quarantine
+
+    if quarantine.get("version") != QUARANTINE_VERSION:
+        return empty_quarantine
+
+    return quarantine
+
+
+def save_quarantine(quarantine, output_dir):
+    """
+    保存隔离清单（先写临时文件再替换）
+
+    Args:
+        quarantine (dict): 隔离清单
+        output_dir (Path): 输出目录
+
+    Returns:
+        Path: 隔离清单路径
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    quarantine_path = output_dir / QUARANTINE_FILENAME
+    tmp_path = quarantine_path.with_suffix(".tmp")
+
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(quarantine, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, quarantine_path)
+
+    return quarantine_path
+
+
+def active_quarantine(output_dir):
+    """
+    获取仍需跳过的隔离笔记：内容已修改或已删除的笔记从清单中移除，下次构建时重新尝试
+
+    Args:
+        output_dir (Path): 输出目录
+
+    Returns:
+        set: 隔离中的笔记路径
+    """
+    with QUARANTINE_LOCK:
+        quarantine = load_quarantine(output_dir)
+        released = []
+        for path, record in quarantine["notes"].items():
+            try:
+                current_hash = compute_file_hash(Path(path))
+            except OSError:
+                current_hash = None
+            if current_hash != record["hash"]:
+                released.append(path)
+
+        for path in released:
+            del quarantine["notes"][path]
+            print(f"♻️  笔记已修改，解除隔离: {path}")
+        if released:
+            save_quarantine(quarantine, output_dir)
+
+    return {Path(path) for path in quarantine["notes"]}
+
+
+def exclude_quarantined(chapters, quarantined, book):
+    """
+    从一次构建的章节中去掉隔离中的笔记（各种导出方式共用）
+
+    Args:
+        chapters (list): 章节列表
+        quarantined (set): 隔离中的笔记路径（见 active_quarantine）
+        book (str): 构建的名称，用于提示
+
+    Returns:
+        list: 去掉隔离笔记后的章节列表（没有隔离笔记时原样返回）
+    """
+    if not quarantined:
+        return chapters
+
+    skipped = set()
+    filtered_chapters = []
+    for chapter in chapters:
+        files = []
+        for file_path in chapter["files"]:
+            if Path(file_path) in quarantined:
+                skipped.add(file_path)
+            else:
+                files.append(file_path)
+        filtered_chapters.append(dict(chapter, files=files, file_count=len(files)))
+
+    if skipped:
+        print(f"⚠️  {book}: 跳过 {len(skipped)} 篇已隔离的笔记（见 {QUARANTINE_FILENAME}）")
+    return filtered_chapters
+
+
+def quarantine_notes(output_dir, failures, book):
+    """
+    把出错的笔记（按当前内容哈希）加入隔离清单，并记入本次的构建报告
+
+    Args:
+        output_dir (Path): 输出目录
+        failures (list): (笔记路径, 错误信息) 列表
+        book (str): 出错的分组名称
+    """
+    records = []
+    for file_path, error in failures:
+        try:
+            file_hash = compute_file_hash(file_path)
+        except OSError:
+            file_hash = None
+        records.append((str(file_path), {
+            "hash": file_hash,
+            "error": error[-2000:],
+            "book": book,
+            "quarantined_at": datetime.now().isoformat(),
+        }))
+
+    with QUARANTINE_LOCK:
+        quarantine = load_quarantine(output_dir)
+        quarantine["notes"].update(records)
+        save_quarantine(quarantine, output_dir)
+
+    with BUILD_REPORT_LOCK:
+        BUILD_REPORT["quarantined"].extend(dict(record, path=path) for path, record in records)
+
+
+def get_note_hash(file_path, note_hashes):
+    """
+    获取笔记内容哈希，mtime和大小未变化时直接复用记录的哈希
+
+    Args:
+        file_path (Path): 笔记路径
+        note_hashes (dict): 以路径为键的 {"mtime", "size", "hash"} 记录，会被原地更新
+
+    Returns:
+        str: 内容哈希；文件无法读取时返回空字符串
+    """
+    key = str(file_path)
+    try:
+        stat_result = file_path.stat()
+    except OSError:
+        return ""
+
+    record = note_hashes.get(key)
+    if (record and record["mtime"] == stat_result.st_mtime_ns
+            and record["size"] == stat_result.st_size):
+        return record["hash"]
+
+    try:
+        file_hash = compute_file_hash(file_path)
+    except OSError:
+        return ""
+
+    note_hashes[key] = {"mtime": stat_result.st_mtime_ns,
+                        "size": stat_result.st_size, "hash": file_hash}
+    return file_hash
+
+
+def get_note_references(file_path, note_hashes, key):
+    """
+    获取笔记中的 [[链接]] 或附件嵌入目标，与内容哈希一起记录，笔记未变化时不重新读取
+
+    Args:
+        file_path (Path): 笔记路径
+        note_hashes (dict): 笔记哈希记录，会被原地更新
+        key (str): "links" 或 "embeds"
+
+    Returns:
+        list: 目标列表；文件无法读取时返回空列表
+    """
+    if not get_note_hash(file_path, note_hashes):
+        return []
+
+    record = note_hashes[str(file_path)]
+    if "links" not in record or "embeds" not in record:
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError:
+            return []
+        record["links"] = extract_note_links(text)
+        record["embeds"] = extract_note_embeds(text)
+    return record[key]
+
+
+def get_note_links(file_path, note_hashes):
+    """
+    获取笔记中的 [[链接]] 目标（见 get_note_references）
+
+    Returns:
+        list: 链接目标列表
+    """
+    return get_note_references(file_path, note_hashes, "links")
+
+
+def get_note_embeds(file_path, note_hashes):
+    """
+    获取笔记中嵌入的附件目标（见 get_note_references）
+
+    Returns:
+        list: 嵌入目标列表
+    """
+    return get_note_references(file_path, note_hashes, "embeds")
+
+
+def update_attachment_hashes(hasher, file_path, note_hashes, attachment_hashes):
+    """
+    把笔记嵌入的附件（按解析后的路径）及其内容哈希加入指纹
+
+    Args:
+        hasher: hashlib哈希对象
+        file_path (Path): 笔记路径
+        note_hashes (dict): 笔记哈希记录
+        attachment_hashes (dict): 附件哈希记录（格式同笔记哈希记录），会被原地更新
+    """
+    for target in get_note_embeds(file_path, note_hashes):
+        attachment_path = resolve_attachment(target, file_path)
+        attachment_hash = (get_note_hash(attachment_path, attachment_hashes)
+                           if attachment_path is not None else "")
+        hasher.update(f"{target}\0{attachment_path}\0{attachment_hash}\0".encode('utf-8'))
+
+
+def compute_build_fingerprint(sorted_files, pandoc_options, note_hashes, link_context=None,
+                              attachment_hashes=None, chapters=None):
+    """
+    计算EPUB构建指纹：有序笔记列表及其标签、笔记内容哈希、嵌入附件的内容哈希、
+    章节结构（标签标题和去重后的笔记链接）、Pandoc版本和参数、图片优化参数以及metadata.xml哈希
+
+    Args:
+        sorted_files (list): 排序后的文件列表
+        pandoc_options (list): Pandoc选项（日期参数不参与计算）
+        note_hashes (dict): 笔记哈希记录
+        link_context (dict): 书的链接上下文，提供时笔记中链接的解析结果
+            （书内锚点、其他书名或无法解析）也参与计算
+        attachment_hashes (dict): 附件哈希记录，None表示不缓存附件哈希
+        chapters (list): 书的章节列表，提供时各章节的标签、层级和笔记链接也参与计算
+
+    Returns:
+        str: 指纹字符串
+    """
+    if attachment_hashes is None:
+        attachment_hashes = {}
+
+    hasher = hashlib.sha1()
+    hasher.update(f"{get_pandoc_version()}\0".encode('utf-8'))
+    if Image is not None:
+        hasher.update(f"{IMAGE_PROFILE}\0{IMAGE_CACHE_VERSION}\0".encode('utf-8'))
+
+    for file_path, items, _ in sorted_files:
+        hasher.update(str(file_path).encode('utf-8'))
+        hasher.update(get_note_hash(file_path, note_hashes).encode('ascii'))
+        # 所属标签决定插入的标签标题
+        hasher.update("\0".join(items).encode('utf-8'))
+
+        if link_context is not None:
+            for target in get_note_links(file_path, note_hashes):
+                note_path = resolve_note_link(target)
+                resolved = (link_context["anchors"].get(note_path)
+                            or link_context["books"].get(note_path) or "")
+                hasher.update(f"{target}\0{resolved}\0".encode('utf-8'))
+
+        # 替换被嵌入的图片后也需要重建
+        update_attachment_hashes(hasher, file_path, note_hashes, attachment_hashes)
+
+    # 只有标签标题或去重链接的章节不在笔记列表中，但同样决定书的内容
+    for chapter in chapters or []:
+        hasher.update(f"{chapter['item']}\0{chapter.get('levels')}\0".encode('utf-8'))
+        for file_path in chapter.get("links", []):
+            anchor_id = (link_context["anchors"].get(Path(file_path))
+                         if link_context is not None else None)
+            hasher.update(f"{file_path}\0{anchor_id or ''}\0".encode('utf-8'))
+        hasher.update(b"\1")
+
+    for option in pandoc_options:
+        # 日期每天都会变化，不应导致重建
+        if not option.startswith("--metadata=date:"):
+            hasher.update(option.encode('utf-8'))
+
+    metadata_xml = Path("metadata.xml")
+    if metadata_xml.exists():
+        hasher.update(compute_file_hash(metadata_xml).encode('ascii'))
+
+    return hasher.hexdigest()
+
+
+def reset_build_report():
+    """清空构建报告（每次完整运行或监听模式的每次重建开始时调用）"""
+    with BUILD_REPORT_LOCK:
+        BUILD_REPORT["stages"] = []
+        BUILD_REPORT["pandoc_runs"] = []
+        BUILD_REPORT["quarantined"] = []
+
+
+@contextmanager
+def report_stage(name, output_dir=None):
+    """
+    记录一个阶段的耗时和处理量；阶段名匹配 PROFILE_STAGES 时同时用cProfile分析
+
+    调用方可以在阶段内填写返回记录的 "files" 和 "bytes"，用于计算吞吐量。
+    cProfile只分析调用线程，工作线程和Pandoc子进程的耗时体现在墙钟时间中。
+
+    Args:
+        name (str): 阶段名，如 "extract"、"structure:tag"、"build:tag:chapters"
+        output_dir (Path): 分析结果（.prof）的保存目录，默认为 OUTPUT_DIRECTORY
+
+    Yields:
+        dict: 阶段记录
+    """
+    record = {"name": name, "files": None, "bytes": None}
+    pandoc_runs_before = len(BUILD_REPORT["pandoc_runs"])
+
+    profiler = None
+    if any(fnmatch.fnmatch(name, pattern) for pattern in PROFILE_STAGES):
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 6)
+        if profiler is not None:
+            profiler.disable()
+            profile_dir = output_dir or OUTPUT_DIRECTORY
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            safe_name = re.sub(r'[^\w.-]+', '_', name)
+            profile_path = profile_dir / f"profile_{safe_name}.prof"
+            profiler.dump_stats(profile_path)
+            record["profile"] = str(profile_path)
+            print(f"\n🔬 阶段 {name} 的性能分析（按累计时间前15项），完整结果: {profile_path}")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+
+        if record["seconds"] > 0:
+            if record["files"] is not None:
+                record["files_per_second"] = round(record["files"] / record["seconds"], 1)
+            if record["bytes"] is not None:
+                record["mb_per_second"] = round(record["bytes"] / 1024 / 1024 / record["seconds"], 3)
+
+        with BUILD_REPORT_LOCK:
+            stage_runs = BUILD_REPORT["pandoc_runs"][pandoc_runs_before:]
+            record["pandoc_runs"] = len(stage_runs)
+            record["child_peak_rss_kb"] = max(
+                (run["peak_rss_kb"] for run in stage_runs if run["peak_rss_kb"] is not None),
+                default=None)
+            BUILD_REPORT["stages"].append(record)
+
+
+def run_pandoc(pandoc_cmd, input=None, timeout=None, text=False, label=None, input_bytes=None):
+    """
+    运行Pandoc并把耗时、输入量和子进程峰值内存记入构建报告
+
+    使用os.wait4回收子进程以获得它的资源占用；不支持wait4的平台退回subprocess.run，
+    此时不记录峰值内存。
+
+    Args:
+        pandoc_cmd (list): 命令行参数
+        input (bytes | str | iterable): 写入标准输入的内容，也可以是逐块生成内容的可迭代对象
+            （流式写入，生成时出错会终止子进程并重新抛出）
+        timeout (float): 超时时间（秒）
+        text (bool): 是否以文本模式读写
+        label (str): 报告中显示的名称（如笔记或输出文件名）
+        input_bytes (int): 输入字节数，默认按input计算
+
+    Returns:
+        subprocess.CompletedProcess: 执行结果
+
+    Raises:
+        subprocess.TimeoutExpired: 超时（子进程已被终止）
+    """
+    streamed = input is not None and not isinstance(input, (bytes, str))
+    if input_bytes is None and input is not None and not streamed:
+        input_bytes = len(input.encode('utf-8') if isinstance(input, str) else input)
+
+    start = time.perf_counter()
+    peak_rss_kb = None
+
+    if not hasattr(os, "wait4"):
+        if streamed:
+            input = ("" if text else b"").join(input)
+        result = subprocess.run(pandoc_cmd, input=input, capture_output=True, text=text,
+                                timeout=timeout)
+    else:
+        process = subprocess.Popen(
+            pandoc_cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=text,
+            encoding='utf-8' if text else None)
+        outputs = {}
+        input_errors = []
+
+        def read_stream(key, stream):
+            outputs[key] = stream.read()
+            stream.close()
+
+        def write_input():
+            try:
+                for chunk in (input if streamed else [input]):
+                    try:
+                        process.stdin.write(chunk)
+                    except (BrokenPipeError, OSError):
+                        # 子进程已退出，结果由返回码体现
+                        return
+            except Exception as e:
+                # 生成输入时出错：终止子进程，等待结束后重新抛出
+                input_errors.append(e)
+                process.kill()
+            finally:
+                try:
+                    process.stdin.close()
+                except (BrokenPipeError, OSError):
+                    pass
+
+        # 输入输出在辅助线程中进行，本线程负责等待子进程并读取其资源占用
+        threads = [threading.Thread(target=read_stream, args=("stdout", process.stdout)),
+                   threading.Thread(target=read_stream, args=("stderr", process.stderr))]
+        if input is not None:
+            threads.append(threading.Thread(target=write_input))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        timer = None
+        timed_out = threading.Event()
+        if timeout is not None:
+            def kill_on_timeout():
+                timed_out.set()
+                process.kill()
+            timer = threading.Timer(timeout, kill_on_timeout)
+            timer.start()
+
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        finally:
+            if timer is not None:
+                timer.cancel()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        for thread in threads:
+            thread.join()
+
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(pandoc_cmd, timeout)
+        if input_errors:
+            raise input_errors[0]
+
+        # Linux上ru_maxrss的单位为KB，macOS上为字节；exec之前子进程沿用父进程的内存，
+        # 因此很小的子进程会显示接近本进程的数值
+        peak_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+        result = subprocess.CompletedProcess(pandoc_cmd, process.returncode,
+                                             outputs.get("stdout"), outputs.get("stderr"))
+
+    record_pandoc_run(label or " ".join(str(part) for part in pandoc_cmd[1:3]),
+                      time.perf_counter() - start, input_bytes, result.returncode, peak_rss_kb)
+
+    return result
+
+
+def record_pandoc_run(label, seconds, input_bytes, returncode, peak_rss_kb=None):
+    """
+    把一次Pandoc转换记入构建报告
+
+    Args:
+        label (str): 报告中显示的名称
+        seconds (float): 耗时（秒）
+        input_bytes (int): 输入字节数
+        returncode (int): 退出码（pandoc server的请求成功为0，失败为1）
+        peak_rss_kb (int): 子进程峰值内存（KB），未知时为None
+    """
+    with BUILD_REPORT_LOCK:
+        BUILD_REPORT["pandoc_runs"].append({
+            "label": label,
+            "seconds": round(seconds, 6),
+            "input_bytes": input_bytes,
+            "returncode": returncode,
+            "peak_rss_kb": peak_rss_kb,
+        })
+
+
+def save_build_report(output_dir):
+    """
+    保存构建报告
+
+    Args:
+        output_dir (Path): 输出目录（与章节索引相同）
+
+    Returns:
+        Path: 报告文件路径
+    """
+    with BUILD_REPORT_LOCK:
+        stages = list(BUILD_REPORT["stages"])
+        pandoc_runs = list(BUILD_REPORT["pandoc_runs"])
+        quarantined = list(BUILD_REPORT["quarantined"])
+
+    report = {
+        "generated_at": datetime.now().isoformat(),
+        "total_seconds": round(sum(stage["seconds"] for stage in stages), 6),
+        "stages": stages,
+        "pandoc": {
+            "runs": len(pandoc_runs),
+            "seconds": round(sum(run["seconds"] for run in pandoc_runs), 6),
+            "peak_rss_kb": max((run["peak_rss_kb"] for run in pandoc_runs
+                                if run["peak_rss_kb"] is not None), default=None),
+            # 只保存最慢的调用，避免大vault的报告过大
+            "slowest": sorted(pandoc_runs, key=lambda run: run["seconds"], reverse=True)[:50],
+        },
+        # 本次运行中新隔离的笔记（完整清单见 quarantine.json）
+        "quarantined": quarantined,
+    }
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report_path = output_dir / BUILD_REPORT_FILENAME
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return report_path
+
+
+@lru_cache(maxsize=None)
+def get_pandoc_version():
+    """
+    获取Pandoc版本信息（作为渲染缓存键和构建指纹的一部分）
+
+    Returns:
+        str: `pandoc --version` 输出的第一行；找不到Pandoc或无法连接pandoc server时为None
+            （之后的转换会报告具体错误）
+    """
+    try:
+        if PANDOC_BACKEND == "server":
+            return ensure_pandoc_server()
+        result = subprocess.run([PANDOC_BINARY, "--version"],
+                                capture_output=True, text=True, timeout=60)
+    except (OSError, subprocess.SubprocessError, PandocUnavailableError) as e:
+        print(f"⚠️  无法获取Pandoc版本: {e}")
+        return None
+    return result.stdout.splitlines()[0] if result.stdout else ""
+
+
+def pandoc_server_address():
+    """
+    解析 PANDOC_SERVER_URL
+
+    Returns:
+        tuple: (主机, 端口)
+    """
+    parts = urlsplit(PANDOC_SERVER_URL)
+    return parts.hostname or "127.0.0.1", parts.port or 3030
+
+
+def pandoc_server_request(method, path, body=None, timeout=None):
+    """
+    通过连接池向pandoc server发送一个请求
+
+    优先复用空闲连接；复用的连接已被服务器关闭时换一个新连接重试一次。
+
+    Args:
+        method (str): HTTP方法
+        path (str): 请求路径
+        body (bytes): JSON请求体
+        timeout (float): 超时时间（秒），默认为 PANDOC_SERVER_TIMEOUT
+
+    Returns:
+        tuple: (HTTP状态码, 响应内容bytes)
+
+    Raises:
+        subprocess.TimeoutExpired: 超时
+        OSError, http.client.HTTPException: 无法连接服务器
+    """
+    timeout = timeout or PANDOC_SERVER_TIMEOUT
+    headers = {"Accept": "application/json"}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+
+    for attempt in range(2):
+        try:
+            connection = PANDOC_SERVER_POOL.get_nowait()
+            reused = True
+        except queue.Empty:
+            host, port = pandoc_server_address()
+            connection = http.client.HTTPConnection(host, port, timeout=timeout)
+            reused = False
+
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except socket.timeout:
+            connection.close()
+            raise subprocess.TimeoutExpired([PANDOC_SERVER_URL, path], timeout)
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            if reused and attempt == 0:
+                continue
+            raise
+
+        if response.will_close or PANDOC_SERVER_POOL.qsize() >= PANDOC_SERVER_POOL_SIZE:
+            connection.close()
+        else:
+            PANDOC_SERVER_POOL.put(connection)
+        return response.status, data
+
+
+def read_pandoc_server_version():
+    """
+    查询pandoc server的版本
+
+    Returns:
+        str: 形如 "pandoc-server 3.1.11" 的版本字符串
+
+    Raises:
+        OSError, http.client.HTTPException: 无法连接服务器
+    """
+    status, data = pandoc_server_request("GET", "/version", timeout=10)
+    if status != 200:
+        raise http.client.HTTPException(f"HTTP {status}")
+    return "pandoc-server " + data.decode('utf-8', 'replace').strip().strip('"')
+
+
+class PandocUnavailableError(RuntimeError):
+    """Pandoc本身不可用（无法连接或启动pandoc server），与转换的笔记内容无关"""
+
+
+@lru_cache(maxsize=None)
+def ensure_pandoc_server():
+    """
+    确认pandoc server可用：无法连接且地址为本机时用 PANDOC_BINARY 启动一个（程序退出时关闭）
+
+    Returns:
+        str: 服务器的版本字符串（作为渲染缓存键的一部分）
+
+    Raises:
+        PandocUnavailableError: 无法连接也无法启动服务器
+    """
+    global PANDOC_SERVER_PROCESS
+
+    try:
+        return read_pandoc_server_version()
+    except (http.client.HTTPException, OSError):
+        pass
+
+    host, port = pandoc_server_address()
+    if host not in ("127.0.0.1", "localhost", "::1"):
+        raise PandocUnavailableError(f"无法连接pandoc server: {PANDOC_SERVER_URL}")
+
+    print(f"正在启动pandoc server（端口 {port}）...")
+    PANDOC_SERVER_PROCESS = subprocess.Popen(
+        [PANDOC_BINARY, "server", "--port", str(port), "--timeout", str(PANDOC_SERVER_TIMEOUT)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    atexit.register(stop_pandoc_server)
+
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            return read_pandoc_server_version()
+        except (http.client.HTTPException, OSError) as e:
+            if PANDOC_SERVER_PROCESS.poll() is not None or time.monotonic() > deadline:
+                stop_pandoc_server()
+                raise PandocUnavailableError(f"无法启动pandoc server: {e}") from e
+            time.sleep(0.1)
+
+
+def stop_pandoc_server():
+    """关闭连接池中的连接，并停止由本脚本启动的pandoc server"""
+    global PANDOC_SERVER_PROCESS
+
+    while True:
+        try:
+            PANDOC_SERVER_POOL.get_nowait().close()
+        except queue.Empty:
+            break
+
+    if PANDOC_SERVER_PROCESS is not None:
+        PANDOC_SERVER_PROCESS.terminate()
+        try:
+            PANDOC_SERVER_PROCESS.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            PANDOC_SERVER_PROCESS.kill()
+            PANDOC_SERVER_PROCESS.wait()
+        PANDOC_SERVER_PROCESS = None
+    ensure_pandoc_server.cache_clear()
+
+
+def convert_with_subprocess(input_bytes, from_format, to_format, timeout, label):
+    """
+    转换后端：启动一个Pandoc进程完成一次转换
+
+    Args:
+        input_bytes (bytes): 输入内容
+        from_format (str): 输入格式
+        to_format (str): 输出格式
+        timeout (float): 超时时间（秒）
+        label (str): 报告和错误信息中显示的名称
+
+    Returns:
+        bytes: 转换结果
+
+    Raises:
+        RuntimeError: Pandoc返回错误
+        subprocess.TimeoutExpired: 超时
+    """
+    result = run_pandoc(
+        [PANDOC_BINARY, f"--from={from_format}", f"--to={to_format}"],
+        input=input_bytes, timeout=timeout, label=label)
+    if result.returncode != 0:
+        raise RuntimeError(f"转换 {label} 失败: {result.stderr.decode('utf-8', 'replace')}")
+    return result.stdout
+
+
+def convert_with_server(input_bytes, from_format, to_format, timeout, label):
+    """
+    转换后端：把一次转换作为请求发送给常驻的pandoc server（参数与 convert_with_subprocess 相同）
+
+    Returns:
+        bytes: 转换结果
+
+    Raises:
+        RuntimeError: 服务器返回错误
+        PandocUnavailableError: 无法连接服务器
+        subprocess.TimeoutExpired: 超时
+    """
+    ensure_pandoc_server()
+    body = json.dumps({"text": input_bytes.decode('utf-8', 'replace'),
+                       "from": from_format, "to": to_format},
+                      ensure_ascii=False).encode('utf-8')
+
+    start = time.perf_counter()
+    try:
+        status, data = pandoc_server_request("POST", "/", body, timeout=timeout)
+    except (http.client.HTTPException, OSError) as e:
+        record_pandoc_run(label, time.perf_counter() - start, len(input_bytes), 1)
+        raise PandocUnavailableError(f"转换 {label} 失败，无法连接pandoc server: {e}") from e
+
+    try:
+        response = json.loads(data)
+    except ValueError:
+        response = {"error": data.decode('utf-8', 'replace')}
+    if status != 200 or not isinstance(response, dict) or "output" not in response:
+        record_pandoc_run(label, time.perf_counter() - start, len(input_bytes), 1)
+        error = response.get("error") if isinstance(response, dict) else response
+        raise RuntimeError(f"转换 {label} 失败: {error}")
+
+    record_pandoc_run(label, time.perf_counter() - start, len(input_bytes), 0)
+    if response.get("base64"):
+        return base64.b64decode(response["output"])
+    return response["output"].encode('utf-8')
+
+
+# 转换后端名称 -> 转换函数
+PANDOC_BACKENDS = {
+    "subprocess": convert_with_subprocess,
+    "server": convert_with_server,
+}
+
+
+def pandoc_convert(input_bytes, from_format, to_format, timeout=300, label=None):
+    """
+    使用 PANDOC_BACKEND 指定的后端完成一次文本转换（参数与 convert_with_subprocess 相同）
+
+    Returns:
+        bytes: 转换结果
+    """
+    return PANDOC_BACKENDS[PANDOC_BACKEND](input_bytes, from_format, to_format, timeout,
+                                           label or f"{from_format}->{to_format}")
+
+
+def load_image_cache_records(image_cache_dir):
+    """
+    加载图片优化记录（只在首次调用时读取）
+
+    Args:
+        image_cache_dir (Path): 图片缓存目录
+    """
+    if IMAGE_CACHE_RECORDS:
+        return
+
+    records_path = image_cache_dir / "records.json"
+    if not records_path.exists():
+        return
+
+    try:
+        with open(records_path, 'r', encoding='utf-8') as f:
+            IMAGE_CACHE_RECORDS.update(json.load(f))
+    except (OSError, ValueError) as e:
+        print(f"⚠️  图片缓存记录 {records_path} 无法读取: {e}")
+
+
+def save_image_cache_records(image_cache_dir):
+    """
+    保存图片优化记录
+
+    Args:
+        image_cache_dir (Path): 图片缓存目录
+    """
+    if not IMAGE_CACHE_RECORDS:
+        return
+
+    image_cache_dir.mkdir(parents=True, exist_ok=True)
+    records_path = image_cache_dir / "records.json"
+    # 并行构建的各组都会保存记录：临时文件名按进程/线程区分，替换也在锁内完成
+    tmp_path = records_path.with_name(
+        f"records.{os.getpid()}.{threading.get_ident()}.tmp")
+    with IMAGE_CACHE_LOCK:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(IMAGE_CACHE_RECORDS, f, ensure_ascii=False)
+        os.replace(tmp_path, records_path)
+
+
+def optimize_image(image_path, image_cache_dir):
+    """
+    获取图片的优化版本（缩放并重新压缩），结果按源图片哈希和优化参数缓存
+
+    Args:
+        image_path (Path): 源图片路径
+        image_cache_dir (Path): 图片缓存目录
+
+    Returns:
+        Path: 优化后的图片路径；无法或无需优化时返回源图片路径
+    """
+    if (Image is None or IMAGE_PROFILE is None
+            or image_path.suffix.lower() not in OPTIMIZABLE_IMAGE_SUFFIXES):
+        return image_path
+
+    profile_tag = (f"v{IMAGE_CACHE_VERSION}-{IMAGE_PROFILE['max_size']}px"
+                   f"-q{IMAGE_PROFILE['quality']}")
+    try:
+        stat_result = image_path.stat()
+    except OSError:
+        return image_path
+
+    record_key = f"{image_path}|{stat_result.st_mtime_ns}|{stat_result.st_size}|{profile_tag}"
+    with IMAGE_CACHE_LOCK:
+        load_image_cache_records(image_cache_dir)
+        cached_name = IMAGE_CACHE_RECORDS.get(record_key)
+    if cached_name == "":
+        return image_path
+    if cached_name and (image_cache_dir / cached_name).exists():
+        return image_cache_dir / cached_name
+
+    cache_key = hashlib.sha1(
+        f"{compute_file_hash(image_path)}|{profile_tag}".encode('ascii')).hexdigest()
+
+    try:
+        with Image.open(image_path) as image:
+            has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+            suffix = ".png" if has_alpha else ".jpg"
+            cached_path = image_cache_dir / f"{cache_key}{suffix}"
+
+            if not cached_path.exists():
+                # 按EXIF方向旋转后再缩放：重新编码会丢掉方向标记，手机照片会显示为横倒的
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((IMAGE_PROFILE["max_size"], IMAGE_PROFILE["max_size"]))
+                image_cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = cached_path.with_name(f"{cached_path.name}.{threading.get_ident()}.tmp")
+                if has_alpha:
+                    image.save(tmp_path, "PNG", optimize=True)
+                else:
+                    image.convert("RGB").save(tmp_path, "JPEG", quality=IMAGE_PROFILE["quality"],
+                                              optimize=True)
+                os.replace(tmp_path, cached_path)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  图片 {image_path} 优化失败，使用原图: {e}")
+        return image_path
+
+    # 优化后反而更大时使用原图
+    if cached_path.stat().st_size >= stat_result.st_size:
+        cached_name, result_path = "", image_path
+    else:
+        cached_name, result_path = cached_path.name, cached_path
+
+    with IMAGE_CACHE_LOCK:
+        IMAGE_CACHE_RECORDS[record_key] = cached_name
+    return result_path
+
+
+def resolve_attachment(target, note_path):
+    """
+    解析笔记中引用的附件路径：依次尝试相对笔记目录、相对vault和附件索引
+
+    Args:
+        target (str): 引用的目标，如 "image.png" 或 "assets/image.png"
+        note_path (Path): 笔记路径
+
+    Returns:
+        Path: 附件路径，无法找到或为远程地址时返回None
+    """
+    target = unquote(target.strip())
+    if not target or URL_SCHEME_PATTERN.match(target):
+        return None
+
+    for base_dir in (note_path.parent, VAULT_PATH):
+        candidate = base_dir / target
+        if candidate.is_file():
+            return candidate
+
+    return ATTACHMENT_INDEX.get(Path(target).name)
+
+
+def rewrite_note_embeds(text, note_path, image_cache_dir):
+    """
+    把笔记中的图片嵌入改写为指向（优化后）图片绝对路径的markdown图片
+
+    支持Obsidian的 ![[image.png]]、![[image.png|300]]、![[image.png|300x200]]
+    以及标准的 ![alt](image.png)；无法解析的嵌入保持原样。
+
+    Args:
+        text (str): 笔记内容
+        note_path (Path): 笔记路径
+        image_cache_dir (Path): 图片缓存目录
+
+    Returns:
+        str: 改写后的笔记内容
+    """
+    def image_reference(image_path):
+        return optimize_image(image_path, image_cache_dir).absolute().as_posix()
+
+    def replace_wiki_embed(match):
+        image_path = resolve_attachment(match.group(1), note_path)
+        if image_path is None or image_path.suffix.lower() not in IMAGE_SUFFIXES:
+            return match.group(0)
+
+        option = match.group(2) or ""
+        size_match = EMBED_SIZE_PATTERN.match(option)
+        if size_match:
+            width, height = size_match.groups()
+            attributes = f"{{width={width}px" + (f" height={height}px}}" if height else "}")
+            return f"![](<{image_reference(image_path)}>){attributes}"
+        return f"![{option.strip()}](<{image_reference(image_path)}>)"
+
+    def replace_markdown_image(match):
+        target = match.group(2)
+        if target.startswith("<"):
+            target = target[1:-1]
+        image_path = resolve_attachment(target, note_path)
+        if image_path is None:
+            return match.group(0)
+        return f"![{match.group(1)}](<{image_reference(image_path)}>{match.group(3)})"
+
+    text = WIKI_EMBED_PATTERN.sub(replace_wiki_embed, text)
+    return MD_IMAGE_PATTERN.sub(replace_markdown_image, text)
+
+
+def note_index_keys(file_path):
+    """
+    生成笔记在索引中的键：文件名以及各级路径后缀（小写，不含.md）
+
+    Args:
+        file_path (Path): 笔记路径
+
+    Returns:
+        list: 从短到长的键列表，如 ["note", "dir/note"]
+    """
+    try:
+        relative_path = file_path.relative_to(VAULT_PATH)
+    except ValueError:
+        relative_path = Path(file_path.name)
+
+    parts = list(relative_path.with_suffix("").parts)
+    return ["/".join(parts[-depth:]).lower() for depth in range(1, len(parts) + 1)]
+
+
+def build_note_index(note_paths, aliases_by_file=None):
+    """
+    重建笔记索引（NOTE_INDEX），之后每次链接解析都是一次字典查找
+
+    同名笔记取路径最小者（与Obsidian一样可以用路径后缀区分）；
+    别名不会覆盖真实的文件名。
+
+    Args:
+        note_paths (iterable): 所有笔记路径
+        aliases_by_file (list): [(笔记路径, 别名列表)]，来自frontmatter
+    """
+    NOTE_INDEX.clear()
+    for file_path in sorted(note_paths):
+        for key in note_index_keys(file_path):
+            NOTE_INDEX.setdefault(key, file_path)
+
+    for file_path, aliases in sorted(aliases_by_file or []):
+        for alias in aliases:
+            NOTE_INDEX.setdefault(alias.lower(), file_path)
+
+
+def build_note_table_index(note_table):
+    """
+    由笔记表（需包含 ALIAS_METADATA_TYPE）重建笔记索引
+
+    Args:
+        note_table (dict): 笔记表
+    """
+    build_note_index([Path(file_path) for file_path in note_table["paths"]],
+                     [(file_path, aliases)
+                      for file_path, aliases in iter_note_entries(note_table, ALIAS_METADATA_TYPE)
+                      if aliases])
+
+
+def resolve_note_link(target):
+    """
+    解析 [[链接]] 的目标笔记
+
+    Args:
+        target (str): 链接目标，如 "笔记名"、"目录/笔记名" 或 "笔记名.md"
+
+    Returns:
+        Path: 笔记路径，无法解析时返回None
+    """
+    return NOTE_INDEX.get(note_link_key(target))
+
+
+def note_link_key(target):
+    """
+    把 [[链接]] 的目标规范化为笔记索引的键（与 note_index_keys 的格式一致）
+
+    Args:
+        target (str): 链接目标
+
+    Returns:
+        str: 小写、不含.md的键
+    """
+    key = target.strip().replace("\\", "/").lower()
+    if key.endswith(".md"):
+        key = key[:-3]
+    return key
+
+
+def note_anchor_id(file_path):
+    """
+    生成笔记在书中的锚点ID（由vault内的相对路径决定，保持稳定）
+
+    Args:
+        file_path (Path): 笔记路径
+
+    Returns:
+        str: 形如 "note-1a2b3c4d5e6f" 的ID
+    """
+    try:
+        relative_path = file_path.relative_to(VAULT_PATH).as_posix()
+    except ValueError:
+        relative_path = file_path.as_posix()
+    return "note-" + hashlib.sha1(relative_path.encode('utf-8')).hexdigest()[:12]
+
+
+def build_link_context(note_paths, note_books=None):
+    """
+    生成一本书的链接上下文
+
+    Args:
+        note_paths (iterable): 书中包含的笔记路径
+        note_books (dict): 笔记路径 -> 所在书名，用于改写指向其他书的链接
+
+    Returns:
+        dict: {"anchors": 笔记路径 -> 锚点ID, "books": 笔记路径 -> 书名}
+    """
+    return {
+        "anchors": {Path(file_path): note_anchor_id(Path(file_path)) for file_path in note_paths},
+        "books": note_books or {},
+    }
+
+
+def extract_note_embeds(text):
+    """
+    提取笔记中 ![[附件]] 和 ![](图片) 嵌入的目标（去重，保持出现顺序）
+
+    Args:
+        text (str): 笔记内容
+
+    Returns:
+        list: 嵌入目标列表
+    """
+    targets = [match.group(1).strip() for match in WIKI_EMBED_PATTERN.finditer(text)]
+    for match in MD_IMAGE_PATTERN.finditer(text):
+        target = match.group(2)
+        targets.append(target[1:-1] if target.startswith("<") else target)
+    return list(dict.fromkeys(target for target in targets if target))
+
+
+def extract_note_links(text):
+    """
+    提取笔记中所有 [[链接]] 的目标（去重，保持出现顺序）
+
+    Args:
+        text (str): 笔记内容
+
+    Returns:
+        list: 链接目标列表
+    """
+    return list(dict.fromkeys(
+        match.group(1).strip() for match in WIKILINK_PATTERN.finditer(text)
+        if match.group(1).strip()))
+
+
+def rewrite_note_links(text, link_context):
+    """
+    改写笔记中的 [[笔记]]、[[笔记#标题]] 和 [[笔记|显示文本]] 链接
+
+    目标在同一本书中时改写为指向笔记锚点的内部链接；在其他书中时改为带书名的
+    纯文本引用；无法解析时只保留显示文本。显示文本按markdown转义，代码块和行内代码中的链接保持原样。
+
+    Args:
+        text (str): 笔记内容
+        link_context (dict): build_link_context 返回的链接上下文
+
+    Returns:
+        str: 改写后的笔记内容
+    """
+    def replace_link(match):
+        target, heading, label = match.groups()
+        if not label:
+            label = " > ".join(part.strip() for part in (target, heading) if part and part.strip())
+        label = escape_markdown(label.strip())
+
+        note_path = resolve_note_link(target) if target.strip() else None
+        if note_path is None:
+            return label
+
+        anchor_id = link_context["anchors"].get(note_path)
+        if anchor_id is not None:
+            # [[笔记#标题#子标题]] 指向最后一级标题；标题不存在或是块引用（#^id）时指向笔记开头
+            heading_title = heading.split("#")[-1].strip() if heading else ""
+            if heading_title and heading_key(heading_title) in note_heading_keys(note_path):
+                return f"[{label}](#{heading_anchor_id(anchor_id, heading_title)})"
+            return f"[{label}](#{anchor_id})"
+
+        book_title = link_context["books"].get(note_path)
+        if book_title is not None:
+            return f"{label}（见《{escape_markdown(book_title)}》）"
+        return label
+
+    return sub_outside_code(WIKILINK_PATTERN, replace_link, text)
+
+
+def sub_outside_code(pattern, replace, text):
+    """
+    只在代码块和行内代码之外进行正则替换
+
+    Args:
+        pattern (re.Pattern): 正则表达式
+        replace (callable): 替换函数
+        text (str): 笔记内容
+
+    Returns:
+        str: 替换后的内容
+    """
+    output = []
+    prose = []
+    fence = None
+
+    def flush_prose():
+        chunk = "".join(prose)
+        prose.clear()
+        position = 0
+        for match in CODE_SPAN_PATTERN.finditer(chunk):
+            output.append(pattern.sub(replace, chunk[position:match.start()]))
+            output.append(match.group(0))
+            position = match.end()
+        output.append(pattern.sub(replace, chunk[position:]))
+
+    for line in text.splitlines(keepends=True):
+        fence_match = CODE_FENCE_PATTERN.match(line)
+        if fence is not None:
+            if (fence_match and fence_match.group(1)[0] == fence[0]
+                    and len(fence_match.group(1)) >= len(fence)
+                    and not line.strip(fence[0] + " \t\r\n")):
+                fence = None
+            output.append(line)
+        elif fence_match:
+            flush_prose()
+            fence = fence_match.group(1)
+            output.append(line)
+        else:
+            prose.append(line)
+    flush_prose()
+
+    return "".join(output)
+
+
+def strip_note_metadata(text):
+    """
+    去掉笔记开头的frontmatter和扫描窗口内的元数据行（如 "> Tag:"），它们只用于分组，不应出现在书中
+
+    Args:
+        text (str): 笔记内容
+
+    Returns:
+        str: 去掉元数据后的内容（frontmatter没有结束标记时保持原样）
+    """
+    lines = text.lstrip('\ufeff').splitlines(keepends=True)
+
+    start = 0
+    if lines and lines[0].strip() == "---":
+        for line_no in range(1, len(lines)):
+            if lines[line_no].strip() in ("---", "..."):
+                start = line_no + 1
+                break
+
+    # 与 scan_metadata_header 相同的扫描窗口（从文件第一行算起）
+    window = len(lines) if METADATA_HEADER_LINES is None else METADATA_HEADER_LINES
+    prefixes = tuple(METADATA_PREFIXES.values())
+    return "".join(line for line_no, line in enumerate(lines[start:], start)
+                   if line_no >= window or not line.lstrip().startswith(prefixes))
+
+
+def iter_markdown_headings(lines):
+    """
+    遍历笔记中的ATX和setext标题（跳过代码块）
+
+    Args:
+        lines (list): 笔记内容的各行
+
+    Yields:
+        tuple: (标题文字所在行号, 去掉标记后的标题文字)
+    """
+    fence = None
+    paragraph_line = False
+
+    for line_no, line in enumerate(lines):
+        fence_match = CODE_FENCE_PATTERN.match(line)
+        if fence is not None:
+            if (fence_match and fence_match.group(1)[0] == fence[0]
+                    and len(fence_match.group(1)) >= len(fence)
+                    and not line.strip(fence[0] + " \t\r\n")):
+                fence = None
+            continue
+        if fence_match:
+            fence = fence_match.group(1)
+            paragraph_line = False
+            continue
+
+        heading_match = ATX_HEADING_PATTERN.match(line)
+        if heading_match:
+            title = ATX_CLOSING_PATTERN.sub("", line[heading_match.end():].strip()).strip()
+            if title:
+                yield line_no, title
+            paragraph_line = False
+        elif SETEXT_UNDERLINE_PATTERN.match(line) and paragraph_line:
+            yield line_no - 1, lines[line_no - 1].strip()
+            paragraph_line = False
+        else:
+            paragraph_line = (bool(line.strip()) and not line.startswith(("    ", "\t"))
+                              and not PARAGRAPH_START_PATTERN.match(line))
+
+
+def heading_key(title):
+    """
+    规范化标题文字，用于匹配 [[笔记#标题]] 中的标题（忽略大小写和多余空白）
+
+    Args:
+        title (str): 标题文字
+
+    Returns:
+        str: 规范化后的标题
+    """
+    return " ".join(title.split()).casefold()
+
+
+def heading_anchor_id(note_anchor, title):
+    """
+    生成笔记中标题的锚点ID（由笔记锚点和规范化的标题决定，与Pandoc自动生成的ID互不冲突）
+
+    Args:
+        note_anchor (str): 笔记锚点ID（见 note_anchor_id）
+        title (str): 标题文字
+
+    Returns:
+        str: 形如 "note-1a2b3c4d5e6f-h-1a2b3c4d" 的ID
+    """
+    return f"{note_anchor}-h-" + hashlib.sha1(heading_key(title).encode('utf-8')).hexdigest()[:8]
+
+
+def add_heading_anchors(text, note_anchor):
+    """
+    给笔记中的标题加上 {#锚点} 属性，供 [[笔记#标题]] 链接跳转
+
+    已经带有属性的标题保持不变；同名标题只有第一个获得锚点（与Obsidian的跳转行为一致）。
+
+    Args:
+        text (str): 笔记内容
+        note_anchor (str): 笔记锚点ID
+
+    Returns:
+        str: 改写后的内容
+    """
+    lines = text.splitlines(keepends=True)
+    used_ids = set()
+
+    for line_no, title in list(iter_markdown_headings(lines)):
+        if HEADING_ATTRIBUTES_PATTERN.search(title):
+            continue
+        anchor_id = heading_anchor_id(note_anchor, title)
+        if anchor_id in used_ids:
+            continue
+        used_ids.add(anchor_id)
+        line = lines[line_no]
+        content = line.rstrip("\r\n")
+        lines[line_no] = f"{content.rstrip()} {{#{anchor_id}}}{line[len(content):]}"
+
+    return "".join(lines)
+
+
+@lru_cache(maxsize=4096)
+def read_note_heading_keys(path_str, mtime_ns, size):
+    """
+    读取笔记中可以被链接的标题（按路径、修改时间和大小缓存）
+
+    Args:
+        path_str (str): 笔记路径
+        mtime_ns (int): 修改时间（参与缓存键）
+        size (int): 文件大小（参与缓存键）
+
+    Returns:
+        frozenset: 规范化后的标题集合（见 heading_key）
+    """
+    try:
+        with open(path_str, encoding='utf-8') as f:
+            lines = f.read().splitlines(keepends=True)
+    except (OSError, UnicodeDecodeError):
+        return frozenset()
+    return frozenset(heading_key(title) for _, title in iter_markdown_headings(lines)
+                     if not HEADING_ATTRIBUTES_PATTERN.search(title))
+
+
+def note_heading_keys(note_path):
+    """
+    获取笔记中可以被 [[笔记#标题]] 链接的标题
+
+    Args:
+        note_path (Path): 笔记路径
+
+    Returns:
+        frozenset: 规范化后的标题集合，笔记无法读取时为空
+    """
+    try:
+        stat = note_path.stat()
+    except OSError:
+        return frozenset()
+    return read_note_heading_keys(str(note_path), stat.st_mtime_ns, stat.st_size)
+
+
+def shift_markdown_headings(text, shift):
+    """
+    把笔记中的标题整体下移若干级（最多到6级），setext标题改写为ATX标题，代码块内容保持不变
+
+    Args:
+        text (str): 笔记内容
+        shift (int): 下移的级数
+
+    Returns:
+        str: 改写后的内容
+    """
+    output = []
+    fence = None
+    paragraph_line = False
+
+    for line in text.splitlines(keepends=True):
+        fence_match = CODE_FENCE_PATTERN.match(line)
+        if fence is not None:
+            # 代码块内：只寻找与开始标记相同字符、长度不短于它的结束标记
+            if (fence_match and fence_match.group(1)[0] == fence[0]
+                    and len(fence_match.group(1)) >= len(fence)
+                    and not line.strip(fence[0] + " \t\r\n")):
+                fence = None
+            output.append(line)
+            continue
+        if fence_match:
+            fence = fence_match.group(1)
+            paragraph_line = False
+            output.append(line)
+            continue
+
+        heading_match = ATX_HEADING_PATTERN.match(line)
+        underline_match = SETEXT_UNDERLINE_PATTERN.match(line)
+        if heading_match:
+            level = min(len(heading_match.group(2)) + shift, 6)
+            line = heading_match.group(1) + "#" * level + line[heading_match.end():]
+            paragraph_line = False
+        elif underline_match and paragraph_line:
+            level = min((1 if underline_match.group(1)[0] == "=" else 2) + shift, 6)
+            output[-1] = f"{'#' * level} {output[-1].strip()}\n"
+            paragraph_line = False
+            continue
+        else:
+            paragraph_line = (bool(line.strip()) and not line.startswith(("    ", "\t"))
+                              and not PARAGRAPH_START_PATTERN.match(line))
+        output.append(line)
+
+    return "".join(output)
+
+
+def escape_markdown(text):
+    """
+    转义markdown中有特殊含义的字符
+
+    Args:
+        text (str): 原始文本
+
+    Returns:
+        str: 转义后的文本
+    """
+    return MARKDOWN_ESCAPE_PATTERN.sub(r'\\\1', text)
+
+
+def iter_chapter_headings(chapters):
+    """
+    遍历有笔记（或去重后的笔记链接）的章节，并给出每个章节前需要插入的标签标题
+
+    与上一章节相同的上级标签不再重复；超过 TAG_HEADING_LEVELS 的层级合并为最后一级标题
+    （如 "C / D"）。锚点ID由标签路径生成，重复时加上序号。
+
+    Args:
+        chapters (list): 按输出顺序排列的章节列表（没有levels的章节不插入标题）
+
+    Yields:
+        tuple: (章节, [(标题级别, 标题文字, 锚点ID), ...])
+    """
+    previous = []
+    used_ids = set()
+
+    for chapter in chapters:
+        if not chapter["files"] and not chapter.get("links"):
+            continue
+
+        levels = chapter.get("levels") or []
+        current = list(levels[:TAG_HEADING_LEVELS - 1])
+        if len(levels) >= TAG_HEADING_LEVELS:
+            current.append(" / ".join(levels[TAG_HEADING_LEVELS - 1:]))
+
+        common = 0
+        while (common < min(len(current), len(previous))
+               and current[common] == previous[common]):
+            common += 1
+        if current and current != previous:
+            # 父标签出现在子标签之后时，至少重新插入本章节自己的标题
+            common = min(common, len(current) - 1)
+
+        headings = []
+        for depth in range(common + 1, len(current) + 1):
+            base_id = "tag-" + hashlib.sha1(
+                "\0".join(current[:depth]).encode('utf-8')).hexdigest()[:10]
+            anchor_id = base_id
+            suffix = 1
+            while anchor_id in used_ids:
+                suffix += 1
+                anchor_id = f"{base_id}-{suffix}"
+            used_ids.add(anchor_id)
+            headings.append((depth, current[depth - 1], anchor_id))
+
+        previous = current
+        yield chapter, headings
+
+
+def preprocess_note(note_bytes, note_path, cache_dir, link_context=None):
+    """
+    渲染前预处理笔记内容：去掉frontmatter和元数据行、改写图片嵌入和笔记链接、插入笔记和标题锚点
+
+    Args:
+        note_bytes (bytes): 笔记原始内容
+        note_path (Path): 笔记路径
+        cache_dir (Path): 渲染缓存目录（图片缓存位于其同级目录）
+        link_context (dict): 所在书的链接上下文，提供时改写 [[链接]]，在开头插入笔记锚点并给标题加锚点
+
+    Returns:
+        bytes: 预处理后的内容
+    """
+    try:
+        text = note_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return note_bytes
+
+    text = strip_note_metadata(text)
+
+    if "![" in text:
+        image_cache_dir = cache_dir.parent / IMAGE_CACHE_DIRNAME
+        text = rewrite_note_embeds(text, note_path, image_cache_dir)
+
+    if link_context is not None:
+        if "[[" in text:
+            text = rewrite_note_links(text, link_context)
+        anchor_id = link_context["anchors"].get(note_path)
+        if anchor_id is not None:
+            text = f"[]{{#{anchor_id}}}\n\n{add_heading_anchors(text, anchor_id)}"
+
+    return text.encode('utf-8')
+
+
+def render_note(file_path, cache_dir, to_format="json", link_context=None):
+    """
+    渲染单篇笔记并写入内容寻址的渲染缓存，缓存命中时不调用Pandoc
+
+    Args:
+        file_path (Path): 笔记路径
+        cache_dir (Path): 渲染缓存目录
+        to_format (str): Pandoc输出格式，默认为JSON AST
+        link_context (dict): 所在书的链接上下文（见 build_link_context）
+
+    Returns:
+        tuple: (缓存文件路径, 是否命中缓存)
+    """
+    with open(file_path, 'rb') as f:
+        note_bytes = preprocess_note(f.read(), file_path, cache_dir, link_context)
+
+    # 缓存键：预处理后的笔记内容 + 转换参数 + Pandoc版本
+    hasher = hashlib.sha1()
+    for part in (get_pandoc_version() or "", PANDOC_READER_FORMAT, to_format):
+        hasher.update(part.encode('utf-8'))
+        hasher.update(b'\0')
+    hasher.update(note_bytes)
+    cache_key = hasher.hexdigest()
+
+    cache_path = cache_dir / cache_key[:2] / f"{cache_key}.{to_format}"
+    if cache_path.exists():
+        # 更新修改时间，记录最近使用（见 prune_render_cache）
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return cache_path, True
+
+    output = pandoc_convert(note_bytes, PANDOC_READER_FORMAT, to_format,
+                            timeout=300, label=str(file_path))
+
+    # 先写临时文件再替换，避免并发或中断产生不完整的缓存
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(
+        f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(output)
+    os.replace(tmp_path, cache_path)
+
+    return cache_path, False
+
+
+def prune_render_cache(cache_dir, max_bytes=None):
+    """
+    按最近使用时间淘汰渲染缓存，使总大小不超过上限
+
+    缓存按内容哈希寻址，笔记每次修改都会产生新条目；命中时 render_note 会更新条目的
+    修改时间，因此最久未使用的条目（通常是笔记的旧版本）最先被删除。
+
+    Args:
+        cache_dir (Path): 渲染缓存目录
+        max_bytes (int): 容量上限（字节），默认使用 RENDER_CACHE_MAX_BYTES
+
+    Returns:
+        tuple: (删除的条目数, 释放的字节数)
+    """
+    max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if max_bytes is None or not cache_dir.is_dir():
+        return 0, 0
+
+    entries = []
+    for entry_path in cache_dir.glob("*/*"):
+        try:
+            stat_result = entry_path.stat()
+        except OSError:
+            continue
+        entries.append((stat_result.st_mtime_ns, stat_result.st_size, entry_path))
+
+    # 从最近使用的条目开始保留
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    kept_bytes = 0
+    removed = freed = 0
+    for _, size, entry_path in entries:
+        if kept_bytes + size <= max_bytes:
+            kept_bytes += size
+            continue
+        try:
+            entry_path.unlink()
+        except OSError:
+            continue
+        removed += 1
+        freed += size
+
+    if removed:
+        print(f"🧹 渲染缓存: 淘汰 {removed} 个条目，释放 {freed / (1024 * 1024):.2f} MB")
+    return removed, freed
+
+
+def render_notes(note_paths, cache_dir, jobs=1, to_format="json", link_context=None):
+    """
+    批量渲染笔记，只有缓存未命中的笔记会交给Pandoc
+
+    Args:
+        note_paths (list): 笔记路径列表（可包含重复项）
+        cache_dir (Path): 渲染缓存目录
+        jobs (int): 同时渲染的Pandoc进程数
+        to_format (str): Pandoc输出格式
+        link_context (dict): 所在书的链接上下文（见 build_link_context）
+
+    Returns:
+        dict: 笔记路径 -> 缓存文件路径
+    """
+    unique_paths = list(dict.fromkeys(note_paths))
+
+    def render(file_path):
+        return render_note(file_path, cache_dir, to_format, link_context)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(render, unique_paths))
+    save_image_cache_records(cache_dir.parent / IMAGE_CACHE_DIRNAME)
+
+    cache_hits = sum(hit for _, hit in results)
+    if cache_hits < len(unique_paths):
+        print(f"渲染缓存: 命中 {cache_hits} 篇，重新渲染 {len(unique_paths) - cache_hits} 篇")
+
+    return {file_path: cache_path
+            for file_path, (cache_path, _) in zip(unique_paths, results)}
+
+
+def chapter_note_links(chapter, link_context):
+    """
+    获取章节中去重后在其他章节输出的笔记链接
+
+    Args:
+        chapter (dict): 章节（"links"见 dedupe_chapters）
+        link_context (dict): 书的链接上下文
+
+    Returns:
+        list: [(笔记名, 笔记锚点ID)]，不在本书中的笔记（如已隔离）被忽略
+    """
+    note_links = []
+    for file_path in chapter.get("links", []):
+        anchor_id = link_context["anchors"].get(Path(file_path))
+        if anchor_id is not None:
+            note_links.append((Path(file_path).stem, anchor_id))
+    return note_links
+
+
+def text_inlines(text):
+    """
+    把纯文本转换为Pandoc AST的行内元素列表
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        list: Str/Space 元素列表
+    """
+    inlines = []
+    for word in text.split(" "):
+        if inlines:
+            inlines.append({"t": "Space"})
+        inlines.append({"t": "Str", "c": word})
+    return inlines
+
+
+def shift_ast_headings(node, shift):
+    """
+    递归下移Pandoc AST中所有标题的级别（最多到6级），包括引用块、列表、Div等容器中的标题
+
+    Args:
+        node (list | dict): AST节点或节点列表，原地修改
+        shift (int): 下移的级数
+    """
+    if isinstance(node, list):
+        for child in node:
+            if isinstance(child, (list, dict)):
+                shift_ast_headings(child, shift)
+    elif isinstance(node, dict):
+        if node.get("t") == "Header":
+            node["c"][0] = min(node["c"][0] + shift, 6)
+        content = node.get("c")
+        if isinstance(content, (list, dict)):
+            shift_ast_headings(content, shift)
+
+
+def write_combined_ast(chapters, rendered_notes, output_file, heading_shift=0,
+                       link_context=None):
+    """
+    把多篇笔记的缓存AST按章节顺序拼接成一个Pandoc JSON文档（逐篇流式写入），
+    并在各章节前插入标签标题；去重后的笔记在其他章节输出为指向规范位置的链接列表
+
+    Args:
+        chapters (list): 按输出顺序排列的章节列表（见 iter_chapter_headings）
+        rendered_notes (dict): 笔记路径 -> 缓存文件路径
+        output_file (file): 以文本模式打开的输出文件
+        heading_shift (int): 笔记自身标题下移的级数
+        link_context (dict): 书的链接上下文，用于生成去重笔记的链接
+    """
+    first_block = True
+
+    def write_block(block):
+        nonlocal first_block
+        if not first_block:
+            output_file.write(',')
+        json.dump(block, output_file, ensure_ascii=False, separators=(',', ':'))
+        first_block = False
+
+    # API版本取自任一缓存的AST（同一次构建的缓存来自同一Pandoc版本）；
+    # 没有笔记（只有标签标题和链接）时由Pandoc转换一个空文档得到
+    api_version = None
+    for cache_path in rendered_notes.values():
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            api_version = json.load(f)["pandoc-api-version"]
+        break
+    if api_version is None:
+        empty_document = pandoc_convert(b"", PANDOC_READER_FORMAT, "json", timeout=60,
+                                        label="pandoc-api-version")
+        api_version = json.loads(empty_document)["pandoc-api-version"]
+    output_file.write('{"pandoc-api-version":')
+    json.dump(api_version, output_file)
+    output_file.write(',"meta":{},"blocks":[')
+
+    for chapter, headings in iter_chapter_headings(chapters):
+        for level, title, anchor_id in headings:
+            write_block({"t": "Header", "c": [level, [anchor_id, [], []], text_inlines(title)]})
+
+        if link_context is not None:
+            note_links = chapter_note_links(chapter, link_context)
+            if note_links:
+                write_block({"t": "BulletList", "c": [
+                    [{"t": "Plain", "c": [{"t": "Link", "c": [
+                        ["", [], []], text_inlines(label), [f"#{anchor_id}", ""]]}]}]
+                    for label, anchor_id in note_links]})
+
+        for file_path in chapter["files"]:
+            with open(rendered_notes[Path(file_path)], 'r', encoding='utf-8') as f:
+                data = f.read()
+            document = json.loads(data)
+
+            # 没有标题的笔记无需遍历整个AST
+            if heading_shift and '"Header"' in data:
+                shift_ast_headings(document["blocks"], heading_shift)
+            for block in document["blocks"]:
+                write_block(block)
+
+    output_file.write(']}')
+
+
+def iter_pandoc_markdown(chapters, cache_dir, link_context, heading_shift=0):
+    """
+    逐篇生成交给Pandoc标准输入的markdown文档：标签标题 + 去重笔记的链接列表 + 预处理后的笔记
+
+    Args:
+        chapters (list): 按输出顺序排列的章节列表（见 iter_chapter_headings）
+        cache_dir (Path): 渲染缓存目录（图片缓存位于其同级目录）
+        link_context (dict): 书的链接上下文
+        heading_shift (int): 笔记自身标题下移的级数
+
+    Yields:
+        str: 文档片段
+    """
+    for chapter, headings in iter_chapter_headings(chapters):
+        for level, title, anchor_id in headings:
+            yield f"{'#' * level} {escape_markdown(title)} {{#{anchor_id}}}\n\n"
+
+        note_links = chapter_note_links(chapter, link_context)
+        if note_links:
+            yield "".join(f"- [{escape_markdown(label)}](#{anchor_id})\n"
+                          for label, anchor_id in note_links)
+            yield "\n"
+
+        for file_path in chapter["files"]:
+            note_path = Path(file_path)
+            with open(note_path, 'rb') as f:
+                note_bytes = preprocess_note(f.read(), note_path, cache_dir, link_context)
+            text = note_bytes.decode('utf-8', 'replace')
+            if heading_shift:
+                text = shift_markdown_headings(text, heading_shift)
+            yield text
+            yield "\n\n"
+
+
+def run_pandoc_build(note_paths, output_path, title, timeout, jobs=1, link_context=None,
+                     chapters=None):
+    """
+    调用Pandoc把一组笔记构建为EPUB
+
+    启用渲染缓存时，先确保每篇笔记都有缓存的AST，再把拼接后的AST交给Pandoc
+    生成EPUB；否则把预处理后的笔记拼接成一个markdown文档流式写入Pandoc的标准输入
+    （不再通过命令行传递文件路径）。提供章节时在笔记前插入标签标题，目录由标签层级生成。
+
+    Args:
+        note_paths (list): 按输出顺序排列的笔记路径
+        output_path (Path): 输出文件路径
+        title (str): 书名
+        timeout (int): 超时时间（秒）
+        jobs (int): 渲染缓存未命中时同时渲染的Pandoc进程数
+        link_context (dict): 书的链接上下文，默认把书中的全部笔记视为链接目标
+        chapters (list): 按输出顺序排列的章节（其files与note_paths顺序一致），
+            None表示不插入标签标题
+
+    Returns:
+        subprocess.CompletedProcess: Pandoc的执行结果
+    """
+    cache_dir = output_path.parent / RENDER_CACHE_DIRNAME
+    if link_context is None:
+        link_context = build_link_context(note_paths)
+
+    heading_shift = TAG_HEADING_LEVELS if chapters is not None else 0
+    if chapters is None:
+        chapters = [{"files": note_paths}]
+
+    if not RENDER_CACHE_ENABLED:
+        pandoc_cmd = [
+            PANDOC_BINARY,
+            # 输出文件（输入从标准输入读取）
+            "-o", str(output_path),
+            *build_pandoc_options(title),
+        ]
+        try:
+            return run_pandoc(pandoc_cmd, timeout=timeout, text=True, label=output_path.name,
+                              input=iter_pandoc_markdown(chapters, cache_dir, link_context,
+                                                         heading_shift),
+                              input_bytes=estimate_input_size([(file_path, None, None)
+                                                               for file_path in note_paths]))
+        finally:
+            save_image_cache_records(cache_dir.parent / IMAGE_CACHE_DIRNAME)
+
+    rendered_notes = render_notes(note_paths, cache_dir, jobs, link_context=link_context)
+
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix=".json",
+                                     dir=output_path.parent, delete=False) as f:
+        combined_path = Path(f.name)
+        write_combined_ast(chapters, rendered_notes, f, heading_shift, link_context)
+
+    try:
+        pandoc_cmd = [
+            PANDOC_BINARY,
+            str(combined_path),
+            "-o", str(output_path),
+            *build_pandoc_options(title, from_format="json"),
+        ]
+        return run_pandoc(pandoc_cmd, timeout=timeout, text=True, label=output_path.name,
+                          input_bytes=combined_path.stat().st_size)
+    finally:
+        combined_path.unlink()
+
+
+class XhtmlFragmentParser(HTMLParser):
+    """把HTML片段重新序列化为格式良好的XHTML（见 xhtml_fragment）"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+
+    def start_tag(self, tag, attrs, self_closing):
+        attributes = {}
+        for name, value in attrs:
+            if XML_NAME_PATTERN.match(name) and name not in attributes:
+                attributes[name] = name if value is None else value
+        attribute_text = "".join(f" {name}={quoteattr(value)}"
+                                 for name, value in attributes.items())
+        if self_closing or tag in HTML_VOID_ELEMENTS:
+            self.parts.append(f"<{tag}{attribute_text}/>")
+        else:
+            self.parts.append(f"<{tag}{attribute_text}>")
+            self.open_tags.append(tag)
+
+    def handle_starttag(self, tag, attrs):
+        if not XML_NAME_PATTERN.match(tag):
+            return
+        # HTML中新段落会隐式结束上一个段落
+        if tag == "p" and self.open_tags and self.open_tags[-1] == "p":
+            self.handle_endtag("p")
+        self.start_tag(tag, attrs, False)
+
+    def handle_startendtag(self, tag, attrs):
+        if XML_NAME_PATTERN.match(tag):
+            self.start_tag(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        # 忽略没有对应开始标签的结束标签；中间未闭合的元素一并闭合
+        if tag not in self.open_tags:
+            return
+        while True:
+            open_tag = self.open_tags.pop()
+            self.parts.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        self.parts.append(escape(data))
+
+    def handle_comment(self, data):
+        self.parts.append(f"<!--{data.replace('--', '- -')}-->")
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.parts.append(f"</{self.open_tags.pop()}>")
+
+
+def xhtml_fragment(fragment):
+    """
+    把Pandoc输出的HTML片段转换为格式良好的XHTML
+
+    笔记中的原始HTML会原样出现在片段中（如 <br>、未闭合的 <p>、&nbsp;），直接写入
+    .xhtml 文件会被严格的阅读器拒绝。这里用HTML解析器重新序列化：空元素自闭合、
+    未闭合的元素补上结束标签、多余的结束标签和非法属性被丢弃、实体转换为字符。
+
+    Args:
+        fragment (str): HTML片段
+
+    Returns:
+        str: XHTML片段
+    """
+    parser = XhtmlFragmentParser()
+    parser.feed(fragment)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def is_well_formed_xml(document):
+    """
+    检查文档是否为格式良好的XML
+
+    Args:
+        document (str): XML文档
+
+    Returns:
+        bool: 能否被XML解析器解析
+    """
+    try:
+        ET.fromstring(document.encode('utf-8'))
+    except ET.ParseError:
+        return False
+    return True
+
+
+def xhtml_page(title, body):
+    """
+    生成EPUB内容页（XHTML）
+
+    Args:
+        title (str): 页面标题
+        body (str): body内的HTML内容
+
+    Returns:
+        str: XHTML文档
+    """
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" '
+        'xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="zh-CN" lang="zh-CN">\n'
+        '<head>\n'
+        '<meta charset="utf-8"/>\n'
+        f'<title>{escape(title)}</title>\n'
+        '<link rel="stylesheet" type="text/css" href="../styles/stylesheet.css"/>\n'
+        '</head>\n'
+        f'<body>\n{body}\n</body>\n'
+        '</html>\n'
+    )
+
+
+def write_collection_epub(chapters, output_path, title, jobs=1):
+    """
+    使用内置写入器流式生成完整合集EPUB
+
+    每篇笔记单独交给Pandoc转换为HTML片段（使用渲染缓存），重新序列化为XHTML后逐篇写入zip；
+    OPF、导航文档和NCX目录根据章节结构生成。内存占用只与单篇笔记大小有关。
+    任一页面无法生成格式良好的XHTML时放弃生成（不留下输出文件），由调用方改用Pandoc写入器。
+
+    Args:
+        chapters (list): 按输出顺序排列的章节列表
+        output_path (Path): 输出文件路径
+        title (str): 书名
+        jobs (int): 同时转换笔记的Pandoc进程数
+
+    Returns:
+        int: 写入的笔记页数；有页面不是格式良好的XHTML时返回None
+    """
+    cache_dir = output_path.parent / RENDER_CACHE_DIRNAME
+    note_paths = [Path(file_path) for chapter in chapters for file_path in chapter["files"]]
+    link_context = build_link_context(note_paths)
+    rendered_notes = render_notes(note_paths, cache_dir, jobs, to_format="html5",
+                                  link_context=link_context)
+
+    # 笔记锚点 -> 笔记首次出现的页面，用于把片段内的 #note-xxx 链接改写为跨页面链接
+    anchor_pages = {}
+    for page_number, note_path in enumerate(note_paths, 1):
+        anchor_pages.setdefault(link_context["anchors"][note_path], f"n{page_number:06d}.xhtml")
+
+    book_id = "urn:uuid:" + str(uuid.uuid5(uuid.NAMESPACE_URL, output_path.name))
+    manifest_items = [
+        ("nav", "nav.xhtml", "application/xhtml+xml", ["nav"]),
+        ("ncx", "toc.ncx", "application/x-dtbncx+xml", []),
+        ("stylesheet", "styles/stylesheet.css", "text/css", []),
+    ]
+    spine_items = [("nav", "yes")]
+    toc_nodes = []
+    level_nodes = {}
+    images = {}
+    page_count = 0
+
+    def note_page_href(note_path):
+        anchor_id = link_context["anchors"].get(note_path)
+        if anchor_id not in anchor_pages:
+            return None
+        return f"{anchor_pages[anchor_id]}#{anchor_id}"
+
+    def add_page(output_zip, page_id, page_title, body):
+        href = f"text/{page_id}.xhtml"
+        page = xhtml_page(page_title, body)
+        if not is_well_formed_xml(page):
+            raise ValueError(f"{page_title} 无法生成格式良好的XHTML")
+        output_zip.writestr(f"OEBPS/{href}", page, compress_type=zipfile.ZIP_DEFLATED)
+        manifest_items.append((page_id, href, "application/xhtml+xml", []))
+        spine_items.append((page_id, "yes"))
+        return href
+
+    def embed_image(output_zip, note_path, match):
+        image_path = resolve_attachment(match.group(2), note_path)
+        if image_path is None:
+            return match.group(0)
+
+        key = str(image_path.resolve())
+        if key not in images:
+            image_id = f"img{len(images) + 1:05d}"
+            image_href = f"media/{image_id}{image_path.suffix.lower()}"
+            media_type = mimetypes.guess_type(image_path.name)[0] or "application/octet-stream"
+            output_zip.write(image_path, f"OEBPS/{image_href}",
+                             compress_type=zipfile.ZIP_STORED)
+            manifest_items.append((image_id, image_href, media_type, []))
+            images[key] = image_href
+
+        return f"{match.group(1)}../{images[key]}{match.group(3)}"
+
+    tmp_path = output_path.with_suffix(".tmp")
+    try:
+        with zipfile.ZipFile(tmp_path, "w") as output_zip:
+            write_epub_skeleton(output_zip)
+            output_zip.writestr("OEBPS/styles/stylesheet.css", EPUB_STYLESHEET,
+                                compress_type=zipfile.ZIP_DEFLATED)
+
+            for chapter_number, chapter in enumerate(chapters, 1):
+                levels = chapter["levels"]
+
+                # 标签层级对应的标题页和目录节点
+                heading_level = min(len(levels), 6)
+                # 去重后在其他章节输出的笔记只在标题页和目录中保留链接
+                linked_notes = [(Path(file_path).stem, note_page_href(Path(file_path)))
+                                for file_path in chapter.get("links", [])]
+                see_also = "".join(f'<li><a href="{href}">{escape(label)}</a></li>'
+                                   for label, href in linked_notes if href)
+                if see_also:
+                    see_also = f'<ul class="see-also">{see_also}</ul>'
+                chapter_href = add_page(
+                    output_zip, f"c{chapter_number:05d}", levels[-1],
+                    f'<section epub:type="chapter"><h{heading_level}>{escape(levels[-1])}'
+                    f'</h{heading_level}>{see_also}</section>')
+
+                parent_children = toc_nodes
+                for depth in range(1, len(levels) + 1):
+                    key = tuple(levels[:depth])
+                    node = level_nodes.get(key)
+                    if node is None:
+                        node = {"label": levels[depth - 1], "href": None, "children": []}
+                        level_nodes[key] = node
+                        parent_children.append(node)
+                    parent_children = node["children"]
+                level_nodes[tuple(levels)]["href"] = chapter_href
+                for label, href in linked_notes:
+                    if href:
+                        parent_children.append(
+                            {"label": label, "href": f"text/{href}", "children": []})
+
+                # 逐篇写入笔记
+                for file_path in chapter["files"]:
+                    note_path = Path(file_path)
+                    with open(rendered_notes[note_path], 'r', encoding='utf-8') as f:
+                        fragment = xhtml_fragment(f.read())
+                    fragment = IMG_SRC_PATTERN.sub(
+                        lambda match: embed_image(output_zip, note_path, match), fragment)
+                    fragment = NOTE_HREF_PATTERN.sub(
+                        lambda match: f'href="{anchor_pages[match.group(1)]}#'
+                                      f'{match.group(1)}{match.group(2) or ""}"'
+                        if match.group(1) in anchor_pages else match.group(0), fragment)
+
+                    page_count += 1
+                    note_href = add_page(output_zip, f"n{page_count:06d}", note_path.stem,
+                                         f"<section>\n{fragment}\n</section>")
+                    parent_children.append({"label": note_path.stem, "href": note_href, "children": []})
+
+            output_zip.writestr("OEBPS/nav.xhtml", build_nav_document(title, toc_nodes),
+                                compress_type=zipfile.ZIP_DEFLATED)
+            output_zip.writestr("OEBPS/toc.ncx", build_ncx_document(title, book_id, toc_nodes),
+                                compress_type=zipfile.ZIP_DEFLATED)
+            output_zip.writestr("OEBPS/content.opf",
+                                build_opf_document(title, book_id, manifest_items, spine_items),
+                                compress_type=zipfile.ZIP_DEFLATED)
+    except ValueError as e:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        print(f"⚠️  内置写入器无法完成: {e}")
+        return None
+    except BaseException:
+        # 生成失败时删除不完整的临时文件
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+    tmp_path.replace(output_path)
+    return page_count
+
+
+def generate_epub(sorted_files, output_path, metadata_type, chapter_structure=None, jobs=1):
+    """
+    生成完整EPUB文件
+
+    Args:
+        sorted_files (list): 排序后的文件列表
+        output_path (Path): 输出文件路径
+        metadata_type (str): "tag" 或 "category"
+        chapter_structure (dict): 章节结构，提供且 COLLECTION_EPUB_WRITER 为 "native" 时
+            使用内置写入器生成，否则由Pandoc一次性渲染（按章节插入标签标题）
+        jobs (int): 同时渲染笔记的Pandoc进程数
+
+    Returns:
+        bool: 是否成功生成
     """
     if not sorted_files:
         print("错误：没有文件需要导出")
@@ -364,51 +3541,33 @@ def generate_epub(sorted_files, output_path, metadata_type):
         # 确保输出目录存在
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 准备Pandoc命令
-        file_paths = [str(file_path) for file_path, _, _ in sorted_files]
-
         field_name = "标签" if metadata_type == "tag" else "分类"
         title = f"Obsidian导出合集（按{field_name}自动层级版）"
 
-        pandoc_cmd = [
-            "pandoc",
-            # 输入文件
-            *file_paths,
-            # 输出格式和文件
-            "-o", str(output_path),
-            # EPUB相关选项
-            "--to=epub3",
-            "--epub-metadata=metadata.xml" if Path(
-                "metadata.xml").exists() else None,
-            # 目录选项
-            "--toc",
-            "--toc-depth=3",  # 增加目录深度以适应层级结构
-            # 跳过YAML frontmatter解析，避免格式错误
-            "--from=markdown-yaml_metadata_block",
-            # 资源路径（让Pandoc能找到图片等资源）
-            f"--resource-path={VAULT_PATH.absolute()}",
-            # 标题和作者信息
-            f"--metadata=title:{title}",
-            "--metadata=author:知识整理者",
-            f"--metadata=date:{datetime.now().strftime('%Y-%m-%d')}",
-            # 中文支持
-            "--variable=lang:zh-CN",
-        ]
-
-        # 过滤掉None值
-        pandoc_cmd = [arg for arg in pandoc_cmd if arg is not None]
+        # 准备输入文件（跳过隔离中的笔记）
+        quarantined = active_quarantine(output_path.parent) if FAILURE_ISOLATION else set()
+        note_paths = [file_path for file_path, _, _ in sorted_files
+                      if Path(file_path) not in quarantined]
+        if chapter_structure is not None:
+            chapter_structure = dict(chapter_structure, chapters=exclude_quarantined(
+                chapter_structure["chapters"], quarantined, output_path.name))
 
         print(f"\n正在生成EPUB文件...")
         print(f"输出路径: {output_path.absolute()}")
-        print(f"处理文件数: {len(file_paths)}")
+        print(f"处理文件数: {len(note_paths)}")
+
+        if COLLECTION_EPUB_WRITER == "native" and chapter_structure is not None:
+            if write_collection_epub(chapter_structure["chapters"], output_path, title,
+                                     jobs=jobs) is not None:
+                print("✅ EPUB文件生成成功!")
+                return True
+            print("改用Pandoc写入器重新生成...")
 
         # 执行Pandoc命令
-        result = subprocess.run(
-            pandoc_cmd,
-            capture_output=True,
-            text=True,
-            timeout=900  # 15分钟超时
-        )
+        result = run_pandoc_build(
+            note_paths, output_path, title,
+            timeout=900, jobs=jobs,  # 15分钟超时
+            chapters=chapter_structure["chapters"] if chapter_structure is not None else None)
 
         if result.returncode == 0:
             print("✅ EPUB文件生成成功!")
@@ -426,35 +3585,341 @@ def generate_epub(sorted_files, output_path, metadata_type):
         return False
 
 
-def generate_epub_by_chapters(chapter_structure, output_dir, metadata_type):
+def build_tag_trie(chapters):
+    """
+    由章节列表（其levels来自parse_hierarchy）构建标签树，支持任意层级深度
+
+    节点为字典：{"name", "item", "chapter", "files", "children"}，其中 "chapter" 为
+    该标签对应的章节（没有直接使用该标签的笔记时为None），"files" 为直接带有该标签的
+    笔记，"children" 为按章节顺序排列的子节点（名称 -> 节点）。
+
+    Args:
+        chapters (list): 按顺序排列的章节列表
+
+    Returns:
+        dict: 根节点
+    """
+    root = {"name": "", "item": "#", "chapter": None, "files": [], "children": {}}
+    for chapter in chapters:
+        node = root
+        for level in chapter["levels"]:
+            child = node["children"].get(level)
+            if child is None:
+                item = f"{node['item']}/{level}" if node is not root else f"#{level}"
+                child = {"name": level, "item": item, "chapter": None, "files": [],
+                         "children": {}}
+                node["children"][level] = child
+            node = child
+        node["chapter"] = chapter
+        node["files"] = chapter["files"]
+    return root
+
+
+def find_trie_node(tag_trie, item):
+    """
+    按标签前缀查找标签树节点，如 "#1-个人成长/1-内在建设"
+
+    Args:
+        tag_trie (dict): 根节点
+        item (str): 标签（可省略开头的#）
+
+    Returns:
+        dict: 节点，不存在时返回None
+    """
+    node = tag_trie
+    for level in item.lstrip("#").split("/"):
+        node = node["children"].get(level)
+        if node is None:
+            return None
+    return node
+
+
+def trie_subtree_files(node):
+    """
+    获取节点及其所有子节点下的笔记集合（结果缓存在节点上）
+
+    Args:
+        node (dict): 标签树节点
+
+    Returns:
+        set: 笔记路径集合
+    """
+    subtree_files = node.get("subtree_files")
+    if subtree_files is None:
+        subtree_files = set(node["files"])
+        for child in node["children"].values():
+            subtree_files |= trie_subtree_files(child)
+        node["subtree_files"] = subtree_files
+    return subtree_files
+
+
+def iter_trie_chapters(node):
+    """
+    按章节顺序（先序遍历）产出节点及其子节点对应的章节
+
+    Args:
+        node (dict): 标签树节点
+
+    Yields:
+        dict: 章节
+    """
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        if current["chapter"] is not None:
+            yield current["chapter"]
+        pending.extend(reversed(list(current["children"].values())))
+
+
+def group_chapters_by_level1(chapter_structure, tag_trie=None):
+    """
+    按一级目录对章节分组
+
+    Args:
+        chapter_structure (dict): 章节结构
+        tag_trie (dict): 已构建的标签树，未提供时由章节结构构建
+
+    Returns:
+        dict: 以一级目录为键、章节列表为值的字典（保持章节顺序）
+    """
+    if tag_trie is None:
+        tag_trie = build_tag_trie(chapter_structure["chapters"])
+    return {name: list(iter_trie_chapters(node)) for name, node in tag_trie["children"].items()}
+
+
+def volume_budget_enabled(volume_budget):
+    """
+    判断分卷预算是否设置了任一限制
+
+    Args:
+        volume_budget (dict): {"bytes", "notes", "seconds"} 预算，值为None表示不限制
+
+    Returns:
+        bool: 是否需要分卷
+    """
+    return bool(volume_budget) and any(limit is not None for limit in volume_budget.values())
+
+
+def estimate_volume_cost(file_paths, file_sizes):
+    """
+    估算一组笔记的体积、篇数和渲染时间
+
+    Args:
+        file_paths (set): 笔记路径集合（不含重复）
+        file_sizes (dict): 笔记路径 -> 字节数
+
+    Returns:
+        dict: {"bytes", "notes", "seconds"}
+    """
+    total_size = sum(file_sizes.get(file_path, 0) for file_path in file_paths)
+    return {
+        "bytes": total_size,
+        "notes": len(file_paths),
+        "seconds": len(file_paths) * RENDER_SECONDS_PER_NOTE + total_size / RENDER_BYTES_PER_SECOND,
+    }
+
+
+def fits_volume_budget(cost, volume_budget):
+    """
+    判断估算结果是否在预算之内
+
+    Args:
+        cost (dict): estimate_volume_cost 的返回值
+        volume_budget (dict): 分卷预算
+
+    Returns:
+        bool: 是否满足全部限制
+    """
+    return all(limit is None or cost[key] <= limit for key, limit in volume_budget.items())
+
+
+def split_volume_units(node, volume_budget, file_sizes):
+    """
+    把超出预算的标签子树依次在下一级标签边界处拆分，直到满足预算或已是叶子节点
+
+    Args:
+        node (dict): 标签树节点
+        volume_budget (dict): 分卷预算
+        file_sizes (dict): 笔记路径 -> 字节数
+
+    Returns:
+        list: 不可再分的章节序列列表（保持章节顺序）
+    """
+    if not node["children"] or fits_volume_budget(
+            estimate_volume_cost(trie_subtree_files(node), file_sizes), volume_budget):
+        return [list(iter_trie_chapters(node))]
+
+    units = [[node["chapter"]]] if node["chapter"] is not None else []
+    for child in node["children"].values():
+        units.extend(split_volume_units(child, volume_budget, file_sizes))
+    return units
+
+
+def plan_volumes(chapter_structure, volume_budget=None, tag_trie=None):
+    """
+    按预算规划分卷：过大的一级目录在下级标签边界处拆分，相邻的小分组合并为一卷
+
+    未设置预算时与 group_chapters_by_level1 相同，每个一级目录一卷。
+
+    Args:
+        chapter_structure (dict): 章节结构
+        volume_budget (dict): {"bytes", "notes", "seconds"} 预算，值为None表示不限制
+        tag_trie (dict): 已构建的标签树，未提供时由章节结构构建
+
+    Returns:
+        dict: 卷名 -> 章节列表（保持章节顺序）
+    """
+    if tag_trie is None:
+        tag_trie = build_tag_trie(chapter_structure["chapters"])
+    level1_groups = group_chapters_by_level1(chapter_structure, tag_trie)
+    if not volume_budget_enabled(volume_budget):
+        return level1_groups
+
+    file_sizes = {}
+    for chapter in chapter_structure["chapters"]:
+        for file_path in chapter["files"]:
+            if file_path not in file_sizes:
+                try:
+                    file_sizes[file_path] = os.stat(file_path).st_size
+                except OSError:
+                    file_sizes[file_path] = 0
+
+    # 依次装箱：当前卷加入下一个单元后超出预算时另起一卷。
+    # 被拆分的一级目录单独成卷（卷内可合并其相邻的下级标签单元），不与其他目录混合
+    volumes = []
+    current_chapters, current_files = [], set()
+
+    def flush():
+        nonlocal current_chapters, current_files
+        if current_chapters:
+            volumes.append(current_chapters)
+        current_chapters, current_files = [], set()
+
+    for level1_node in tag_trie["children"].values():
+        units = split_volume_units(level1_node, volume_budget, file_sizes)
+        if len(units) > 1:
+            flush()
+        for unit in units:
+            unit_files = {file_path for chapter in unit for file_path in chapter["files"]}
+            if current_chapters and not fits_volume_budget(
+                    estimate_volume_cost(current_files | unit_files, file_sizes), volume_budget):
+                flush()
+            current_chapters = current_chapters + unit
+            current_files = current_files | unit_files
+        if len(units) > 1:
+            flush()
+    flush()
+
+    # 卷名：完整的一级目录沿用原名，被拆分的一级目录加卷号，合并的多个目录用首尾目录名
+    volume_counts = defaultdict(int)
+    for chapters in volumes:
+        volume_counts[chapters[0]["level_1"]] += 1
+
+    planned_volumes = {}
+    part_numbers = defaultdict(int)
+    for chapters in volumes:
+        first_level1, last_level1 = chapters[0]["level_1"], chapters[-1]["level_1"]
+        if first_level1 != last_level1:
+            name = f"{first_level1}～{last_level1}"
+        elif volume_counts[first_level1] > 1:
+            part_numbers[first_level1] += 1
+            name = f"{first_level1} 卷{part_numbers[first_level1]}"
+        else:
+            name = first_level1
+        planned_volumes[name] = chapters
+
+    oversized = [name for name, chapters in planned_volumes.items()
+                 if not fits_volume_budget(estimate_volume_cost(
+                     {file_path for chapter in chapters for file_path in chapter["files"]},
+                     file_sizes), volume_budget)]
+    print(f"分卷: {len(level1_groups)} 个一级目录规划为 {len(planned_volumes)} 卷")
+    if oversized:
+        print(f"⚠️  以下卷只包含单个章节，无法继续拆分，仍超出预算: {', '.join(oversized)}")
+
+    return planned_volumes
+
+
+def estimate_input_size(sorted_files):
+    """
+    估算一组输入文件的总字节数，用于构建任务调度
+
+    Args:
+        sorted_files (list): 排序后的文件列表
+
+    Returns:
+        int: 总字节数（无法访问的文件按0计）
+    """
+    total_size = 0
+    for file_path, _, _ in sorted_files:
+        try:
+            total_size += file_path.stat().st_size
+        except OSError:
+            pass
+    return total_size
+
+
+def volume_output_filename(volume_name, metadata_type):
+    """
+    生成分章节EPUB的文件名（去掉特殊字符）
+
+    Args:
+        volume_name (str): 一级目录或分卷名称
+        metadata_type (str): "tag" 或 "category"
+
+    Returns:
+        str: 文件名
+    """
+    safe_name = volume_name.replace("/", "_").replace("\\", "_").replace(":", "_")
+    return f"Obsidian_{metadata_type}_{safe_name}.epub"
+
+
+def generate_epub_by_chapters(chapter_structure, output_dir, metadata_type, jobs=1, force=False,
+                              only_groups=None, dedupe=False, volume_budget=None, tag_trie=None):
     """
-    按一级目录分别生成多个EPUB文件
+    按一级目录（或按预算规划的分卷）分别生成多个EPUB文件
 
     Args:
         chapter_structure (dict): 章节结构
         output_dir (Path): 输出目录
         metadata_type (str): "tag" 或 "category"
+        jobs (int): 同时运行的pandoc进程数，大于1时按输入大小从大到小调度
+        force (bool): 忽略构建清单，强制重建所有分组
+        only_groups (set): 只处理这些一级目录，None表示处理全部
+        dedupe (bool): 多标签笔记在每个分组中只输出一次
+        volume_budget (dict): 分卷预算（见 plan_volumes），None表示每个一级目录一卷
+        tag_trie (dict): 已构建的标签树，未提供时由章节结构构建
 
     Returns:
         list: 生成的EPUB文件路径列表
     """
-    # 按一级目录分组
-    level1_groups = defaultdict(list)
-
-    for chapter in chapter_structure["chapters"]:
-        level1 = chapter["level_1"]
-        level1_groups[level1].append(chapter)
+    # 按一级目录分组（设置了预算时按分卷规划）
+    all_volumes = plan_volumes(chapter_structure, volume_budget, tag_trie)
+    level1_groups = all_volumes
+    if only_groups is not None:
+        level1_groups = {name: chapters for name, chapters in all_volumes.items()
+                         if any(chapter["level_1"] in only_groups for chapter in chapters)}
 
     generated_files = []
-    field_name = "标签" if metadata_type == "tag" else "分类"
+    manifest = load_build_manifest(output_dir)
+    quarantined = active_quarantine(output_dir) if FAILURE_ISOLATION else set()
 
     print(f"\n将按 {len(level1_groups)} 个一级目录分别生成EPUB文件:")
+    if jobs > 1:
+        print(f"并行构建数: {jobs}")
 
-    for level1, chapters in level1_groups.items():
-        # 计算文件总数
-        total_files = sum(len(chapter["files"]) for chapter in chapters)
+    # 笔记 -> 所在分组的书名（笔记属于多个分组时取第一个），用于改写跨书链接
+    note_books = {}
+    for level1, chapters in all_volumes.items():
+        book_title = single_epub_title(level1, metadata_type)
+        for chapter in chapters:
+            for file_path in chapter["files"]:
+                if Path(file_path) not in quarantined:
+                    note_books.setdefault(Path(file_path), book_title)
 
-        print(f"\n📁 正在处理: {level1} ({total_files} 个文件)")
+    build_jobs = []
+    for level1, chapters in level1_groups.items():
+        if dedupe:
+            chapters = dedupe_chapters(chapters)
 
         # 生成该分组的文件列表
         group_files = []
@@ -463,26 +3928,113 @@ def generate_epub_by_chapters(chapter_structure, output_dir, metadata_type):
                 group_files.append(
                     (Path(file_path), [chapter["item"]], [chapter["item"]]))
 
-        # 生成文件名（去掉特殊字符）
-        safe_name = level1.replace(
-            "/", "_").replace("\\", "_").replace(":", "_")
-        output_filename = f"Obsidian_{metadata_type}_{safe_name}.epub"
+        output_filename = volume_output_filename(level1, metadata_type)
         output_path = output_dir / output_filename
 
-        # 生成EPUB
-        success = generate_single_epub(
-            group_files, output_path, level1, metadata_type)
-
-        if success:
-            generated_files.append(output_path)
-            print(f"✅ 已生成: {output_filename}")
-        else:
-            print(f"❌ 生成失败: {output_filename}")
+        pandoc_options = build_pandoc_options(
+            single_epub_title(level1, metadata_type))
+
+        # 隔离中的笔记不参与构建；指纹仍按完整分组计算，隔离的笔记修改后分组会重建
+        fingerprint_files = group_files
+        fingerprint_chapters = chapters
+        if quarantined:
+            group_files = [entry for entry in group_files if entry[0] not in quarantined]
+            chapters = exclude_quarantined(chapters, quarantined, level1)
+
+        link_context = build_link_context(
+            [file_path for file_path, _, _ in group_files], note_books)
+        fingerprint = compute_build_fingerprint(
+            fingerprint_files, pandoc_options, manifest["notes"], link_context,
+            manifest["attachments"], fingerprint_chapters)
+        up_to_date = (not force and output_path.exists()
+                      and manifest["outputs"].get(output_filename) == fingerprint)
+
+        build_jobs.append({
+            "name": level1,
+            "chapters": chapters,
+            "files": group_files,
+            "fingerprint_files": fingerprint_files,
+            "output_path": output_path,
+            "fingerprint": fingerprint,
+            "link_context": link_context,
+            "up_to_date": up_to_date,
+            "input_size": estimate_input_size(group_files) if jobs > 1 else 0,
+        })
+
+    skipped = sum(job["up_to_date"] for job in build_jobs)
+    if skipped:
+        print(f"{skipped} 个分组未发生变化，将跳过重建")
+
+    # 最长任务优先：先提交输入最大的分组，使总耗时接近最大分组的耗时
+    pending_jobs = [job for job in build_jobs if not job["up_to_date"]]
+
+    # 预先并行渲染所有待构建分组的笔记（链接按所在分组改写，因此逐个分组渲染）
+    if RENDER_CACHE_ENABLED and pending_jobs:
+        try:
+            for job in pending_jobs:
+                render_notes([file_path for file_path, _, _ in job["files"]],
+                             output_dir / RENDER_CACHE_DIRNAME, jobs,
+                             link_context=job["link_context"])
+        except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"⚠️  预渲染笔记失败，将在各分组构建时重试: {e}")
+
+    schedule = sorted(pending_jobs, key=lambda job: job["input_size"],
+                      reverse=True) if jobs > 1 else pending_jobs
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            job["output_path"]: executor.submit(
+                generate_single_epub, job["files"], job["output_path"],
+                job["name"], metadata_type, job["link_context"], job["chapters"])
+            for job in schedule
+        }
+
+        # 按原分组顺序汇报结果
+        for job in build_jobs:
+            print(f"\n📁 正在处理: {job['name']} ({len(job['files'])} 个文件)")
+            output_filename = job["output_path"].name
+
+            if job["up_to_date"]:
+                generated_files.append(job["output_path"])
+                print(f"⏭️  未变化，跳过: {output_filename}")
+                continue
+
+            success = futures[job["output_path"]].result()
+
+            if success:
+                generated_files.append(job["output_path"])
+                manifest["outputs"][output_filename] = job["fingerprint"]
+                print(f"✅ 已生成: {output_filename}")
+            else:
+                manifest["outputs"].pop(output_filename, None)
+                print(f"❌ 生成失败: {output_filename}")
+
+    # 只保留当前vault中仍存在的笔记哈希记录（包括隔离中的笔记；只处理部分分组时无法判断，保留全部）
+    if only_groups is None:
+        current_notes = {str(file_path) for job in build_jobs
+                         for file_path, _, _ in job["fingerprint_files"]}
+        manifest["notes"] = {path: record for path, record in manifest["notes"].items()
+                             if path in current_notes}
+    manifest["attachments"] = {path: record for path, record in manifest["attachments"].items()
+                               if Path(path).exists()}
+
+    # 删除不再生成的旧EPUB（如分卷预算变化后的 "X 卷1"、"X 卷2"），只处理清单中记录的文件
+    current_outputs = {volume_output_filename(name, metadata_type) for name in all_volumes}
+    output_prefix = volume_output_filename("", metadata_type)[:-len(".epub")]
+    for output_filename in sorted(manifest["outputs"]):
+        if output_filename.startswith(output_prefix) and output_filename not in current_outputs:
+            stale_path = output_dir / output_filename
+            if stale_path.exists():
+                stale_path.unlink()
+            del manifest["outputs"][output_filename]
+            print(f"🗑️  已删除不再生成的EPUB: {output_filename}")
+    save_build_manifest(manifest, output_dir)
 
     return generated_files
 
 
-def generate_single_epub(sorted_files, output_path, category_name, metadata_type):
+def generate_single_epub(sorted_files, output_path, category_name, metadata_type,
+                         link_context=None, chapters=None, isolate_failures=True):
     """
     生成单个EPUB文件
 
@@ -491,6 +4043,9 @@ def generate_single_epub(sorted_files, output_path, category_name, metadata_type
         output_path (Path): 输出文件路径
         category_name (str): 分类名称
         metadata_type (str): "tag" 或 "category"
+        link_context (dict): 书的链接上下文，默认把书中的全部笔记视为链接目标
+        chapters (list): 与sorted_files顺序一致的章节列表，提供时插入标签标题
+        isolate_failures (bool): 失败时是否定位并隔离出错的笔记后重试（还需开启 FAILURE_ISOLATION）
 
     Returns:
         bool: 是否成功生成
@@ -503,63 +4058,166 @@ def generate_single_epub(sorted_files, output_path, category_name, metadata_type
         # 确保输出目录存在
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 准备Pandoc命令
-        file_paths = [str(file_path) for file_path, _, _ in sorted_files]
+        # 准备输入文件
+        note_paths = [file_path for file_path, _, _ in sorted_files]
 
-        field_name = "标签" if metadata_type == "tag" else "分类"
-        title = f"Obsidian导出 - {category_name} (按{field_name})"
-
-        pandoc_cmd = [
-            "pandoc",
-            # 输入文件
-            *file_paths,
-            # 输出格式和文件
-            "-o", str(output_path),
-            # EPUB相关选项
-            "--to=epub3",
-            "--epub-metadata=metadata.xml" if Path(
-                "metadata.xml").exists() else None,
-            # 目录选项
-            "--toc",
-            "--toc-depth=3",
-            # 跳过YAML frontmatter解析，避免格式错误
-            "--from=markdown-yaml_metadata_block",
-            # 资源路径（让Pandoc能找到图片等资源）
-            f"--resource-path={VAULT_PATH.absolute()}",
-            # 标题和作者信息
-            f"--metadata=title:{title}",
-            "--metadata=author:知识整理者",
-            f"--metadata=date:{datetime.now().strftime('%Y-%m-%d')}",
-            # 中文支持
-            "--variable=lang:zh-CN",
-        ]
-
-        # 过滤掉None值
-        pandoc_cmd = [arg for arg in pandoc_cmd if arg is not None]
+        title = single_epub_title(category_name, metadata_type)
 
         # 执行Pandoc命令
-        result = subprocess.run(
-            pandoc_cmd,
-            capture_output=True,
-            text=True,
-            timeout=600  # 10分钟超时，单个分类应该不会太大
-        )
+        result = run_pandoc_build(
+            note_paths, output_path, title,
+            timeout=600, link_context=link_context,  # 10分钟超时，单个分类应该不会太大
+            chapters=chapters)
 
         if result.returncode == 0:
             return True
         else:
             print(f"生成失败，错误信息: {result.stderr}")
-            return False
 
     except subprocess.TimeoutExpired:
+        # 超时或Pandoc不可用与笔记内容无关，不做隔离
         print("生成超时!")
         return False
+    except (OSError, PandocUnavailableError) as e:
+        print(f"生成时出错: {e}")
+        return False
     except Exception as e:
         print(f"生成时出错: {e}")
+
+    if not (FAILURE_ISOLATION and isolate_failures):
+        return False
+    return rebuild_without_failing_notes(sorted_files, output_path, category_name,
+                                         metadata_type, link_context, chapters)
+
+
+def check_notes_conversion(note_paths, cache_dir, link_context):
+    """
+    快速转换检查：把一组预处理后的笔记拼接后转换为JSON AST（不生成EPUB）
+
+    Args:
+        note_paths (list): 笔记路径列表
+        cache_dir (Path): 渲染缓存目录（图片缓存位于其同级目录）
+        link_context (dict): 书的链接上下文
+
+    Returns:
+        str: 转换错误信息，转换成功时为None
+
+    Raises:
+        OSError: 无法读取笔记或启动Pandoc
+        PandocUnavailableError: 无法连接pandoc server
+        subprocess.TimeoutExpired: 转换超时（较慢但内容正确的笔记不应被隔离）
+    """
+    chunks = []
+    for note_path in note_paths:
+        with open(note_path, 'rb') as f:
+            chunks.append(preprocess_note(f.read(), note_path, cache_dir, link_context))
+    try:
+        pandoc_convert(b"\n\n".join(chunks), PANDOC_READER_FORMAT, "json",
+                       timeout=FAILURE_ISOLATION_TIMEOUT,
+                       label=f"isolate:{note_paths[0].name}+{len(note_paths) - 1}")
+    except PandocUnavailableError:
+        raise
+    except RuntimeError as e:
+        return str(e) or type(e).__name__
+    return None
+
+
+def bisect_failing_notes(note_paths, check):
+    """
+    二分查找单独转换就会出错的笔记
+
+    一组笔记转换失败时分成两半分别检查，直到定位到单篇笔记；两半都能成功转换时说明
+    错误只在组合时出现，这一组不再细分。
+
+    Args:
+        note_paths (list): 笔记路径列表
+        check (callable): 检查函数，接收笔记路径列表，返回错误信息（成功时为None）
+
+    Returns:
+        list: (笔记路径, 错误信息) 列表
+    """
+    error = check(note_paths)
+    if error is None:
+        return []
+    if len(note_paths) == 1:
+        return [(note_paths[0], error)]
+
+    middle = len(note_paths) // 2
+    return (bisect_failing_notes(note_paths[:middle], check)
+            + bisect_failing_notes(note_paths[middle:], check))
+
+
+def rebuild_without_failing_notes(sorted_files, output_path, category_name, metadata_type,
+                                  link_context=None, chapters=None):
+    """
+    分组生成失败后定位出错的笔记，记入隔离清单，再不含它们重新生成一次
+
+    Args:
+        sorted_files (list): 排序后的文件列表
+        output_path (Path): 输出文件路径
+        category_name (str): 分类名称
+        metadata_type (str): "tag" 或 "category"
+        link_context (dict): 书的链接上下文
+        chapters (list): 与sorted_files顺序一致的章节列表
+
+    只有部分笔记能单独转换成功时才隔离；Pandoc不可用、转换超时或每篇笔记都出错时
+    视为环境问题，报告错误后放弃隔离，避免整个分组被错误地隔离。
+
+    Returns:
+        bool: 重新生成是否成功
+    """
+    note_paths = list(dict.fromkeys(file_path for file_path, _, _ in sorted_files))
+    if link_context is None:
+        link_context = build_link_context(note_paths)
+    cache_dir = output_path.parent / RENDER_CACHE_DIRNAME
+
+    print(f"🔍 {category_name}: 正在二分定位出错的笔记（共 {len(note_paths)} 篇）...")
+    try:
+        failures = bisect_failing_notes(
+            note_paths, lambda paths: check_notes_conversion(paths, cache_dir, link_context))
+    except subprocess.TimeoutExpired as e:
+        print(f"⚠️  {category_name}: 定位时转换超时（{e.timeout} 秒），不隔离任何笔记")
+        return False
+    except (OSError, PandocUnavailableError) as e:
+        print(f"⚠️  {category_name}: Pandoc不可用，不隔离任何笔记: {e}")
         return False
+    if not failures:
+        print(f"⚠️  {category_name}: 没有单独转换就出错的笔记，无法自动隔离")
+        return False
+    if len(failures) == len(note_paths):
+        error = failures[0][1].strip()
+        print(f"⚠️  {category_name}: 每篇笔记单独转换都出错，可能是Pandoc本身的问题，不隔离任何笔记"
+              f"（{error.splitlines()[-1] if error else ''}）")
+        return False
+
+    quarantine_notes(output_path.parent, failures, category_name)
+    for file_path, error in failures:
+        print(f"🚫 已隔离: {file_path}（{error.strip().splitlines()[-1] if error.strip() else ''}）")
+
+    failed_paths = {file_path for file_path, _ in failures}
+    remaining_files = [entry for entry in sorted_files if entry[0] not in failed_paths]
+    if not remaining_files:
+        return False
+
+    # 隔离的笔记不再作为链接目标
+    link_context = {
+        "anchors": {note_path: anchor_id for note_path, anchor_id in link_context["anchors"].items()
+                    if note_path not in failed_paths},
+        "books": {note_path: book for note_path, book in link_context["books"].items()
+                  if note_path not in failed_paths},
+    }
+    if chapters is not None:
+        chapters = [dict(chapter, files=[file_path for file_path in chapter["files"]
+                                         if Path(file_path) not in failed_paths])
+                    for chapter in chapters]
+
+    print(f"🔁 {category_name}: 排除 {len(failed_paths)} 篇隔离的笔记后重新生成...")
+    return generate_single_epub(remaining_files, output_path, category_name, metadata_type,
+                                link_context, chapters, isolate_failures=False)
 
 
-def generate_merged_epub(chapter_structure, output_dir, metadata_type):
+def generate_merged_epub(chapter_structure, output_dir, metadata_type, dedupe=False,
+                         tag_trie=None, jobs=1):
     """
     合并所有章节生成一个大的EPUB文件
 
@@ -567,6 +4225,9 @@ def generate_merged_epub(chapter_structure, output_dir, metadata_type):
         chapter_structure (dict): 章节结构
         output_dir (Path): 输出目录
         metadata_type (str): "tag" 或 "category"
+        dedupe (bool): 多标签笔记在整个合集中只输出一次
+        tag_trie (dict): 已构建的标签树，未提供时由章节结构构建
+        jobs (int): 同时渲染笔记的Pandoc进程数
 
     Returns:
         bool: 是否成功生成
@@ -574,26 +4235,26 @@ def generate_merged_epub(chapter_structure, output_dir, metadata_type):
     field_name = "标签" if metadata_type == "tag" else "分类"
     print(f"\n正在生成合并的EPUB文件（按{field_name}）...")
 
-    # 收集所有文件，按章节顺序
-    all_files = []
-    total_files = 0
+    if tag_trie is None:
+        tag_trie = build_tag_trie(chapter_structure["chapters"])
 
-    # 按一级目录分组
-    level1_groups = defaultdict(list)
-    for chapter in chapter_structure["chapters"]:
-        level1 = chapter["level_1"]
-        level1_groups[level1].append(chapter)
+    # 按一级目录名称顺序遍历标签树，收集所有章节
+    ordered_chapters = []
+    for level1_node in sorted(tag_trie["children"].values(), key=lambda node: node["name"]):
+        print(f"📁 添加章节: {level1_node['name']}")
+        ordered_chapters.extend(iter_trie_chapters(level1_node))
 
-    # 按顺序处理每个一级目录
-    for level1 in sorted(level1_groups.keys()):
-        chapters = level1_groups[level1]
-        print(f"📁 添加章节: {level1}")
+    if FAILURE_ISOLATION:
+        ordered_chapters = exclude_quarantined(ordered_chapters, active_quarantine(output_dir),
+                                               "合并EPUB")
 
-        # 按章节顺序添加文件
-        for chapter in chapters:
-            for file_path in chapter["files"]:
-                all_files.append(str(file_path))
-                total_files += 1
+    if dedupe:
+        # 按合集中的实际顺序去重
+        ordered_chapters = dedupe_chapters(ordered_chapters)
+
+    # 收集所有文件，按章节顺序
+    all_files = [Path(file_path) for chapter in ordered_chapters for file_path in chapter["files"]]
+    total_files = len(all_files)
 
     print(f"总共将处理 {total_files} 个文件")
 
@@ -607,44 +4268,23 @@ def generate_merged_epub(chapter_structure, output_dir, metadata_type):
 
         title = f"Obsidian完整知识合集（按{field_name}）"
 
-        pandoc_cmd = [
-            "pandoc",
-            # 输入文件
-            *all_files,
-            # 输出格式和文件
-            "-o", str(output_path),
-            # EPUB相关选项
-            "--to=epub3",
-            "--epub-metadata=metadata.xml" if Path(
-                "metadata.xml").exists() else None,
-            # 目录选项
-            "--toc",
-            "--toc-depth=3",
-            # 跳过YAML frontmatter解析，避免格式错误
-            "--from=markdown-yaml_metadata_block",
-            # 资源路径（让Pandoc能找到图片等资源）
-            f"--resource-path={VAULT_PATH.absolute()}",
-            # 标题和作者信息
-            f"--metadata=title:{title}",
-            "--metadata=author:知识整理者",
-            f"--metadata=date:{datetime.now().strftime('%Y-%m-%d')}",
-            # 中文支持
-            "--variable=lang:zh-CN",
-        ]
-
-        # 过滤掉None值
-        pandoc_cmd = [arg for arg in pandoc_cmd if arg is not None]
-
         print(f"正在生成合并EPUB文件（这可能需要较长时间）...")
         print(f"输出路径: {output_path.absolute()}")
 
-        # 执行Pandoc命令，使用更长的超时时间
-        result = subprocess.run(
-            pandoc_cmd,
-            capture_output=True,
-            text=True,
-            timeout=1800  # 30分钟超时
-        )
+        result = None
+        if COLLECTION_EPUB_WRITER == "native":
+            # 内置写入器逐章流式写入，不再需要一个Pandoc进程渲染整个合集
+            if write_collection_epub(ordered_chapters, output_path, title,
+                                     jobs=jobs) is not None:
+                result = subprocess.CompletedProcess([], 0)
+            else:
+                print("改用Pandoc写入器重新生成...")
+        if result is None:
+            # 执行Pandoc命令，使用更长的超时时间
+            result = run_pandoc_build(
+                all_files, output_path, title,
+                timeout=1800, jobs=jobs,  # 30分钟超时
+                chapters=ordered_chapters)
 
         if result.returncode == 0:
             print("✅ 合并EPUB文件生成成功!")
@@ -670,88 +4310,755 @@ def generate_merged_epub(chapter_structure, output_dir, metadata_type):
         return False
 
 
+def site_tag_id(item):
+    """
+    生成标签页面的ID（由标签路径决定，保持稳定）
+
+    Args:
+        item (str): 标签，如 "#1-个人成长/1-内在建设"
+
+    Returns:
+        str: 形如 "tag-1a2b3c4d5e6f" 的ID
+    """
+    return "tag-" + hashlib.sha1(item.encode('utf-8')).hexdigest()[:12]
+
+
+def html_page(title, body, root=""):
+    """
+    生成静态网站的HTML页面
+
+    Args:
+        title (str): 页面标题
+        body (str): body内的HTML内容
+        root (str): 从页面到网站根目录的相对路径前缀，如 "../"
+
+    Returns:
+        str: HTML文档
+    """
+    return (
+        '<!DOCTYPE html>\n'
+        '<html lang="zh-CN">\n'
+        '<head>\n'
+        '<meta charset="utf-8"/>\n'
+        '<meta name="viewport" content="width=device-width, initial-scale=1"/>\n'
+        f'<title>{escape(title)}</title>\n'
+        f'<link rel="stylesheet" href="{root}style.css"/>\n'
+        '</head>\n'
+        f'<body>\n{body}\n</body>\n'
+        '</html>\n'
+    )
+
+
+def write_site_file(path, content):
+    """
+    写入网站文件（先写临时文件再替换，发布过程中不会出现不完整的页面）
+
+    Args:
+        path (Path): 文件路径
+        content (str): 文件内容
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def load_site_manifest(site_dir):
+    """
+    加载网站清单
+
+    Args:
+        site_dir (Path): 网站目录
+
+    Returns:
+        dict: {"version", "notes": 笔记哈希记录, "attachments": 附件哈希记录,
+            "pages": 相对路径 -> {"hash", "media"}}
+    """
+    manifest_path = site_dir / SITE_MANIFEST_FILENAME
+    empty_manifest = {"version": SITE_MANIFEST_VERSION, "notes": {}, "attachments": {},
+                      "pages": {}}
+    if not manifest_path.exists():
+        return empty_manifest
+
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  网站清单 {manifest_path} 无法读取，将重写全部页面: {e}")
+        return empty_manifest
+
+    if manifest.get("version") != SITE_MANIFEST_VERSION:
+        return empty_manifest
+
+    return manifest
+
+
+def generate_html_site(chapter_structure, output_dir, metadata_type, tag_trie=None, jobs=1,
+                       force=False):
+    """
+    把章节结构导出为静态HTML网站，只重写输入发生变化的页面
+
+    网站目录包含首页 index.html、每个标签节点一个页面 tags/<ID>.html，以及在各标签间共享的
+    笔记页面 notes/<ID>.html 和引用的图片 media/。笔记页面的输入哈希由笔记内容、链接的解析结果、
+    所属标签和Pandoc版本决定，只有哈希变化的笔记才交给Pandoc渲染（并使用渲染缓存）；
+    标签页面和首页直接比较生成的内容。已不存在的页面和不再引用的图片会被删除。
+
+    Args:
+        chapter_structure (dict): 章节结构
+        output_dir (Path): 输出目录
+        metadata_type (str): "tag" 或 "category"
+        tag_trie (dict): 已构建的标签树，未提供时由章节结构构建
+        jobs (int): 同时渲染笔记的Pandoc进程数
+        force (bool): 忽略网站清单，重写全部页面
+
+    Returns:
+        dict: {"site_dir", "written", "unchanged", "removed"}
+    """
+    field_name = "标签" if metadata_type == "tag" else "分类"
+    site_title = f"Obsidian知识库（按{field_name}）"
+    site_dir = output_dir / f"{SITE_DIRNAME}_{metadata_type}"
+    cache_dir = output_dir / RENDER_CACHE_DIRNAME
+
+    # 隔离中的笔记不发布；有笔记被跳过时按剩余的章节重建标签树
+    chapters = chapter_structure["chapters"]
+    if FAILURE_ISOLATION:
+        chapters = exclude_quarantined(chapters, active_quarantine(output_dir), site_dir.name)
+        if chapters is not chapter_structure["chapters"]:
+            tag_trie = None
+    if tag_trie is None:
+        tag_trie = build_tag_trie(chapters)
+    manifest = load_site_manifest(site_dir)
+    previous_pages = {} if force else manifest["pages"]
+    pages = {}
+    written = 0
+
+    def publish(relative_path, content, media=()):
+        # 内容与上次相同且文件存在时不重写
+        nonlocal written
+        content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        previous = previous_pages.get(relative_path)
+        if not (previous and previous["hash"] == content_hash
+                and (site_dir / relative_path).exists()):
+            write_site_file(site_dir / relative_path, content)
+            written += 1
+        pages[relative_path] = {"hash": content_hash, "media": sorted(media)}
+
+    # 遍历标签树：每个节点的页面ID、面包屑，以及每篇笔记所属的标签
+    tag_nodes = []
+    note_tags = {}
+    pending = [(node, []) for node in reversed(list(tag_trie["children"].values()))]
+    while pending:
+        node, ancestors = pending.pop()
+        tag_nodes.append((node, ancestors))
+        for file_path in node["files"]:
+            note_tags.setdefault(Path(file_path), []).append(node)
+        pending.extend((child, ancestors + [node])
+                       for child in reversed(list(node["children"].values())))
+
+    link_context = build_link_context(note_tags)
+
+    def note_href(note_path, root="../"):
+        return f"{root}notes/{link_context['anchors'][note_path]}.html"
+
+    def tag_href(node, root="../"):
+        return f"{root}tags/{site_tag_id(node['item'])}.html"
+
+    # 笔记页面：先按输入哈希找出需要重新生成的笔记
+    page_seed = f"{SITE_MANIFEST_VERSION}\0{get_pandoc_version()}\0{PANDOC_READER_FORMAT}"
+    note_inputs = {}
+    stale_notes = []
+    for note_path, nodes in note_tags.items():
+        hasher = hashlib.sha1(page_seed.encode('utf-8'))
+        hasher.update(get_note_hash(note_path, manifest["notes"]).encode('ascii'))
+        for target in get_note_links(note_path, manifest["notes"]):
+            resolved = link_context["anchors"].get(resolve_note_link(target)) or ""
+            hasher.update(f"{target}\0{resolved}\0".encode('utf-8'))
+        for node in nodes:
+            hasher.update(f"{node['item']}\0".encode('utf-8'))
+        update_attachment_hashes(hasher, note_path, manifest["notes"], manifest["attachments"])
+        note_inputs[note_path] = hasher.hexdigest()
+
+        # 输入未变化且页面及其引用的图片都还在时沿用上次的页面
+        relative_path = f"notes/{link_context['anchors'][note_path]}.html"
+        previous = previous_pages.get(relative_path)
+        if (previous and previous.get("inputs") == note_inputs[note_path]
+                and (site_dir / relative_path).exists()
+                and all((site_dir / "media" / name).exists() for name in previous["media"])):
+            pages[relative_path] = previous
+        else:
+            stale_notes.append(note_path)
+
+    rendered_notes = render_notes(stale_notes, cache_dir, jobs, to_format="html5",
+                                  link_context=link_context) if stale_notes else {}
+
+    def copy_image(note_path, match, media):
+        image_path = resolve_attachment(match.group(2), note_path)
+        if image_path is None:
+            return match.group(0)
+        stat_result = image_path.stat()
+        key = f"{image_path.resolve()}\0{stat_result.st_mtime_ns}\0{stat_result.st_size}"
+        media_name = (hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+                      + image_path.suffix.lower())
+        media_path = site_dir / "media" / media_name
+        if not media_path.exists():
+            media_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(image_path, media_path)
+        media.add(media_name)
+        return f"{match.group(1)}../media/{media_name}{match.group(3)}"
+
+    for note_path in stale_notes:
+        with open(rendered_notes[note_path], 'r', encoding='utf-8') as f:
+            fragment = f.read()
+        media = set()
+        fragment = IMG_SRC_PATTERN.sub(
+            lambda match: copy_image(note_path, match, media), fragment)
+        fragment = NOTE_HREF_PATTERN.sub(
+            lambda match: f'href="{match.group(1)}.html'
+                          f'{"#" + match.group(1) + match.group(2) if match.group(2) else ""}"',
+            fragment)
+
+        tag_links = "".join(f'<li><a href="{tag_href(node)}">{escape(node["item"])}</a></li>'
+                            for node in note_tags[note_path])
+        body = ('<nav class="breadcrumb"><a href="../index.html">首页</a></nav>\n'
+                f'<article>\n<h1>{escape(note_path.stem)}</h1>\n'
+                f'<ul class="tags">{tag_links}</ul>\n{fragment}\n</article>')
+        relative_path = f"notes/{link_context['anchors'][note_path]}.html"
+        publish(relative_path, html_page(note_path.stem, body, "../"), media)
+        pages[relative_path]["inputs"] = note_inputs[note_path]
+
+    # 标签页面
+    for node, ancestors in tag_nodes:
+        breadcrumb = " › ".join(['<a href="../index.html">首页</a>']
+                                + [f'<a href="{tag_href(ancestor)}">{escape(ancestor["name"])}</a>'
+                                   for ancestor in ancestors]
+                                + [escape(node["name"])])
+        body = f'<nav class="breadcrumb">{breadcrumb}</nav>\n<h1>{escape(node["name"])}</h1>\n'
+        if node["children"]:
+            body += f"<h2>下级{field_name}</h2>\n<ul>\n" + "".join(
+                f'<li><a href="{tag_href(child)}">{escape(child["name"])}</a> '
+                f'<span class="count">({len(trie_subtree_files(child))})</span></li>\n'
+                for child in node["children"].values()) + "</ul>\n"
+        if node["files"]:
+            body += "<h2>笔记</h2>\n<ul>\n" + "".join(
+                f'<li><a href="{note_href(Path(file_path))}">{escape(Path(file_path).stem)}</a></li>\n'
+                for file_path in node["files"]) + "</ul>\n"
+        publish(f"tags/{site_tag_id(node['item'])}.html",
+                html_page(f"{node['name']} - {site_title}", body, "../"))
+
+    # 首页和样式表
+    body = (f"<h1>{escape(site_title)}</h1>\n"
+            f"<p>共 {len(note_tags)} 篇笔记，{len(tag_nodes)} 个{field_name}</p>\n<ul>\n"
+            + "".join(f'<li><a href="{tag_href(node, "")}">{escape(node["name"])}</a> '
+                      f'<span class="count">({len(trie_subtree_files(node))})</span></li>\n'
+                      for node in tag_trie["children"].values())
+            + "</ul>")
+    publish("index.html", html_page(site_title, body))
+    publish("style.css", SITE_STYLESHEET)
+
+    # 删除已不存在的页面和不再引用的图片
+    removed = 0
+    for relative_path in set(manifest["pages"]) - set(pages):
+        page_path = site_dir / relative_path
+        if page_path.exists():
+            page_path.unlink()
+            removed += 1
+    used_media = {name for page in pages.values() for name in page["media"]}
+    for page in manifest["pages"].values():
+        for name in set(page["media"]) - used_media:
+            media_path = site_dir / "media" / name
+            if media_path.exists():
+                media_path.unlink()
+
+    manifest["pages"] = pages
+    manifest["notes"] = {path: record for path, record in manifest["notes"].items()
+                         if Path(path) in note_tags}
+    manifest["attachments"] = {path: record for path, record in manifest["attachments"].items()
+                               if Path(path).exists()}
+    site_dir.mkdir(parents=True, exist_ok=True)
+    write_site_file(site_dir / SITE_MANIFEST_FILENAME,
+                    json.dumps(manifest, ensure_ascii=False))
+
+    return {"site_dir": site_dir, "written": written,
+            "unchanged": len(pages) - written, "removed": removed}
+
+
+def snapshot_vault(vault_path, ignore_patterns):
+    """
+    记录vault中所有笔记和图片附件的mtime和大小（替换或新增被嵌入的图片也需要重建）
+
+    Args:
+        vault_path (Path): Obsidian vault的路径
+        ignore_patterns (list): 忽略的通配符列表
+
+    Returns:
+        dict: 文件路径（字符串） -> (mtime_ns, size)
+    """
+    snapshot = {}
+    for dir_path, dir_names, file_names in os.walk(vault_path):
+        relative_dir = os.path.relpath(dir_path, vault_path)
+        relative_dir = "" if relative_dir == "." else relative_dir.replace(os.sep, "/") + "/"
+        dir_names[:] = [name for name in dir_names
+                        if not is_ignored(name, f"{relative_dir}{name}", ignore_patterns)]
+        for name in file_names:
+            suffix = os.path.splitext(name)[1].lower()
+            if ((suffix != ".md" and suffix not in IMAGE_SUFFIXES)
+                    or is_ignored(name, f"{relative_dir}{name}", ignore_patterns)):
+                continue
+            file_path = Path(dir_path) / name
+            try:
+                stat_result = file_path.stat()
+            except OSError:
+                continue
+            snapshot[str(file_path)] = (stat_result.st_mtime_ns, stat_result.st_size)
+    return snapshot
+
+
+def find_dependent_notes(changed_paths, note_paths, note_records):
+    """
+    由变化的文件找出需要重建的笔记：变化的笔记本身、嵌入了变化图片的笔记，
+    以及链接到变化笔记的笔记（标题或书名变化会影响它们的链接）
+
+    Args:
+        changed_paths (set): 变化的笔记和附件路径（字符串）集合
+        note_paths (iterable): 当前所有笔记路径
+        note_records (dict): 笔记哈希记录（见 get_note_hash），用于增量获取链接和嵌入，会被原地更新
+
+    Returns:
+        set: 笔记路径（字符串）集合
+    """
+    changed_notes = {path for path in changed_paths if path.endswith(".md")}
+    attachment_names = {Path(path).name for path in changed_paths if not path.endswith(".md")}
+    # 按文件名和路径后缀匹配，已删除或重命名的笔记同样适用
+    link_keys = {key for path in changed_notes for key in note_index_keys(Path(path))}
+    changed_note_paths = {Path(path) for path in changed_notes}
+
+    dependent_notes = set(changed_notes)
+    for note_path in map(Path, note_paths):
+        if attachment_names and any(
+                Path(unquote(target.strip())).name in attachment_names
+                for target in get_note_embeds(note_path, note_records)):
+            dependent_notes.add(str(note_path))
+        elif link_keys and any(
+                note_link_key(target) in link_keys
+                or resolve_note_link(target) in changed_note_paths
+                for target in get_note_links(note_path, note_records)):
+            dependent_notes.add(str(note_path))
+    return dependent_notes
+
+
+def add_inotify_watches(inotify, vault_path, ignore_patterns):
+    """
+    为vault中所有未被忽略的目录添加inotify监听（已监听的目录会被跳过）
+
+    Args:
+        inotify (INotify): inotify实例
+        vault_path (Path): Obsidian vault的路径
+        ignore_patterns (list): 忽略的通配符列表
+    """
+    watch_flags = (inotify_flags.CREATE | inotify_flags.MODIFY | inotify_flags.CLOSE_WRITE
+                   | inotify_flags.DELETE | inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO)
+    for dir_path, dir_names, _ in os.walk(vault_path):
+        relative_dir = os.path.relpath(dir_path, vault_path)
+        relative_dir = "" if relative_dir == "." else relative_dir.replace(os.sep, "/") + "/"
+        dir_names[:] = [name for name in dir_names
+                        if not is_ignored(name, f"{relative_dir}{name}", ignore_patterns)]
+        try:
+            inotify.add_watch(dir_path, watch_flags)
+        except OSError as e:
+            print(f"⚠️  无法监听目录 {dir_path}: {e}")
+
+
+def wait_for_vault_change(vault_path, ignore_patterns, previous_snapshot, inotify=None):
+    """
+    阻塞等待vault发生变化，并在连续保存停止后（去抖）返回新的快照
+
+    Args:
+        vault_path (Path): Obsidian vault的路径
+        ignore_patterns (list): 忽略的通配符列表
+        previous_snapshot (dict): 上一次的快照
+        inotify (INotify): inotify实例，None表示使用轮询
+
+    Returns:
+        tuple: (新快照, 变化的文件路径集合)
+    """
+    debounce_ms = int(WATCH_DEBOUNCE_SECONDS * 1000)
+
+    while True:
+        if inotify is not None:
+            # 等待第一个事件，然后持续读取直到去抖时间内没有新事件
+            inotify.read()
+            while inotify.read(timeout=debounce_ms):
+                pass
+            add_inotify_watches(inotify, vault_path, ignore_patterns)
+            snapshot = snapshot_vault(vault_path, ignore_patterns)
+        else:
+            time.sleep(WATCH_POLL_INTERVAL)
+            snapshot = snapshot_vault(vault_path, ignore_patterns)
+            if snapshot == previous_snapshot:
+                continue
+            # 快照在去抖时间内不再变化才视为保存结束
+            while True:
+                time.sleep(WATCH_DEBOUNCE_SECONDS)
+                settled = snapshot_vault(vault_path, ignore_patterns)
+                if settled == snapshot:
+                    break
+                snapshot = settled
+
+        changed_paths = {path for path, state in snapshot.items()
+                         if previous_snapshot.get(path) != state}
+        changed_paths |= previous_snapshot.keys() - snapshot.keys()
+        if changed_paths:
+            return snapshot, changed_paths
+        previous_snapshot = snapshot
+
+
+def rebuild_changed_notes(metadata_types, settings, changed_paths, note_records):
+    """
+    监听模式的一次重建：增量更新元数据和笔记索引，然后重建受变化影响的EPUB
+
+    Args:
+        metadata_types (list): 元数据类型列表
+        settings (dict): resolve_settings 返回的设置
+        changed_paths (set): 变化的笔记和附件路径（字符串）集合
+        note_records (dict): 笔记链接和嵌入的增量记录（见 find_dependent_notes）
+    """
+    # 扫描缓存保证只重新读取变化的笔记；Pandoc可能在监听期间被安装或升级
+    reset_build_report()
+    get_pandoc_version.cache_clear()
+    with report_stage("extract") as stage:
+        scan_cache = load_scan_cache(OUTPUT_DIRECTORY)
+        ATTACHMENT_INDEX.clear()
+        scan_stats = {}
+        note_table = analyze_files_with_all_metadata(
+            iter_md_files(VAULT_PATH, settings["ignore"], ATTACHMENT_INDEX),
+            list(metadata_types) + [ALIAS_METADATA_TYPE], scan_cache,
+            jobs=settings["jobs"], stats=scan_stats)
+        save_scan_cache(scan_cache, OUTPUT_DIRECTORY)
+        build_note_table_index(note_table)
+        stage["files"] = scan_stats["files"]
+        stage["bytes"] = scan_stats["bytes_read"]
+
+    changed_notes = find_dependent_notes(changed_paths, note_table["paths"], note_records)
+    dependent_count = len(changed_notes - changed_paths)
+    if dependent_count:
+        print(f"引用了变化文件的笔记: {dependent_count} 篇")
+
+    for metadata_type in metadata_types:
+        export_view(note_table, metadata_type, settings, changed_notes)
+    prune_render_cache(OUTPUT_DIRECTORY / RENDER_CACHE_DIRNAME)
+    save_build_report(OUTPUT_DIRECTORY)
+
+
+def watch_vault(metadata_types, settings):
+    """
+    持续监听vault，笔记或图片变化时增量更新元数据、章节索引并重建受影响的EPUB
+
+    一次重建出错时报告错误并继续监听。
+
+    Args:
+        metadata_types (list): 元数据类型列表
+        settings (dict): resolve_settings 返回的设置（builds需已确定）
+    """
+    inotify = None
+    if INotify is not None:
+        inotify = INotify()
+        add_inotify_watches(inotify, VAULT_PATH, settings["ignore"])
+        print(f"\n👀 正在监听 {VAULT_PATH.absolute()}（inotify），按 Ctrl+C 退出")
+    else:
+        print(f"\n👀 正在监听 {VAULT_PATH.absolute()}（每 {WATCH_POLL_INTERVAL} 秒轮询），按 Ctrl+C 退出")
+
+    snapshot = snapshot_vault(VAULT_PATH, settings["ignore"])
+    note_records = {}
+    try:
+        while True:
+            snapshot, changed_paths = wait_for_vault_change(
+                VAULT_PATH, settings["ignore"], snapshot, inotify)
+            print(f"\n🔄 [{datetime.now().strftime('%H:%M:%S')}] 检测到 {len(changed_paths)} 个文件变化")
+            try:
+                rebuild_changed_notes(metadata_types, settings, changed_paths, note_records)
+            except Exception as e:
+                print(f"\n❌ 重建时出错，继续监听: {type(e).__name__}: {e}")
+    except KeyboardInterrupt:
+        print("\n已停止监听")
+    finally:
+        if inotify is not None:
+            inotify.close()
+
+
 # =============================================================================
 # 主程序
 # =============================================================================
 
-def main():
-    """主程序"""
-    print("=" * 80)
-    print("Obsidian标签化导出脚本 - 自动层级目录生成版（支持Tag/Category）")
-    print("=" * 80)
+def parse_args(argv=None):
+    """
+    解析命令行参数
 
-    print(f"正在扫描目录: {VAULT_PATH.absolute()}")
+    Args:
+        argv (list): 参数列表，默认使用sys.argv
 
-    # 第一步：查找所有.md文件
-    md_files = find_all_md_files(VAULT_PATH)
-    print(f"找到 {len(md_files)} 个markdown文件")
+    Returns:
+        argparse.Namespace: 解析结果（未指定的选项为None，由配置文件或默认值补全）
+    """
+    parser = argparse.ArgumentParser(
+        description="Obsidian标签化导出脚本 - 按Tag/Category生成EPUB")
+    parser.add_argument(
+        "-c", "--config", type=Path,
+        help=f"JSON配置文件路径（默认读取当前目录下的 {CONFIG_FILENAME}）")
+    parser.add_argument(
+        "--vault", type=Path,
+        help=f"Obsidian vault路径（默认: {VAULT_PATH}）")
+    parser.add_argument(
+        "-o", "--output", type=Path,
+        help=f"输出目录（默认: {OUTPUT_DIRECTORY}）")
+    parser.add_argument(
+        "-m", "--mode", dest="modes", action="append", choices=sorted(METADATA_PREFIXES),
+        help="处理模式，可重复指定以在一次扫描中同时生成多个视图；不指定时交互选择")
+    parser.add_argument(
+        "-b", "--build", dest="builds", action="append", choices=list(BUILD_CHOICES),
+        help="导出方式，可重复指定：chapters=分章节, single=单文件, merged=合并, none=仅索引, "
+             "site=静态HTML网站；"
+             "不指定时交互选择")
+    parser.add_argument(
+        "--ignore", action="append",
+        help=f"扫描时忽略的目录或文件通配符，可重复指定（默认: {' '.join(IGNORE_PATTERNS)}）")
+    parser.add_argument(
+        "-j", "--jobs", type=int,
+        help=f"元数据提取的并行线程数（默认: {EXTRACT_JOBS}）")
+    parser.add_argument(
+        "--build-jobs", type=int,
+        help=f"生成EPUB时同时运行的pandoc进程数（默认: {EPUB_BUILD_JOBS}）")
+    parser.add_argument(
+        "--force", action="store_true", default=None,
+        help="忽略构建清单，强制重建所有EPUB")
+    parser.add_argument(
+        "--volume-max-mb", type=float,
+        help="分章节生成时每卷的最大输入体积（MB），超出时在二级/三级目录处拆分")
+    parser.add_argument(
+        "--volume-max-notes", type=int,
+        help="分章节生成时每卷的最大笔记数")
+    parser.add_argument(
+        "--volume-max-seconds", type=float,
+        help="分章节生成时每卷的最大估算渲染时间（秒）")
+    parser.add_argument(
+        "--dedupe", action="store_true", default=None,
+        help="多标签笔记在每本书中只输出一次，其他标签章节只保留链接")
+    parser.add_argument(
+        "--primary-tag", dest="primary_tags", action="append",
+        help="去重时笔记优先放在这些标签（含子标签）下，可重复指定")
+    parser.add_argument(
+        "--index-format", choices=["full", "compact"],
+        help=f"章节索引格式：full=完整JSON，compact=紧凑格式（默认: {CHAPTER_INDEX_FORMAT}）")
+    parser.add_argument(
+        "--index-gzip", action="store_true", default=None,
+        help="用gzip压缩章节索引（保存为 chapter_index_*.json.gz）")
+    parser.add_argument(
+        "--profile", action="append", metavar="STAGE",
+        help=f"用cProfile分析名称匹配的阶段（如 extract、build:*），可重复指定；"
+             f"也可通过环境变量 {PROFILE_ENV_VAR} 设置")
+    parser.add_argument(
+        "--no-isolate", dest="isolate_failures", action="store_false", default=None,
+        help=f"分组生成失败时不自动定位和隔离出错的笔记（隔离清单: {QUARANTINE_FILENAME}）")
+    parser.add_argument(
+        "--pandoc-backend", choices=sorted(PANDOC_BACKENDS),
+        help=f"单篇笔记的Pandoc转换方式：subprocess=每次启动进程，server=发送给常驻的pandoc server"
+             f"（默认: {PANDOC_BACKEND}）")
+    parser.add_argument(
+        "--pandoc-server", metavar="URL",
+        help=f"pandoc server地址，本机地址未运行时自动启动（默认: {PANDOC_SERVER_URL}）")
+    parser.add_argument(
+        "--watch", action="store_true", default=None,
+        help="导出完成后持续监听vault，笔记变化时增量更新索引并重建受影响的EPUB")
+
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs 必须大于等于1")
+    if args.build_jobs is not None and args.build_jobs < 1:
+        parser.error("--build-jobs 必须大于等于1")
+    for option, value in (("--volume-max-mb", args.volume_max_mb),
+                          ("--volume-max-notes", args.volume_max_notes),
+                          ("--volume-max-seconds", args.volume_max_seconds)):
+        if value is not None and value < 0:
+            parser.error(f"{option} 不能为负数")
+    return args
+
+
+def load_config(config_path):
+    """
+    加载JSON配置文件
 
-    # 第二步：选择处理模式
-    print(f"\n请选择处理模式:")
-    print(f"1. 按标签 (Tag) 处理")
-    print(f"2. 按分类 (Category) 处理")
+    Args:
+        config_path (Path): 配置文件路径
 
-    while True:
-        mode_choice = input("请选择 (1/2): ").strip()
-        if mode_choice in ['1', '2']:
-            break
-        print("请输入有效选择: 1 或 2")
+    Returns:
+        dict: 配置字典
 
-    metadata_type = "tag" if mode_choice == '1' else "category"
-    field_name = "标签" if metadata_type == "tag" else "分类"
+    Raises:
+        ValueError: 配置文件格式错误或包含未知的键
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
 
-    print(f"\n已选择: 按{field_name}处理")
+    if not isinstance(config, dict):
+        raise ValueError(f"配置文件 {config_path} 必须是JSON对象")
 
-    # 第三步：提取元数据
-    files_with_metadata = analyze_files_with_metadata(md_files, metadata_type)
+    unknown_keys = set(config) - CONFIG_KEYS
+    if unknown_keys:
+        raise ValueError(f"配置文件 {config_path} 包含未知的键: {', '.join(sorted(unknown_keys))}")
 
-    # 第四步：收集并排序所有元数据
-    print(f"\n正在收集和分析{field_name}...")
-    sorted_items, item_hierarchy, file_item_mapping = collect_all_metadata(
-        files_with_metadata)
+    for key in ("modes", "builds", "ignore", "primary_tags", "profile"):
+        if isinstance(config.get(key), str):
+            config[key] = [config[key]]
 
-    # 第五步：生成章节结构
-    print(f"\n正在生成章节结构...")
-    chapter_structure = generate_chapter_structure(
-        sorted_items, item_hierarchy, file_item_mapping, metadata_type)
+    invalid_modes = set(config.get("modes") or []) - set(METADATA_PREFIXES)
+    if invalid_modes:
+        raise ValueError(f"不支持的处理模式: {', '.join(sorted(invalid_modes))}")
+    invalid_builds = set(config.get("builds") or []) - set(BUILD_CHOICES)
+    if invalid_builds:
+        raise ValueError(f"不支持的导出方式: {', '.join(sorted(invalid_builds))}")
+    if config.get("index_format", "full") not in ("full", "compact"):
+        raise ValueError(f"不支持的索引格式: {config['index_format']}")
+    if config.get("pandoc_backend", PANDOC_BACKEND) not in PANDOC_BACKENDS:
+        raise ValueError(f"不支持的Pandoc转换方式: {config['pandoc_backend']}")
 
-    # 第六步：保存索引文件
-    index_path = save_chapter_index(
-        chapter_structure, OUTPUT_DIRECTORY, metadata_type)
+    return config
 
-    # 第七步：显示章节结构预览
-    print_chapter_summary(chapter_structure, metadata_type)
 
-    # 第八步：生成排序文件列表
-    sorted_files = generate_sorted_file_list(chapter_structure)
+def resolve_settings(args):
+    """
+    合并命令行参数、配置文件和默认配置
 
-    # 显示统计信息
-    print("\n" + "=" * 80)
-    print("导出统计:")
-    print("=" * 80)
-    print(f"原始文件总数: {len(md_files)}")
-    print(f"有{field_name}的文件: {len(file_item_mapping)}")
-    print(f"包含的{field_name}数: {len(sorted_items)}")
-    print(f"将导出的文件: {len(sorted_files)}")
+    Args:
+        args (argparse.Namespace): 命令行参数
+
+    Returns:
+        dict: 最终设置，包含 vault、output、modes、builds、jobs、build_jobs、force、ignore、watch、
+            volume_max_bytes、volume_max_notes、volume_max_render_seconds、dedupe、primary_tags、
+            index_format、index_gzip、profile、pandoc_backend、pandoc_server、isolate_failures
+
+    Raises:
+        ValueError: 配置文件无效，或jobs、build_jobs不是正整数
+    """
+    config = {}
+    config_path = args.config or Path(CONFIG_FILENAME)
+    if args.config or config_path.exists():
+        config = load_config(config_path)
+        print(f"已加载配置文件: {config_path.absolute()}")
+
+    def pick(name, default):
+        value = getattr(args, name)
+        if value is not None:
+            return value
+        return config.get(name, default)
+
+    # 配置文件中的值没有经过命令行的检查
+    for name in ("jobs", "build_jobs"):
+        value = pick(name, 1)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            raise ValueError(f"{name} 必须是大于等于1的整数: {value!r}")
+
+    return {
+        "vault": Path(pick("vault", VAULT_PATH)).expanduser(),
+        "output": Path(pick("output", OUTPUT_DIRECTORY)).expanduser(),
+        "modes": list(dict.fromkeys(pick("modes", None) or [])),
+        "builds": list(dict.fromkeys(pick("builds", None) or [])),
+        "jobs": pick("jobs", EXTRACT_JOBS),
+        "build_jobs": pick("build_jobs", EPUB_BUILD_JOBS),
+        "force": bool(pick("force", False)),
+        "ignore": list(pick("ignore", IGNORE_PATTERNS)),
+        "watch": bool(pick("watch", False)),
+        "volume_max_bytes": (int(args.volume_max_mb * 1024 * 1024)
+                             if args.volume_max_mb is not None
+                             else config.get("volume_max_bytes", VOLUME_MAX_BYTES)),
+        "volume_max_notes": (args.volume_max_notes if args.volume_max_notes is not None
+                             else config.get("volume_max_notes", VOLUME_MAX_NOTES)),
+        "volume_max_render_seconds": (args.volume_max_seconds
+                                      if args.volume_max_seconds is not None
+                                      else config.get("volume_max_render_seconds",
+                                                      VOLUME_MAX_RENDER_SECONDS)),
+        "dedupe": bool(pick("dedupe", DEDUPE_NOTES)),
+        "primary_tags": list(pick("primary_tags", PRIMARY_TAGS)),
+        "index_format": pick("index_format", CHAPTER_INDEX_FORMAT),
+        "index_gzip": bool(pick("index_gzip", CHAPTER_INDEX_GZIP)),
+        "pandoc_backend": pick("pandoc_backend", PANDOC_BACKEND),
+        "pandoc_server": pick("pandoc_server", PANDOC_SERVER_URL),
+        "isolate_failures": bool(pick("isolate_failures", FAILURE_ISOLATION)),
+        "profile": list(pick("profile", None) or [
+            pattern.strip() for pattern in os.environ.get(PROFILE_ENV_VAR, "").split(",")
+            if pattern.strip()] or PROFILE_STAGES),
+    }
+
+
+def choose_metadata_types():
+    """
+    交互选择处理模式
+
+    Returns:
+        list: 选中的元数据类型列表
+    """
+    print(f"\n请选择处理模式:")
+    print(f"1. 按标签 (Tag) 处理")
+    print(f"2. 按分类 (Category) 处理")
+    print(f"3. 同时处理标签和分类")
+
+    while True:
+        mode_choice = input("请选择 (1/2/3): ").strip()
+        if mode_choice in ['1', '2', '3']:
+            break
+        print("请输入有效选择: 1、2 或 3")
 
-    # 询问EPUB生成方式
+    return {"1": ["tag"], "2": ["category"], "3": ["tag", "category"]}[mode_choice]
+
+
+def choose_build():
+    """
+    交互选择EPUB生成方式
+
+    Returns:
+        str: 导出方式名称（BUILD_CHOICES的键）
+    """
     print(f"\n选择EPUB生成方式:")
     print(f"1. 按一级目录分别生成多个EPUB文件（推荐，避免超时）")
     print(f"2. 生成单个完整EPUB文件（可能超时）")
     print(f"3. 合并所有章节生成一个大的EPUB文件")
     print(f"4. 跳过EPUB生成")
+    print(f"5. 导出静态HTML网站（每个标签一个页面，只更新变化的页面）")
 
     while True:
-        choice = input("请选择 (1/2/3/4): ").strip()
-        if choice in ['1', '2', '3', '4']:
+        choice = input("请选择 (1/2/3/4/5): ").strip()
+        if choice in ['1', '2', '3', '4', '5']:
             break
-        print("请输入有效选择: 1、2、3 或 4")
+        print("请输入有效选择: 1、2、3、4 或 5")
+
+    return next(name for name, number in BUILD_CHOICES.items() if number == choice)
+
 
-    if choice == '1':
+def run_build(build, chapter_structure, sorted_files, index_path, metadata_type, settings,
+              only_groups=None, tag_trie=None):
+    """
+    按指定方式生成EPUB
+
+    Args:
+        build (str): 导出方式名称（BUILD_CHOICES的键）
+        chapter_structure (dict): 章节结构
+        sorted_files (list): 排序后的文件列表
+        index_path (Path): 索引文件路径
+        metadata_type (str): "tag" 或 "category"
+        settings (dict): resolve_settings 返回的设置
+        only_groups (set): 分章节生成时只重建这些一级目录，None表示全部
+        tag_trie (dict): 已构建的标签树
+    """
+    if build == "chapters":
         # 按章节分别生成EPUB
         print(f"\n正在按一级目录分别生成EPUB文件...")
         generated_files = generate_epub_by_chapters(
-            chapter_structure, OUTPUT_DIRECTORY, metadata_type)
+            chapter_structure, OUTPUT_DIRECTORY, metadata_type,
+            jobs=settings["build_jobs"], force=settings["force"],
+            only_groups=only_groups, dedupe=settings["dedupe"],
+            volume_budget={"bytes": settings["volume_max_bytes"],
+                           "notes": settings["volume_max_notes"],
+                           "seconds": settings["volume_max_render_seconds"]},
+            tag_trie=tag_trie)
 
         if generated_files:
             print(f"\n🎉 分章节导出成功完成!")
@@ -772,12 +5079,17 @@ def main():
         else:
             print(f"\n❌ 分章节导出失败")
 
-    elif choice == '2':
+    elif build == "single":
         # 生成单个完整EPUB
         print(f"\n正在生成完整EPUB文件...")
         output_filename = f"Obsidian_导出_合集_{metadata_type}.epub"
         output_path = OUTPUT_DIRECTORY / output_filename
-        success = generate_epub(sorted_files, output_path, metadata_type)
+        if settings["dedupe"]:
+            chapter_structure = dict(chapter_structure,
+                                     chapters=dedupe_chapters(chapter_structure["chapters"]))
+            sorted_files = generate_sorted_file_list(chapter_structure)
+        success = generate_epub(sorted_files, output_path, metadata_type,
+                                chapter_structure, jobs=settings["build_jobs"])
 
         if success:
             print(f"\n🎉 完整导出成功完成!")
@@ -792,18 +5104,175 @@ def main():
                 print(f"📏 EPUB大小: {size_mb:.2f} MB")
         else:
             print(f"\n❌ 完整导出失败，建议尝试分章节生成")
-    elif choice == '3':
+    elif build == "merged":
         # 合并所有章节生成一个大的EPUB
         success = generate_merged_epub(
-            chapter_structure, OUTPUT_DIRECTORY, metadata_type)
+            chapter_structure, OUTPUT_DIRECTORY, metadata_type, dedupe=settings["dedupe"],
+            tag_trie=tag_trie, jobs=settings["build_jobs"])
         if success:
             print(f"\n📁 索引文件: {index_path.absolute()}")
         else:
             print(f"\n❌ 合并导出失败")
+    elif build == "site":
+        # 导出静态HTML网站
+        print(f"\n正在导出静态HTML网站...")
+        try:
+            site_stats = generate_html_site(
+                chapter_structure, OUTPUT_DIRECTORY, metadata_type, tag_trie=tag_trie,
+                jobs=settings["build_jobs"], force=settings["force"])
+        except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"\n❌ 网站导出失败: {e}")
+        else:
+            print(f"\n🎉 网站导出完成!")
+            print(f"📁 网站目录: {site_stats['site_dir'].absolute()}")
+            print(f"📝 重写页面: {site_stats['written']} 个，未变化: {site_stats['unchanged']} 个，"
+                  f"删除: {site_stats['removed']} 个")
     else:
         print(f"\n✅ 章节索引生成完成，EPUB生成已跳过")
         print(f"📁 索引文件: {index_path.absolute()}")
 
 
+def export_view(note_table, metadata_type, settings, changed_paths=None):
+    """
+    根据一种元数据生成章节结构、索引并按要求导出EPUB
+
+    Args:
+        note_table (dict): 笔记表（见 new_note_table）
+        metadata_type (str): "tag" 或 "category"
+        settings (dict): resolve_settings 返回的设置
+        changed_paths (set): 监听模式下发生变化的笔记路径，提供时只重建受影响的EPUB
+
+    Returns:
+        list: 使用的导出方式列表
+    """
+    field_name = "标签" if metadata_type == "tag" else "分类"
+    previous_structure = (load_chapter_index(OUTPUT_DIRECTORY, metadata_type)
+                          if changed_paths is not None else None)
+
+    print("\n" + "=" * 80)
+    print(f"按{field_name}处理")
+    print("=" * 80)
+
+    # 收集并排序所有元数据
+    print(f"\n正在收集和分析{field_name}...")
+    with report_stage(f"collect:{metadata_type}") as stage:
+        tag_index = collect_all_metadata(note_table, metadata_type)
+        stage["files"] = len(note_table["paths"])
+
+    # 生成章节结构
+    print(f"\n正在生成章节结构...")
+    with report_stage(f"structure:{metadata_type}") as stage:
+        chapter_structure = generate_chapter_structure(note_table, tag_index, metadata_type)
+        stage["files"] = tag_index["tagged_notes"]
+
+    # 保存索引文件
+    with report_stage(f"index:{metadata_type}") as stage:
+        index_path = save_chapter_index(
+            chapter_structure, OUTPUT_DIRECTORY, metadata_type,
+            index_format=settings["index_format"], compress=settings["index_gzip"])
+        stage["bytes"] = index_path.stat().st_size
+
+    # 显示章节结构预览（标签树只构建一次，供预览和各导出方式共用）
+    tag_trie = build_tag_trie(chapter_structure["chapters"])
+    print_chapter_summary(chapter_structure, metadata_type, tag_trie)
+
+    # 生成排序文件列表
+    sorted_files = generate_sorted_file_list(chapter_structure)
+
+    # 显示统计信息
+    print("\n" + "=" * 80)
+    print("导出统计:")
+    print("=" * 80)
+    print(f"原始文件总数: {len(note_table['paths'])}")
+    print(f"有{field_name}的文件: {tag_index['tagged_notes']}")
+    print(f"包含的{field_name}数: {len(tag_index['sorted_items'])}")
+    print(f"将导出的文件: {len(sorted_files)}")
+
+    # 未指定导出方式时交互选择
+    builds = settings["builds"] or [choose_build()]
+
+    only_groups = None
+    if changed_paths is not None:
+        # 变化前后包含这些笔记的一级目录都需要重建（笔记可能被移出某个分组）
+        only_groups = find_affected_groups(chapter_structure, changed_paths)
+        if previous_structure is not None:
+            only_groups |= find_affected_groups(previous_structure, changed_paths)
+        if not only_groups:
+            print(f"\n变化的笔记不属于任何{field_name}，无需重建EPUB")
+            return builds
+        print(f"\n受影响的一级目录: {', '.join(sorted(only_groups))}")
+
+    for build in builds:
+        with report_stage(f"build:{metadata_type}:{build}") as stage:
+            run_build(build, chapter_structure, sorted_files, index_path,
+                      metadata_type, settings, only_groups, tag_trie)
+            stage["files"] = len(sorted_files)
+
+    return builds
+
+
+def main(argv=None):
+    """主程序"""
+    global VAULT_PATH, OUTPUT_DIRECTORY, PRIMARY_TAGS, PROFILE_STAGES
+    global PANDOC_BACKEND, PANDOC_SERVER_URL, FAILURE_ISOLATION
+
+    args = parse_args(argv)
+    try:
+        settings = resolve_settings(args)
+    except (OSError, ValueError) as e:
+        print(f"错误：无法加载配置文件: {e}")
+        sys.exit(1)
+
+    VAULT_PATH = settings["vault"]
+    OUTPUT_DIRECTORY = settings["output"]
+    PRIMARY_TAGS = settings["primary_tags"]
+    PROFILE_STAGES = settings["profile"]
+    PANDOC_BACKEND = settings["pandoc_backend"]
+    PANDOC_SERVER_URL = settings["pandoc_server"]
+    FAILURE_ISOLATION = settings["isolate_failures"]
+
+    print("=" * 80)
+    print("Obsidian标签化导出脚本 - 自动层级目录生成版（支持Tag/Category）")
+    print("=" * 80)
+
+    print(f"正在扫描目录: {VAULT_PATH.absolute()}")
+
+    # 第一步：选择处理模式（未通过命令行或配置文件指定时交互选择）
+    metadata_types = settings["modes"] or choose_metadata_types()
+    field_names = "、".join("标签" if metadata_type == "tag" else "分类"
+                           for metadata_type in metadata_types)
+    print(f"\n已选择: 按{field_names}处理")
+
+    # 第二步：边遍历vault边提取所需的全部元数据（利用扫描缓存，只重新读取新增或修改的文件）
+    reset_build_report()
+    with report_stage("extract") as stage:
+        scan_cache = load_scan_cache(OUTPUT_DIRECTORY)
+        ATTACHMENT_INDEX.clear()
+        md_files = iter_md_files(VAULT_PATH, settings["ignore"], ATTACHMENT_INDEX)
+        scan_stats = {}
+        note_table = analyze_files_with_all_metadata(
+            md_files, list(metadata_types) + [ALIAS_METADATA_TYPE], scan_cache,
+            jobs=settings["jobs"], stats=scan_stats)
+        save_scan_cache(scan_cache, OUTPUT_DIRECTORY)
+        build_note_table_index(note_table)
+        stage["files"] = scan_stats["files"]
+        stage["bytes"] = scan_stats["bytes_read"]
+    print(f"找到 {len(note_table['paths'])} 个markdown文件")
+
+    # 第三步：为每种元数据生成章节结构、索引和EPUB
+    for metadata_type in metadata_types:
+        builds = export_view(note_table, metadata_type, settings)
+        # 交互选择的导出方式在后续视图和监听模式中沿用
+        settings["builds"] = settings["builds"] or builds
+
+    prune_render_cache(OUTPUT_DIRECTORY / RENDER_CACHE_DIRNAME)
+    report_path = save_build_report(OUTPUT_DIRECTORY)
+    print(f"\n📊 构建报告: {report_path.absolute()}")
+
+    # 第四步：监听模式下持续增量更新
+    if settings["watch"]:
+        watch_vault(metadata_types, settings)
+
+
 if __name__ == "__main__":
     main()
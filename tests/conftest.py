@@ -0,0 +1,27 @@
+"""
+测试公共设置：让测试可以直接导入仓库根目录下的脚本和 benchmarks 包，并提供构造章节结构的工具
+"""
+
+from pathlib import Path
+import sys
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import obsidian_export  # noqa: E402
+
+
+@pytest.fixture
+def chapter_structure_for():
+    """由 {笔记路径: [标签, ...]} 经笔记表生成章节结构"""
+    def build(notes, metadata_type="tag"):
+        note_table = obsidian_export.new_note_table((metadata_type,))
+        for file_path, items in notes.items():
+            obsidian_export.add_note(note_table, file_path, {metadata_type: items})
+        tag_index = obsidian_export.collect_all_metadata(note_table, metadata_type)
+        return obsidian_export.generate_chapter_structure(note_table, tag_index, metadata_type)
+
+    return build
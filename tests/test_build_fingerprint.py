@@ -0,0 +1,91 @@
+"""
+分组EPUB构建指纹的测试：影响输出的输入变化时指纹必须变化
+"""
+
+import os
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.fixture
+def note(tmp_path, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 3.1")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "image.png").write_bytes(b"first image")
+    note_path = tmp_path / "note.md"
+    note_path.write_text("> Tag: #A\n\n![[image.png]]\n![](image.png)\n", encoding='utf-8')
+    return note_path
+
+
+def fingerprint(note_path, manifest):
+    return obsidian_export.compute_build_fingerprint(
+        [(note_path, ["#A"], ["#A"])], ["--toc"], manifest["notes"],
+        attachment_hashes=manifest["attachments"])
+
+
+def test_unchanged_inputs_keep_the_fingerprint(note):
+    manifest = {"notes": {}, "attachments": {}}
+
+    assert fingerprint(note, manifest) == fingerprint(note, manifest)
+    assert obsidian_export.get_note_embeds(note, manifest["notes"]) == ["image.png"]
+    assert list(manifest["attachments"]) == [str(note.parent / "image.png")]
+
+
+def test_pandoc_upgrade_changes_the_fingerprint(note, monkeypatch):
+    manifest = {"notes": {}, "attachments": {}}
+    before = fingerprint(note, manifest)
+
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 3.2")
+
+    assert fingerprint(note, manifest) != before
+
+
+def test_replaced_attachment_changes_the_fingerprint(note):
+    manifest = {"notes": {}, "attachments": {}}
+    before = fingerprint(note, manifest)
+
+    image_path = note.parent / "image.png"
+    image_path.write_bytes(b"second image")
+    stat_result = image_path.stat()
+    os.utime(image_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10 ** 9))
+
+    assert fingerprint(note, manifest) != before
+
+
+def test_missing_attachment_changes_the_fingerprint(note):
+    manifest = {"notes": {}, "attachments": {}}
+    before = fingerprint(note, manifest)
+
+    (note.parent / "image.png").unlink()
+
+    assert fingerprint(note, manifest) != before
+
+
+def test_dedupe_links_change_the_fingerprint(note, tmp_path):
+    manifest = {"notes": {}, "attachments": {}}
+    other_path = tmp_path / "other.md"
+    link_context = obsidian_export.build_link_context([note, other_path])
+    chapters = [{"item": "#A", "levels": ["A"], "files": [str(note)]},
+                {"item": "#A/B", "levels": ["A", "B"], "files": [], "links": []}]
+
+    def chapter_fingerprint(chapters):
+        return obsidian_export.compute_build_fingerprint(
+            [(note, ["#A"], ["#A"])], ["--toc"], manifest["notes"], link_context,
+            manifest["attachments"], chapters)
+
+    before = chapter_fingerprint(chapters)
+    chapters[1]["links"] = [str(other_path)]
+
+    assert chapter_fingerprint(chapters) != before
+
+
+def test_missing_pandoc_has_no_version(monkeypatch, tmp_path):
+    monkeypatch.setattr(obsidian_export, "PANDOC_BACKEND", "subprocess")
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", str(tmp_path / "no-such-pandoc"))
+    obsidian_export.get_pandoc_version.cache_clear()
+    try:
+        assert obsidian_export.get_pandoc_version() is None
+    finally:
+        obsidian_export.get_pandoc_version.cache_clear()
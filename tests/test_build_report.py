@@ -0,0 +1,79 @@
+"""
+构建报告的测试：阶段记录、Pandoc调用记录和性能分析
+"""
+
+import json
+import sys
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.fixture(autouse=True)
+def build_report(monkeypatch):
+    report = {"stages": [], "pandoc_runs": [], "quarantined": []}
+    monkeypatch.setattr(obsidian_export, "BUILD_REPORT", report)
+    return report
+
+
+def test_stage_records_throughput_and_pandoc_runs(build_report):
+    with obsidian_export.report_stage("build:tag") as stage:
+        result = obsidian_export.run_pandoc(
+            [sys.executable, "-c", "import sys; sys.stdout.write(sys.stdin.read().upper())"],
+            input=b"abc", label="note.md")
+        stage.update(files=2, bytes=3 * 1024 * 1024)
+    obsidian_export.record_pandoc_run("outside", 0.5, 10, 1)
+
+    assert result.stdout == b"ABC"
+    first_run = build_report["pandoc_runs"][0]
+    assert (first_run["label"], first_run["input_bytes"], first_run["returncode"]) \
+        == ("note.md", 3, 0)
+    [record] = build_report["stages"]
+    assert record["name"] == "build:tag"
+    assert record["pandoc_runs"] == 1
+    assert record["files_per_second"] == round(2 / record["seconds"], 1)
+    assert record["mb_per_second"] == round(3 / record["seconds"], 3)
+    if first_run["peak_rss_kb"] is not None:
+        assert record["child_peak_rss_kb"] == first_run["peak_rss_kb"]
+
+
+def test_failing_stage_is_still_recorded(build_report):
+    with pytest.raises(ValueError):
+        with obsidian_export.report_stage("extract"):
+            raise ValueError("boom")
+
+    assert [stage["name"] for stage in build_report["stages"]] == ["extract"]
+
+
+def test_matching_stages_are_profiled(tmp_path, monkeypatch, build_report):
+    monkeypatch.setattr(obsidian_export, "PROFILE_STAGES", ["build:*"])
+
+    with obsidian_export.report_stage("extract", tmp_path):
+        pass
+    with obsidian_export.report_stage("build:tag:chapters", tmp_path):
+        sum(range(1000))
+
+    extract, build = build_report["stages"]
+    assert "profile" not in extract
+    assert build["profile"] == str(tmp_path / "profile_build_tag_chapters.prof")
+    assert (tmp_path / "profile_build_tag_chapters.prof").exists()
+
+
+def test_saved_report_summarizes_runs(tmp_path, build_report):
+    with obsidian_export.report_stage("extract") as stage:
+        stage["files"] = 3
+    for label, seconds, peak_rss_kb in (("a", 0.2, 100), ("b", 0.7, None), ("c", 0.1, 300)):
+        obsidian_export.record_pandoc_run(label, seconds, 10, 0, peak_rss_kb)
+    build_report["quarantined"].append("vault/bad.md")
+
+    report_path = obsidian_export.save_build_report(tmp_path / "out")
+
+    assert report_path == tmp_path / "out" / obsidian_export.BUILD_REPORT_FILENAME
+    report = json.loads(report_path.read_text(encoding='utf-8'))
+    assert report["total_seconds"] == build_report["stages"][0]["seconds"]
+    assert report["pandoc"]["runs"] == 3
+    assert report["pandoc"]["seconds"] == 1.0
+    assert report["pandoc"]["peak_rss_kb"] == 300
+    assert [run["label"] for run in report["pandoc"]["slowest"]] == ["b", "a", "c"]
+    assert report["quarantined"] == ["vault/bad.md"]
@@ -0,0 +1,95 @@
+"""
+分章节并行构建的测试：最长任务优先调度、按分组顺序汇报以及未变化分组的跳过
+"""
+
+from concurrent.futures import Future
+
+import pytest
+
+import obsidian_export
+
+
+class InlineExecutor:
+    """按提交顺序立即执行任务的线程池替身，记录调度顺序"""
+
+    submitted = []
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args, **kwargs):
+        InlineExecutor.submitted.append(args[2])
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+@pytest.fixture
+def groups(tmp_path, monkeypatch, chapter_structure_for):
+    """三个一级目录，笔记总大小 B > C > A"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(obsidian_export, "RENDER_CACHE_ENABLED", False)
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 0.0-stub")
+    monkeypatch.setattr(obsidian_export, "ThreadPoolExecutor", InlineExecutor)
+    InlineExecutor.submitted = []
+
+    built = []
+
+    def generate_single_epub(sorted_files, output_path, category_name, *args, **kwargs):
+        built.append(category_name)
+        output_path.write_text("epub", encoding='utf-8')
+        return True
+
+    monkeypatch.setattr(obsidian_export, "generate_single_epub", generate_single_epub)
+
+    (tmp_path / "v").mkdir()
+    (tmp_path / "out").mkdir()
+    notes = {}
+    for name, size in (("1-A", 10), ("2-B", 3000), ("3-C", 500)):
+        file_path = f"v/{name}.md"
+        (tmp_path / file_path).write_text("x" * size, encoding='utf-8')
+        notes[file_path] = [f"#{name}"]
+    return chapter_structure_for(notes), built
+
+
+def test_largest_group_is_scheduled_first(groups, tmp_path, capsys):
+    chapter_structure, built = groups
+
+    generated = obsidian_export.generate_epub_by_chapters(
+        chapter_structure, tmp_path / "out", "tag", jobs=2)
+
+    assert InlineExecutor.submitted == ["2-B", "3-C", "1-A"]
+    # 结果仍按分组顺序汇报
+    assert [path.name for path in generated] == [
+        "Obsidian_tag_1-A.epub", "Obsidian_tag_2-B.epub", "Obsidian_tag_3-C.epub"]
+    output = capsys.readouterr().out
+    assert output.index("正在处理: 1-A") < output.index("正在处理: 2-B") \
+        < output.index("正在处理: 3-C")
+
+
+def test_serial_build_keeps_group_order(groups, tmp_path):
+    chapter_structure, built = groups
+
+    obsidian_export.generate_epub_by_chapters(chapter_structure, tmp_path / "out", "tag", jobs=1)
+
+    assert built == ["1-A", "2-B", "3-C"]
+
+
+def test_unchanged_groups_are_skipped(groups, tmp_path):
+    chapter_structure, built = groups
+    output_dir = tmp_path / "out"
+    obsidian_export.generate_epub_by_chapters(chapter_structure, output_dir, "tag", jobs=2)
+    built.clear()
+
+    (tmp_path / "v" / "3-C.md").write_text("changed", encoding='utf-8')
+    generated = obsidian_export.generate_epub_by_chapters(chapter_structure, output_dir, "tag",
+                                                          jobs=2)
+
+    assert built == ["3-C"]
+    assert len(generated) == 3
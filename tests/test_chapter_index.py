@@ -0,0 +1,58 @@
+"""
+章节索引的保存与读取测试（完整格式、紧凑格式及gzip压缩）
+"""
+
+import json
+
+import pytest
+
+import obsidian_export
+
+NOTES = {
+    "vault/a.md": ["#1-成长/1-内在/1C-自强", "#2-文化"],
+    "vault/b.md": ["#1-成长/1-内在"],
+    "vault/sub/c.md": ["#1-成长/1-内在/1C-自强", "#1-成长/2-外在"],
+    "vault/d.md": ["#2-文化/1-艺术/1A-总论/深层"],
+}
+
+
+@pytest.mark.parametrize("index_format", ["full", "compact"])
+@pytest.mark.parametrize("compress", [False, True])
+def test_read_chapter_index_round_trip(tmp_path, chapter_structure_for, index_format, compress):
+    chapter_structure = chapter_structure_for(NOTES)
+
+    index_path = obsidian_export.save_chapter_index(
+        chapter_structure, tmp_path, "tag", index_format=index_format, compress=compress)
+
+    assert index_path.name == "chapter_index_tag.json" + (".gz" if compress else "")
+    expected = json.loads(json.dumps(chapter_structure, ensure_ascii=False))
+    assert obsidian_export.read_chapter_index(index_path) == expected
+    assert obsidian_export.load_chapter_index(tmp_path, "tag") == expected
+
+
+def test_compact_index_stores_each_path_once(tmp_path, chapter_structure_for):
+    chapter_structure = chapter_structure_for(NOTES)
+
+    index_path = obsidian_export.save_chapter_index(
+        chapter_structure, tmp_path, "tag", index_format="compact", compress=False)
+
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index_data = json.load(f)
+    assert index_data["format"] == "compact"
+    assert sorted(index_data["files"]) == sorted(NOTES)
+    assert [node["name"] for node in index_data["tree"]] == ["1-成长", "2-文化"]
+
+
+def test_switching_compression_removes_stale_index(tmp_path, chapter_structure_for):
+    chapter_structure = chapter_structure_for(NOTES)
+
+    obsidian_export.save_chapter_index(chapter_structure, tmp_path, "tag", compress=True)
+    obsidian_export.save_chapter_index(chapter_structure, tmp_path, "tag", compress=False)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["chapter_index_tag.json"]
+
+
+def test_load_chapter_index_rejects_corrupt_file(tmp_path):
+    (tmp_path / "chapter_index_tag.json").write_text("{not json", encoding='utf-8')
+
+    assert obsidian_export.load_chapter_index(tmp_path, "tag") is None
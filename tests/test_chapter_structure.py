@@ -0,0 +1,96 @@
+"""
+章节结构的测试：倒排索引生成的章节与逐项扫描全部笔记的结果一致
+"""
+
+from pathlib import Path
+
+import obsidian_export
+
+NOTES = {
+    "vault/b/note2.md": ["#1-A/1-x", "#2-B"],
+    "vault/a.md": ["#2-B", "#1-A"],
+    "vault/b/note10.md": ["#1-A/1-x"],
+    "vault/plain.md": [],
+    "vault/c.md": ["#10-C/深/更深/再深/最深"],
+}
+
+
+def note_table_for(notes):
+    note_table = obsidian_export.new_note_table(("tag",))
+    for file_path, items in notes.items():
+        obsidian_export.add_note(note_table, file_path, {"tag": items})
+    return note_table
+
+
+def reference_chapters(notes):
+    """逐个项目扫描全部笔记（原来的 O(项目×笔记) 做法）"""
+    items = {item for note_items in notes.values() for item in note_items}
+    chapters = []
+    for item in sorted(items, key=lambda item: obsidian_export.parse_hierarchy(item)[2]):
+        files = sorted(Path(file_path) for file_path, note_items in notes.items()
+                       if item in note_items)
+        chapters.append((item, [str(file_path) for file_path in files]))
+    return chapters
+
+
+def test_chapters_match_the_full_scan(chapter_structure_for):
+    chapter_structure = chapter_structure_for(NOTES)
+
+    assert [(chapter["item"], chapter["files"]) for chapter in chapter_structure["chapters"]] \
+        == reference_chapters(NOTES)
+    assert chapter_structure["metadata"]["total_files"] == 4
+    assert chapter_structure["chapters"][-1]["levels"] == ["10-C", "深", "更深", "再深", "最深"]
+
+
+def test_file_order_does_not_depend_on_scan_order(chapter_structure_for):
+    forward = chapter_structure_for(NOTES)["chapters"]
+    backward = chapter_structure_for(dict(reversed(list(NOTES.items()))))["chapters"]
+
+    assert [(chapter["item"], chapter["files"]) for chapter in forward] \
+        == [(chapter["item"], chapter["files"]) for chapter in backward]
+
+
+def test_item_file_index_holds_note_ids():
+    note_table = note_table_for(NOTES)
+    tag_index = obsidian_export.collect_all_metadata(note_table, "tag")
+
+    item_ids = {note_table["items"][item_id]: item_id for item_id in tag_index["sorted_items"]}
+    files = [note_table["paths"][note_id]
+             for note_id in tag_index["item_files"][item_ids["#1-A/1-x"]]]
+
+    assert files == ["vault/b/note10.md", "vault/b/note2.md"]
+
+
+def test_note_table_round_trip():
+    metadata = {
+        "vault/a.md": {"tag": ["#2-B", "#1-A", "#2-B"], "category": ["#1-A"]},
+        "vault/b.md": {"tag": [], "category": ["#3-C", "#3-C"]},
+        "vault/c.md": {"tag": ["#1-A"], "category": []},
+    }
+    note_table = obsidian_export.new_note_table(("tag", "category"))
+    note_ids = [obsidian_export.add_note(note_table, file_path, note_metadata)
+                for file_path, note_metadata in metadata.items()]
+
+    assert note_ids == [0, 1, 2]
+    # 同一笔记中重复的项目只保存一次，且保持原有顺序；不同类型共用项目表
+    assert list(obsidian_export.iter_note_entries(note_table, "tag")) == [
+        (Path("vault/a.md"), ["#2-B", "#1-A"]), (Path("vault/b.md"), []),
+        (Path("vault/c.md"), ["#1-A"])]
+    assert [obsidian_export.note_items(note_table, "category", note_id)
+            for note_id in note_ids] == [["#1-A"], ["#3-C"], []]
+    assert note_table["items"] == ["#2-B", "#1-A", "#3-C"]
+    assert list(note_table["offsets"]["tag"]) == [0, 2, 2, 3]
+
+
+def test_each_metadata_type_builds_its_own_chapters():
+    note_table = obsidian_export.new_note_table(("tag", "category"))
+    for file_path, items in NOTES.items():
+        obsidian_export.add_note(note_table, file_path, {"tag": items, "category": items[:1]})
+
+    for metadata_type, notes in (("tag", NOTES), ("category", {
+            file_path: items[:1] for file_path, items in NOTES.items()})):
+        chapter_structure = obsidian_export.generate_chapter_structure(
+            note_table, obsidian_export.collect_all_metadata(note_table, metadata_type),
+            metadata_type)
+        assert [(chapter["item"], chapter["files"])
+                for chapter in chapter_structure["chapters"]] == reference_chapters(notes)
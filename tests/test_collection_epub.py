@@ -0,0 +1,61 @@
+"""
+内置流式EPUB写入器的测试：笔记中的原始HTML必须生成格式良好的XHTML页面
+"""
+
+import zipfile
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.mark.parametrize("fragment, expected", [
+    ("<p>a<br>b</p>", "<p>a<br/>b</p>"),
+    ('<img src="x.png" alt=a>', '<img src="x.png" alt="a"/>'),
+    ("<p>one<p>two", "<p>one</p><p>two</p>"),
+    ("<div><span>open</div>", "<div><span>open</span></div>"),
+    ("text</em> &nbsp;&amp; &lt;", "text \xa0&amp; &lt;"),
+    ("<input disabled>", '<input disabled="disabled"/>'),
+    ("<!-- a -- b -->", "<!-- a - - b -->"),
+])
+def test_xhtml_fragment(fragment, expected):
+    result = obsidian_export.xhtml_fragment(fragment)
+
+    assert result == expected
+    assert obsidian_export.is_well_formed_xml(f"<body>{result}</body>")
+
+
+def write_book(tmp_path, monkeypatch, fragment):
+    """用给定的HTML片段作为唯一笔记的渲染结果生成合集"""
+    note_path = tmp_path / "note.md"
+    note_path.write_text("note", encoding='utf-8')
+    rendered_path = tmp_path / "note.html5"
+    rendered_path.write_text(fragment, encoding='utf-8')
+    monkeypatch.setattr(obsidian_export, "render_notes",
+                        lambda note_paths, *args, **kwargs: {note_path: rendered_path})
+
+    chapters = [{"item": "#A", "levels": ["A"], "files": [str(note_path)]}]
+    output_path = tmp_path / "book.epub"
+    return obsidian_export.write_collection_epub(chapters, output_path, "Book"), output_path
+
+
+def test_raw_html_becomes_well_formed_pages(tmp_path, monkeypatch):
+    page_count, output_path = write_book(
+        tmp_path, monkeypatch, "<p>line<br>break<p>unclosed &nbsp;<hr></p></p></p>")
+
+    assert page_count == 1
+    with zipfile.ZipFile(output_path) as book:
+        pages = [name for name in book.namelist() if name.endswith(".xhtml")]
+        assert pages
+        for name in pages:
+            assert obsidian_export.is_well_formed_xml(book.read(name).decode('utf-8')), name
+
+
+def test_unfixable_page_leaves_no_output(tmp_path, monkeypatch):
+    # 未声明的命名空间前缀无法修复，调用方应改用Pandoc写入器
+    page_count, output_path = write_book(
+        tmp_path, monkeypatch, '<svg><use xlink:href="#a"/></svg>')
+
+    assert page_count is None
+    assert not output_path.exists()
+    assert not output_path.with_suffix(".tmp").exists()
@@ -0,0 +1,54 @@
+"""
+渲染缓存路径中拼接AST的测试
+"""
+
+import io
+import json
+
+import obsidian_export
+from benchmarks import stub_pandoc
+
+
+def header(level, text):
+    return {"t": "Header", "c": [level, ["", [], []], [{"t": "Str", "c": text}]]}
+
+
+def combine(chapters, rendered_notes, heading_shift=3):
+    output = io.StringIO()
+    obsidian_export.write_combined_ast(chapters, rendered_notes, output, heading_shift,
+                                       obsidian_export.build_link_context(rendered_notes))
+    return json.loads(output.getvalue())
+
+
+def test_nested_headings_are_shifted(tmp_path):
+    note_path = tmp_path / "note.md"
+    cached_ast = tmp_path / "note.json"
+    cached_ast.write_text(json.dumps({"pandoc-api-version": [1, 23, 1], "meta": {}, "blocks": [
+        header(1, "top"),
+        {"t": "BlockQuote", "c": [header(2, "quoted")]},
+        {"t": "BulletList", "c": [[header(1, "listed")]]},
+        {"t": "Div", "c": [["", [], []], [header(5, "nested")]]},
+    ]}), encoding='utf-8')
+    chapters = [{"item": "#A", "levels": ["A"], "files": [str(note_path)]}]
+
+    document = combine(chapters, {note_path: cached_ast})
+
+    blocks = document["blocks"]
+    assert document["pandoc-api-version"] == [1, 23, 1]
+    assert [blocks[0]["c"][0], blocks[1]["c"][0]] == [1, 4]
+    assert blocks[2]["c"][0]["c"][0] == 5
+    assert blocks[3]["c"][0][0]["c"][0] == 4
+    assert blocks[4]["c"][1][0]["c"][0] == 6
+
+
+def test_book_without_rendered_notes_is_valid(tmp_path, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", stub_pandoc.__file__)
+    monkeypatch.setattr(obsidian_export, "PANDOC_BACKEND", "subprocess")
+    chapters = [{"item": "#A", "levels": ["A"], "files": []},
+                {"item": "#A/B", "levels": ["A", "B"], "files": [], "links": ["x.md"]}]
+
+    document = combine(chapters, {})
+
+    assert document["pandoc-api-version"] == stub_pandoc.PANDOC_API_VERSION
+    assert [(block["t"], block["c"][0]) for block in document["blocks"]] == [
+        ("Header", 1), ("Header", 2)]
@@ -0,0 +1,72 @@
+"""
+多标签笔记去重测试：规范章节的选择，以及Pandoc输入中保留的笔记链接
+"""
+
+import io
+import json
+
+import obsidian_export
+
+
+def chapter(item, files):
+    _, levels, _ = obsidian_export.parse_hierarchy(item)
+    return {"item": item, "levels": levels, "files": list(files), "file_count": len(files)}
+
+
+def test_note_is_kept_in_first_chapter_by_default():
+    chapters = [chapter("#A", ["x.md", "y.md"]), chapter("#B", ["x.md", "z.md"])]
+
+    deduped = obsidian_export.dedupe_chapters(chapters, primary_items=[])
+
+    assert [c["files"] for c in deduped] == [["x.md", "y.md"], ["z.md"]]
+    assert [c["links"] for c in deduped] == [[], ["x.md"]]
+    assert [c["file_count"] for c in deduped] == [2, 1]
+    # 原章节列表不被修改
+    assert chapters[1]["files"] == ["x.md", "z.md"]
+
+
+def test_primary_tag_and_its_children_win():
+    chapters = [chapter("#A", ["x.md"]), chapter("#B/sub", ["x.md"]), chapter("#B", ["x.md"])]
+
+    deduped = obsidian_export.dedupe_chapters(chapters, primary_items=["B"])
+
+    assert [c["files"] for c in deduped] == [[], ["x.md"], []]
+    assert [c["links"] for c in deduped] == [["x.md"], [], ["x.md"]]
+
+
+def test_chapters_with_only_links_keep_their_headings():
+    chapters = obsidian_export.dedupe_chapters(
+        [chapter("#A", ["x.md"]), chapter("#B", ["x.md"])], primary_items=[])
+
+    titles = [[title for _, title, _ in headings]
+              for _, headings in obsidian_export.iter_chapter_headings(chapters)]
+
+    assert titles == [["A"], ["B"]]
+
+
+def test_pandoc_inputs_link_to_the_canonical_note(tmp_path):
+    note_path = tmp_path / "x.md"
+    note_path.write_text("> Tag: #A #B\n\nbody\n", encoding='utf-8')
+    chapters = obsidian_export.dedupe_chapters(
+        [chapter("#A", [str(note_path)]), chapter("#B", [str(note_path)])], primary_items=[])
+    link_context = obsidian_export.build_link_context([note_path])
+    anchor_id = link_context["anchors"][note_path]
+    cache_dir = tmp_path / "out" / obsidian_export.RENDER_CACHE_DIRNAME
+
+    markdown = "".join(obsidian_export.iter_pandoc_markdown(chapters, cache_dir, link_context, 3))
+
+    assert markdown.count("body") == 1
+    assert f"- [x](#{anchor_id})" in markdown.split("# B", 1)[1]
+
+    # 渲染缓存路径：拼接的AST中同样在B章节下插入链接列表
+    cached_ast = tmp_path / "x.json"
+    cached_ast.write_text(json.dumps({"pandoc-api-version": [1, 23, 1], "meta": {},
+                                      "blocks": [{"t": "Para", "c": [{"t": "Str", "c": "body"}]}]}),
+                          encoding='utf-8')
+    output = io.StringIO()
+    obsidian_export.write_combined_ast(chapters, {note_path: cached_ast}, output, 3, link_context)
+
+    blocks = json.loads(output.getvalue())["blocks"]
+    assert [block["t"] for block in blocks] == ["Header", "Para", "Header", "BulletList"]
+    link = blocks[-1]["c"][0][0]["c"][0]
+    assert link["c"][2] == [f"#{anchor_id}", ""]
@@ -0,0 +1,104 @@
+"""
+失败隔离的测试：二分定位出错的笔记、写入隔离清单，以及环境问题时不隔离
+"""
+
+import subprocess
+
+import pytest
+
+import obsidian_export
+from benchmarks import stub_pandoc
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """三篇笔记的临时vault，使用替身Pandoc"""
+    monkeypatch.setattr(obsidian_export, "VAULT_PATH", tmp_path / "vault")
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", stub_pandoc.__file__)
+    monkeypatch.setattr(obsidian_export, "PANDOC_BACKEND", "subprocess")
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 0.0-stub")
+    monkeypatch.setattr(obsidian_export, "FAILURE_ISOLATION", True)
+    obsidian_export.reset_build_report()
+
+    (tmp_path / "vault").mkdir()
+    notes = []
+    for name in ("a", "b", "c"):
+        note_path = tmp_path / "vault" / f"{name}.md"
+        note_path.write_text(f"# {name}\n\n正文 {name}\n", encoding='utf-8')
+        notes.append(note_path)
+    return notes
+
+
+def build(notes, output_dir):
+    sorted_files = [(note_path, ["#书"], ["#书"]) for note_path in notes]
+    return obsidian_export.generate_single_epub(
+        sorted_files, output_dir / "书.epub", "#书", "tag")
+
+
+def failing_pandoc(tmp_path):
+    """每次转换都失败的Pandoc"""
+    script = tmp_path / "broken_pandoc"
+    script.write_text("#!/bin/sh\necho 'pandoc: crashed' >&2\nexit 1\n", encoding='utf-8')
+    script.chmod(0o755)
+    return str(script)
+
+
+def test_bisect_finds_each_failing_note():
+    notes = list(range(8))
+
+    def check(paths):
+        return "bad" if {2, 7} & set(paths) else None
+
+    assert obsidian_export.bisect_failing_notes(notes, check) == [(2, "bad"), (7, "bad")]
+
+
+def test_malformed_note_is_quarantined_and_skipped(vault, tmp_path):
+    output_dir = tmp_path / "out"
+    vault[1].write_text(f"# b\n\n{stub_pandoc.FAIL_MARKER}\n", encoding='utf-8')
+
+    assert build(vault, output_dir)
+
+    quarantine = obsidian_export.load_quarantine(output_dir)
+    assert list(quarantine["notes"]) == [str(vault[1])]
+    assert quarantine["notes"][str(vault[1])]["book"] == "#书"
+    assert [record["path"] for record in obsidian_export.BUILD_REPORT["quarantined"]] \
+        == [str(vault[1])]
+    assert obsidian_export.active_quarantine(output_dir) == {vault[1]}
+
+    # 修改后自动解除隔离
+    vault[1].write_text("# b\n\n已修复\n", encoding='utf-8')
+    assert obsidian_export.active_quarantine(output_dir) == set()
+
+
+def test_pandoc_failing_every_note_quarantines_nothing(vault, tmp_path, monkeypatch, capsys):
+    output_dir = tmp_path / "out"
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", failing_pandoc(tmp_path))
+
+    assert not build(vault, output_dir)
+
+    assert obsidian_export.load_quarantine(output_dir)["notes"] == {}
+    assert obsidian_export.BUILD_REPORT["quarantined"] == []
+    assert "不隔离任何笔记" in capsys.readouterr().out
+
+
+def test_missing_pandoc_quarantines_nothing(vault, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", str(tmp_path / "no-such-pandoc"))
+
+    assert not build(vault, output_dir)
+    assert obsidian_export.load_quarantine(output_dir)["notes"] == {}
+
+
+def test_timeout_during_isolation_quarantines_nothing(vault, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    vault[1].write_text(f"# b\n\n{stub_pandoc.FAIL_MARKER}\n", encoding='utf-8')
+
+    def slow_convert(input_bytes, from_format, to_format, timeout=300, label=None):
+        if label.startswith("isolate:"):
+            raise subprocess.TimeoutExpired(label, timeout)
+        raise RuntimeError("转换失败")
+
+    monkeypatch.setattr(obsidian_export, "pandoc_convert", slow_convert)
+
+    assert not build(vault, output_dir)
+    assert obsidian_export.load_quarantine(output_dir)["notes"] == {}
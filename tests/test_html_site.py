@@ -0,0 +1,77 @@
+"""
+静态HTML网站导出测试：增量更新以及图片的重新复制
+"""
+
+import os
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.fixture
+def site_vault(tmp_path, monkeypatch, chapter_structure_for):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 0.0-stub")
+    rendered = []
+
+    def render_notes(note_paths, cache_dir, jobs=1, to_format="json", link_context=None):
+        # 代替Pandoc：每篇笔记渲染为引用同目录图片的片段
+        rendered.extend(note_paths)
+        results = {}
+        for note_path in note_paths:
+            fragment_path = tmp_path / f"{note_path.stem}.html5"
+            image_path = (note_path.parent / "image.png").absolute()
+            fragment_path.write_text(f'<p><img src="{image_path}" /></p>', encoding='utf-8')
+            results[note_path] = fragment_path
+        return results
+
+    monkeypatch.setattr(obsidian_export, "render_notes", render_notes)
+    (tmp_path / "v").mkdir()
+    (tmp_path / "v" / "image.png").write_bytes(b"first image")
+    (tmp_path / "v" / "note.md").write_text("> Tag: #A\n\n![[image.png]]\n", encoding='utf-8')
+    chapter_structure = chapter_structure_for({"v/note.md": ["#A"]})
+    return chapter_structure, tmp_path / "out", rendered
+
+
+def media_files(output_dir):
+    return sorted(path.name for path in (output_dir / "site_tag" / "media").iterdir())
+
+
+def test_unchanged_site_is_not_rewritten(site_vault):
+    chapter_structure, output_dir, rendered = site_vault
+
+    first = obsidian_export.generate_html_site(chapter_structure, output_dir, "tag")
+    second = obsidian_export.generate_html_site(chapter_structure, output_dir, "tag")
+
+    assert first["written"] == 4 and second["written"] == 0
+    assert len(rendered) == 1
+    assert len(media_files(output_dir)) == 1
+
+
+def test_deleted_media_is_copied_again(site_vault):
+    chapter_structure, output_dir, _ = site_vault
+    obsidian_export.generate_html_site(chapter_structure, output_dir, "tag")
+    media_names = media_files(output_dir)
+
+    for name in media_names:
+        (output_dir / "site_tag" / "media" / name).unlink()
+    obsidian_export.generate_html_site(chapter_structure, output_dir, "tag")
+
+    assert media_files(output_dir) == media_names
+
+
+def test_replaced_image_rerenders_the_note(site_vault, tmp_path):
+    chapter_structure, output_dir, rendered = site_vault
+    obsidian_export.generate_html_site(chapter_structure, output_dir, "tag")
+    old_media = media_files(output_dir)
+
+    image_path = tmp_path / "v" / "image.png"
+    image_path.write_bytes(b"second, larger image")
+    stat_result = image_path.stat()
+    os.utime(image_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10 ** 9))
+    obsidian_export.generate_html_site(chapter_structure, output_dir, "tag")
+
+    assert len(rendered) == 2
+    new_media = media_files(output_dir)
+    assert len(new_media) == 1 and new_media != old_media
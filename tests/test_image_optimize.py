@@ -0,0 +1,33 @@
+"""
+图片优化的测试（需要Pillow）
+"""
+
+import pytest
+
+import obsidian_export
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def image_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "IMAGE_PROFILE", {"max_size": 50, "quality": 80})
+    monkeypatch.setattr(obsidian_export, "IMAGE_CACHE_RECORDS", {})
+    return tmp_path / obsidian_export.IMAGE_CACHE_DIRNAME
+
+
+def test_exif_orientation_is_applied(tmp_path, image_cache_dir):
+    # 横向存储、EXIF标记为顺时针旋转90度显示的照片（手机竖拍的常见情况）
+    photo_path = tmp_path / "photo.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.effect_noise((400, 200), 64).convert("RGB").save(
+        photo_path, "JPEG", quality=95, exif=exif)
+
+    optimized_path = obsidian_export.optimize_image(photo_path, image_cache_dir)
+
+    assert optimized_path.parent == image_cache_dir
+    with Image.open(optimized_path) as image:
+        assert image.size == (25, 50)
+        assert image.getexif().get(0x0112) in (None, 1)
+
@@ -0,0 +1,77 @@
+"""
+native合并引擎的测试：合并后的EPUB完整且各书条目内容不变
+"""
+
+import zipfile
+
+import pytest
+
+import merge_epub
+import obsidian_export
+
+
+@pytest.fixture
+def source_books(tmp_path, monkeypatch):
+    """用内置写入器生成两本小EPUB"""
+    books = []
+    for book_number in range(1, 3):
+        note_path = tmp_path / f"note{book_number}.md"
+        note_path.write_text("note", encoding='utf-8')
+        rendered_path = tmp_path / f"note{book_number}.html5"
+        rendered_path.write_text(f"<p>{'内容 ' * 200}{book_number}</p>", encoding='utf-8')
+        monkeypatch.setattr(obsidian_export, "render_notes",
+                            lambda note_paths, *args, **kwargs: {note_path: rendered_path})
+
+        output_path = tmp_path / f"book{book_number}.epub"
+        chapters = [{"item": f"#B{book_number}", "levels": [f"B{book_number}"],
+                     "files": [str(note_path)]}]
+        assert obsidian_export.write_collection_epub(chapters, output_path, f"Book {book_number}")
+        books.append(output_path)
+    return books
+
+
+def merged_contents(output_path):
+    with zipfile.ZipFile(output_path) as merged:
+        assert merged.testzip() is None
+        infos = merged.infolist()
+        assert infos[0].filename == "mimetype"
+        assert infos[0].compress_type == zipfile.ZIP_STORED
+        return {info.filename: merged.read(info) for info in infos}
+
+
+def test_merged_entries_match_the_source_books(tmp_path, source_books):
+    merged_path = tmp_path / "merged.epub"
+    assert merge_epub.merge_epub_files_native(source_books, merged_path)
+
+    contents = merged_contents(merged_path)
+    for book_number, book_path in enumerate(source_books, 1):
+        with zipfile.ZipFile(book_path) as book:
+            for info in book.infolist():
+                if not info.filename.startswith("OEBPS/") or info.filename.endswith(
+                        ("content.opf", "nav.xhtml", "toc.ncx")):
+                    continue
+                target = f"OEBPS/b{book_number:02d}/{info.filename[len('OEBPS/'):]}"
+                assert contents[target] == book.read(info)
+    assert "OEBPS/b01/text/n000001.xhtml" in contents
+    assert "OEBPS/b02/text/n000001.xhtml" in contents
+
+
+def test_copy_keeps_stored_entries_stored(tmp_path):
+    with zipfile.ZipFile(tmp_path / "in.zip", "w") as input_zip:
+        input_zip.writestr("a.txt", "文本" * 100, compress_type=zipfile.ZIP_DEFLATED)
+        input_zip.writestr("b.txt", "文本" * 100, compress_type=zipfile.ZIP_STORED)
+        input_zip.writestr("c.png", b"png" * 100, compress_type=zipfile.ZIP_DEFLATED)
+
+    with zipfile.ZipFile(tmp_path / "in.zip") as input_zip, \
+            zipfile.ZipFile(tmp_path / "out.zip", "w") as output_zip:
+        for info, media_type in zip(input_zip.infolist(), ("text/plain", "text/plain", "image/png")):
+            merge_epub.copy_zip_entry(input_zip, info, output_zip, f"x/{info.filename}", media_type)
+
+    with zipfile.ZipFile(tmp_path / "out.zip") as output_zip:
+        assert output_zip.testzip() is None
+        assert [(info.filename, info.compress_type) for info in output_zip.infolist()] == [
+            ("x/a.txt", zipfile.ZIP_DEFLATED),
+            ("x/b.txt", zipfile.ZIP_STORED),
+            ("x/c.png", zipfile.ZIP_STORED),
+        ]
+        assert output_zip.read("x/a.txt") == ("文本" * 100).encode('utf-8')
@@ -0,0 +1,151 @@
+"""
+pandoc server 转换后端的测试：使用 benchmarks/stub_pandoc.py 提供的本机替身服务器
+"""
+
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import socket
+import threading
+import time
+
+import pytest
+
+import obsidian_export
+from benchmarks import stub_pandoc
+
+STUB_PANDOC = Path(stub_pandoc.__file__)
+
+
+def free_port():
+    """获取一个空闲的本机端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class CountingServer(ThreadingHTTPServer):
+    """记录接受的连接数的替身服务器"""
+
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+class SlowHandler(stub_pandoc.StubServerHandler):
+    """转换前稍作等待，使并发请求同时占用多个连接"""
+
+    def do_POST(self):
+        time.sleep(0.2)
+        super().do_POST()
+
+
+@pytest.fixture
+def server_backend(monkeypatch):
+    """切换到server后端，测试结束后关闭连接池和自动启动的服务器"""
+    port = free_port()
+    monkeypatch.setattr(obsidian_export, "PANDOC_BACKEND", "server")
+    monkeypatch.setattr(obsidian_export, "PANDOC_SERVER_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", str(STUB_PANDOC))
+    obsidian_export.stop_pandoc_server()
+    obsidian_export.get_pandoc_version.cache_clear()
+    obsidian_export.reset_build_report()
+    yield port
+    obsidian_export.stop_pandoc_server()
+    obsidian_export.get_pandoc_version.cache_clear()
+
+
+@pytest.fixture
+def stub_server(server_backend):
+    """在测试进程内运行替身服务器"""
+    def start(handler=stub_pandoc.StubServerHandler):
+        server = CountingServer(("127.0.0.1", server_backend), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    servers = []
+    yield start
+    obsidian_export.stop_pandoc_server()
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_convert_reuses_one_connection(stub_server):
+    server = stub_server()
+
+    outputs = [obsidian_export.pandoc_convert(f"note {i}".encode('utf-8'), "markdown", "html5")
+               for i in range(5)]
+
+    assert outputs == [f"<p>note {i}</p>\n".encode('utf-8') for i in range(5)]
+    # 版本查询和5次转换共用同一个keep-alive连接
+    assert server.connections == 1
+    assert obsidian_export.PANDOC_SERVER_POOL.qsize() == 1
+
+
+def test_idle_connections_are_capped_by_pool_size(stub_server, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "PANDOC_SERVER_POOL_SIZE", 2)
+    server = stub_server(SlowHandler)
+    obsidian_export.ensure_pandoc_server()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        outputs = list(executor.map(
+            lambda i: obsidian_export.pandoc_convert(f"note {i}".encode('utf-8'),
+                                                     "markdown", "html5"),
+            range(6)))
+
+    assert len(outputs) == 6
+    assert server.connections > 2
+    assert obsidian_export.PANDOC_SERVER_POOL.qsize() == 2
+
+
+def test_server_error_is_raised_and_recorded(stub_server):
+    stub_server()
+
+    with pytest.raises(RuntimeError, match="malformed note"):
+        obsidian_export.pandoc_convert(stub_pandoc.FAIL_MARKER.encode('utf-8'),
+                                       "markdown", "json", label="bad.md")
+
+    runs = obsidian_export.BUILD_REPORT["pandoc_runs"]
+    assert [(run["label"], run["returncode"]) for run in runs] == [("bad.md", 1)]
+
+    # 出错后连接仍可继续使用
+    assert obsidian_export.pandoc_convert(b"ok", "markdown", "html5") == b"<p>ok</p>\n"
+
+
+def test_server_is_started_and_stopped_on_demand(server_backend):
+    assert obsidian_export.PANDOC_SERVER_PROCESS is None
+
+    output = obsidian_export.pandoc_convert(b"hello", "markdown", "html5")
+
+    process = obsidian_export.PANDOC_SERVER_PROCESS
+    assert output == b"<p>hello</p>\n"
+    assert process is not None and process.poll() is None
+    assert obsidian_export.get_pandoc_version() == "pandoc-server 0.0-stub"
+
+    obsidian_export.stop_pandoc_server()
+
+    assert process.poll() is not None
+    assert obsidian_export.PANDOC_SERVER_PROCESS is None
+    assert obsidian_export.PANDOC_SERVER_POOL.qsize() == 0
+
+
+def test_remote_server_is_not_started(server_backend, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "PANDOC_SERVER_URL",
+                        f"http://192.0.2.1:{server_backend}")
+
+    def unreachable():
+        raise OSError("unreachable")
+
+    monkeypatch.setattr(obsidian_export, "read_pandoc_server_version", unreachable)
+
+    with pytest.raises(RuntimeError, match="无法连接pandoc server"):
+        obsidian_export.pandoc_convert(b"hello", "markdown", "html5")
+    assert obsidian_export.PANDOC_SERVER_PROCESS is None
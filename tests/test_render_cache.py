@@ -0,0 +1,66 @@
+"""
+单篇笔记渲染缓存的测试：命中、失效以及按最近使用时间淘汰
+"""
+
+import os
+
+import pytest
+
+import obsidian_export
+from benchmarks import stub_pandoc
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", stub_pandoc.__file__)
+    monkeypatch.setattr(obsidian_export, "PANDOC_BACKEND", "subprocess")
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 0.0-stub")
+    return tmp_path / "out" / obsidian_export.RENDER_CACHE_DIRNAME
+
+
+def age(path, seconds):
+    """把缓存条目的最近使用时间调早"""
+    stat_result = path.stat()
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns - seconds * 10 ** 9))
+
+
+def test_edited_note_gets_a_new_entry(tmp_path, cache_dir):
+    note_path = tmp_path / "note.md"
+    note_path.write_text("first", encoding='utf-8')
+
+    first_path, first_hit = obsidian_export.render_note(note_path, cache_dir)
+    again_path, again_hit = obsidian_export.render_note(note_path, cache_dir)
+    note_path.write_text("second", encoding='utf-8')
+    second_path, second_hit = obsidian_export.render_note(note_path, cache_dir)
+
+    assert (first_hit, again_hit, second_hit) == (False, True, False)
+    assert again_path == first_path != second_path
+
+
+def test_prune_evicts_least_recently_used_entries(tmp_path, cache_dir):
+    cache_paths = []
+    for index in range(3):
+        note_path = tmp_path / f"note{index}.md"
+        note_path.write_text(f"note {index}", encoding='utf-8')
+        cache_paths.append(obsidian_export.render_note(note_path, cache_dir)[0])
+    for index, cache_path in enumerate(cache_paths):
+        age(cache_path, 100 * (3 - index))
+
+    # 命中缓存会刷新最近使用时间：note0 变为最新
+    assert obsidian_export.render_note(tmp_path / "note0.md", cache_dir)[1]
+    entry_size = cache_paths[0].stat().st_size
+
+    removed, freed = obsidian_export.prune_render_cache(cache_dir, max_bytes=2 * entry_size)
+
+    assert (removed, freed) == (1, entry_size)
+    assert [path.exists() for path in cache_paths] == [True, False, True]
+
+
+def test_prune_within_limit_keeps_everything(tmp_path, cache_dir):
+    note_path = tmp_path / "note.md"
+    note_path.write_text("note", encoding='utf-8')
+    cache_path, _ = obsidian_export.render_note(note_path, cache_dir)
+
+    assert obsidian_export.prune_render_cache(cache_dir, max_bytes=10 ** 9) == (0, 0)
+    assert obsidian_export.prune_render_cache(tmp_path / "missing", max_bytes=0) == (0, 0)
+    assert cache_path.exists()
@@ -0,0 +1,140 @@
+"""
+元数据扫描和扫描缓存的测试
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.fixture
+def long_note(tmp_path):
+    """元数据行位于第60行的笔记"""
+    note_path = tmp_path / "long.md"
+    note_path.write_text("正文\n" * 59 + "> Tag: #深处\n", encoding='utf-8')
+    return note_path
+
+
+def test_tag_below_the_header_window_is_found_by_default(long_note):
+    assert obsidian_export.METADATA_HEADER_LINES is None
+    assert obsidian_export.extract_metadata_from_file(long_note) == ["#深处"]
+
+
+def test_header_window_is_opt_in(long_note, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "METADATA_HEADER_LINES", 50)
+
+    found, bytes_read = obsidian_export.scan_metadata_header(long_note)
+
+    assert found == {"tag": []}
+    assert bytes_read == len("正文\n".encode('utf-8')) * 50
+
+
+def test_scan_cache_is_keyed_on_the_header_window(long_note, tmp_path, monkeypatch):
+    output_dir = tmp_path / "out"
+    scan_cache = {}
+    obsidian_export.analyze_files_with_all_metadata([long_note], ["tag"], scan_cache)
+    obsidian_export.save_scan_cache(scan_cache, output_dir)
+    assert list(obsidian_export.load_scan_cache(output_dir)) == [str(long_note)]
+
+    monkeypatch.setattr(obsidian_export, "METADATA_HEADER_LINES", 50)
+
+    assert obsidian_export.load_scan_cache(output_dir) == {}
+
+
+def test_parallel_extraction_consumes_input_lazily():
+    consumed = []
+
+    def paths():
+        for index in range(100):
+            consumed.append(index)
+            yield index
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = obsidian_export.map_in_order(executor, lambda index: index * 2, paths(), 8)
+        first = next(results)
+        consumed_before_first = len(consumed)
+        rest = list(results)
+
+    assert first == 0
+    assert consumed_before_first == 8
+    assert [first] + rest == [index * 2 for index in range(100)]
+
+
+def test_scan_cache_rereads_only_changed_notes(tmp_path):
+    notes = []
+    for index in range(3):
+        note_path = tmp_path / f"note{index}.md"
+        note_path.write_text(f"> Tag: #t{index}\n", encoding='utf-8')
+        notes.append(note_path)
+    scan_cache = {}
+
+    stats = {}
+    obsidian_export.analyze_files_with_all_metadata(notes, ["tag"], scan_cache, stats=stats)
+    assert stats["cache_hits"] == 0
+
+    obsidian_export.analyze_files_with_all_metadata(notes, ["tag"], scan_cache, stats=stats)
+    assert (stats["cache_hits"], stats["bytes_read"]) == (3, 0)
+
+    notes[0].write_text("> Tag: #changed #t0\n", encoding='utf-8')
+    note_table = obsidian_export.analyze_files_with_all_metadata(
+        notes[:2], ["tag"], scan_cache, stats=stats)
+
+    assert stats["cache_hits"] == 1
+    assert obsidian_export.note_items(note_table, "tag", 0) == ["#changed", "#t0"]
+    # 已删除（不再产出）的笔记从缓存中移除
+    assert sorted(scan_cache) == sorted(str(note_path) for note_path in notes[:2])
+
+
+def test_scan_cache_hash_check_ignores_touched_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "SCAN_CACHE_USE_HASH", True)
+    note_path = tmp_path / "note.md"
+    note_path.write_text("> Tag: #a\n", encoding='utf-8')
+    scan_cache = {}
+    obsidian_export.analyze_files_with_all_metadata([note_path], ["tag"], scan_cache)
+
+    stat_result = note_path.stat()
+    os.utime(note_path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10 ** 9))
+    stats = {}
+    obsidian_export.analyze_files_with_all_metadata([note_path], ["tag"], scan_cache, stats=stats)
+
+    assert stats["cache_hits"] == 1
+    assert scan_cache[str(note_path)]["mtime"] == note_path.stat().st_mtime_ns
+
+
+def test_walk_prunes_ignored_dirs_and_indexes_attachments(tmp_path):
+    for relative_path in ("a.md", "sub/b.md", "sub/img.png", "other/img.png", ".obsidian/c.md",
+                          ".git/d.md", ".trash/e.md", "drafts/f.md", "sub/drafts/g.md"):
+        (tmp_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / relative_path).write_text("x", encoding='utf-8')
+    attachment_index = {}
+
+    md_files = obsidian_export.iter_md_files(
+        tmp_path, obsidian_export.IGNORE_PATTERNS + ["sub/drafts"], attachment_index)
+
+    assert sorted(md_files) == sorted(tmp_path / name for name in (
+        "a.md", "sub/b.md", "drafts/f.md"))
+    # 同名附件取路径最小者
+    assert attachment_index == {"img.png": tmp_path / "other" / "img.png"}
+
+
+def test_parallel_extraction_matches_serial(tmp_path):
+    notes = []
+    for index in range(40):
+        note_path = tmp_path / f"note{index}.md"
+        note_path.write_text(f"> Tag: #t{index % 7} #共同\n> Category: #c{index % 3}\n",
+                             encoding='utf-8')
+        notes.append(note_path)
+
+    def entries(jobs):
+        note_table = obsidian_export.analyze_files_with_all_metadata(
+            iter(notes), ["tag", "category"], jobs=jobs)
+        return [list(obsidian_export.iter_note_entries(note_table, metadata_type))
+                for metadata_type in ("tag", "category")]
+
+    serial = entries(1)
+
+    assert [file_path for file_path, _ in serial[0]] == notes
+    assert entries(4) == serial
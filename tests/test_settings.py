@@ -0,0 +1,56 @@
+"""
+命令行参数与配置文件合并的测试
+"""
+
+import json
+
+import pytest
+
+import obsidian_export
+
+
+def write_config(tmp_path, config):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps(config), encoding='utf-8')
+    return config_path
+
+
+def test_config_values_are_used(tmp_path):
+    config_path = write_config(tmp_path, {"jobs": 3, "build_jobs": 2})
+
+    settings = obsidian_export.resolve_settings(
+        obsidian_export.parse_args(["--config", str(config_path)]))
+
+    assert (settings["jobs"], settings["build_jobs"]) == (3, 2)
+
+
+@pytest.mark.parametrize("config", [{"jobs": 0}, {"build_jobs": -2}, {"jobs": "4"},
+                                    {"build_jobs": True}])
+def test_invalid_jobs_in_config_are_rejected(tmp_path, config):
+    config_path = write_config(tmp_path, config)
+
+    with pytest.raises(ValueError, match="必须是大于等于1的整数"):
+        obsidian_export.resolve_settings(
+            obsidian_export.parse_args(["--config", str(config_path)]))
+
+
+def test_command_line_overrides_invalid_config(tmp_path):
+    config_path = write_config(tmp_path, {"build_jobs": 0})
+
+    settings = obsidian_export.resolve_settings(
+        obsidian_export.parse_args(["--config", str(config_path), "--build-jobs", "2"]))
+
+    assert settings["build_jobs"] == 2
+
+
+def test_build_jobs_reach_the_collection_build(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(obsidian_export, "generate_epub",
+                        lambda *args, **kwargs: calls.append(kwargs["jobs"]) or False)
+    monkeypatch.setattr(obsidian_export, "OUTPUT_DIRECTORY", tmp_path)
+    settings = {"build_jobs": 3, "dedupe": False}
+
+    obsidian_export.run_build("single", {"chapters": []}, [], tmp_path / "index.json",
+                              "tag", settings)
+
+    assert calls == [3]
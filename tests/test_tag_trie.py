@@ -0,0 +1,62 @@
+"""
+标签树和章节结构摘要的测试：任意层级深度、前缀查询和子树文件
+"""
+
+import pytest
+
+import obsidian_export
+
+NOTES = {
+    "v/a.md": ["#1-A"],
+    "v/b.md": ["#1-A/1-x"],
+    "v/c.md": ["#1-A/1-x/深/更深/最深"],
+    "v/d.md": ["#2-B/1-y", "#1-A/1-x"],
+}
+
+
+@pytest.fixture
+def chapter_structure(chapter_structure_for):
+    return chapter_structure_for(NOTES)
+
+
+def test_trie_keeps_levels_beyond_four(chapter_structure):
+    tag_trie = obsidian_export.build_tag_trie(chapter_structure["chapters"])
+
+    node = obsidian_export.find_trie_node(tag_trie, "#1-A/1-x/深/更深/最深")
+    assert node["item"] == "#1-A/1-x/深/更深/最深"
+    assert node["chapter"]["levels"] == ["1-A", "1-x", "深", "更深", "最深"]
+    assert node["files"] == ["v/c.md"]
+    # 中间层级没有直接使用的笔记
+    assert obsidian_export.find_trie_node(tag_trie, "1-A/1-x/深")["chapter"] is None
+    assert list(tag_trie["children"]) == ["1-A", "2-B"]
+
+
+def test_prefix_query_and_subtree_files(chapter_structure):
+    tag_trie = obsidian_export.build_tag_trie(chapter_structure["chapters"])
+
+    assert obsidian_export.find_trie_node(tag_trie, "#1-A/不存在") is None
+    assert obsidian_export.trie_subtree_files(
+        obsidian_export.find_trie_node(tag_trie, "#1-A/1-x")) == {"v/b.md", "v/c.md", "v/d.md"}
+    assert obsidian_export.trie_subtree_files(tag_trie["children"]["1-A"]) \
+        == {"v/a.md", "v/b.md", "v/c.md", "v/d.md"}
+    assert [chapter["item"] for chapter in obsidian_export.iter_trie_chapters(
+        tag_trie["children"]["1-A"])] == ["#1-A", "#1-A/1-x", "#1-A/1-x/深/更深/最深"]
+
+
+def test_chapter_summary_format(chapter_structure, capsys):
+    obsidian_export.print_chapter_summary(chapter_structure, "tag")
+
+    output = capsys.readouterr().out
+    assert output.split("=" * 80 + "\n")[-1] == (
+        "\n"
+        "📁 1-A (4 个文件)\n"
+        "  📄 直接文件 (1 个文件)\n"
+        "  📂 1-x (3 个文件)\n"
+        "    📄 直接文件 (2 个文件)\n"
+        "    📂 深 (1 个文件)\n"
+        "      📂 更深 (1 个文件)\n"
+        "        📄 最深 (1 个文件)\n"
+        "\n"
+        "📁 2-B (1 个文件)\n"
+        "  📂 1-y (1 个文件)\n")
+    assert "章节结构预览 (按TAG分组)" in output
@@ -0,0 +1,78 @@
+"""
+自动分卷测试：按预算规划分卷、预算设置的解析以及旧分卷输出的清理
+"""
+
+import pytest
+
+import obsidian_export
+from benchmarks import stub_pandoc
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch, chapter_structure_for):
+    """A目录下有三个二级标签各两篇笔记，B、C目录各一篇笔记"""
+    monkeypatch.chdir(tmp_path)
+    notes = {}
+    for sub in ("1-x", "2-y", "3-z"):
+        for index in range(2):
+            notes[f"v/A-{sub}-{index}.md"] = [f"#1-A/{sub}"]
+    notes["v/B.md"] = ["#2-B"]
+    notes["v/C.md"] = ["#3-C"]
+    (tmp_path / "v").mkdir()
+    for file_path in notes:
+        (tmp_path / file_path).write_text("> Tag: x\n\nbody\n", encoding='utf-8')
+    return chapter_structure_for(notes)
+
+
+def budget(notes=None):
+    return {"bytes": None, "notes": notes, "seconds": None}
+
+
+def test_without_budget_each_level1_is_one_volume(vault):
+    volumes = obsidian_export.plan_volumes(vault, budget())
+
+    assert list(volumes) == ["1-A", "2-B", "3-C"]
+
+
+def test_oversized_level1_is_split_and_small_ones_are_merged(vault):
+    volumes = obsidian_export.plan_volumes(vault, budget(notes=4))
+
+    assert {name: [chapter["item"] for chapter in chapters]
+            for name, chapters in volumes.items()} == {
+        "1-A 卷1": ["#1-A/1-x", "#1-A/2-y"],
+        "1-A 卷2": ["#1-A/3-z"],
+        "2-B～3-C": ["#2-B", "#3-C"],
+    }
+
+
+def test_zero_budget_is_not_treated_as_unset(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    settings = obsidian_export.resolve_settings(obsidian_export.parse_args(
+        ["--volume-max-notes", "0", "--volume-max-mb", "0", "--volume-max-seconds", "0"]))
+
+    assert settings["volume_max_notes"] == 0
+    assert settings["volume_max_bytes"] == 0
+    assert settings["volume_max_render_seconds"] == 0
+
+    with pytest.raises(SystemExit):
+        obsidian_export.parse_args(["--volume-max-notes", "-1"])
+
+
+def test_volumes_that_are_no_longer_planned_are_removed(vault, tmp_path, monkeypatch):
+    monkeypatch.setattr(obsidian_export, "PANDOC_BINARY", stub_pandoc.__file__)
+    monkeypatch.setattr(obsidian_export, "get_pandoc_version", lambda: "pandoc 0.0-stub")
+    output_dir = tmp_path / "out"
+    unrelated_path = output_dir / "Obsidian_tag_user-file.epub"
+
+    obsidian_export.generate_epub_by_chapters(vault, output_dir, "tag",
+                                              volume_budget=budget(notes=4))
+    unrelated_path.write_text("not tracked", encoding='utf-8')
+    assert (output_dir / "Obsidian_tag_1-A 卷2.epub").exists()
+
+    generated = obsidian_export.generate_epub_by_chapters(vault, output_dir, "tag",
+                                                          volume_budget=budget())
+
+    assert sorted(path.name for path in output_dir.glob("*.epub")) == sorted(
+        path.name for path in generated) + ["Obsidian_tag_user-file.epub"]
+    assert sorted(obsidian_export.load_build_manifest(output_dir)["outputs"]) == [
+        "Obsidian_tag_1-A.epub", "Obsidian_tag_2-B.epub", "Obsidian_tag_3-C.epub"]
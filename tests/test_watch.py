@@ -0,0 +1,84 @@
+"""
+监听模式的测试：快照、受变化影响的笔记以及重建出错后继续监听
+"""
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    vault_path = tmp_path / "vault"
+    (vault_path / "assets").mkdir(parents=True)
+    (vault_path / ".obsidian").mkdir()
+    (vault_path / "assets" / "photo.png").write_bytes(b"png")
+    (vault_path / "assets" / "doc.pdf").write_bytes(b"pdf")
+    (vault_path / ".obsidian" / "app.md").write_text("config", encoding='utf-8')
+    notes = {
+        "target.md": "# 标题\n",
+        "linker.md": "见 [[target#标题]]\n",
+        "embedder.md": "![[photo.png]]\n",
+        "other.md": "无关\n",
+    }
+    for name, content in notes.items():
+        (vault_path / name).write_text(content, encoding='utf-8')
+
+    monkeypatch.setattr(obsidian_export, "VAULT_PATH", vault_path)
+    monkeypatch.setattr(obsidian_export, "NOTE_INDEX", {})
+    note_paths = sorted(vault_path / name for name in notes)
+    obsidian_export.build_note_index(note_paths)
+    return vault_path
+
+
+def test_snapshot_covers_notes_and_images(vault):
+    snapshot = obsidian_export.snapshot_vault(vault, obsidian_export.IGNORE_PATTERNS)
+
+    assert sorted(snapshot) == sorted(str(vault / name) for name in (
+        "target.md", "linker.md", "embedder.md", "other.md", "assets/photo.png"))
+
+
+def test_dependent_notes_follow_links_and_embeds(vault):
+    note_paths = [str(path) for path in sorted(vault.glob("*.md"))]
+    note_records = {}
+
+    changed = obsidian_export.find_dependent_notes(
+        {str(vault / "target.md")}, note_paths, note_records)
+    assert changed == {str(vault / "target.md"), str(vault / "linker.md")}
+
+    changed = obsidian_export.find_dependent_notes(
+        {str(vault / "assets" / "photo.png")}, note_paths, note_records)
+    assert changed == {str(vault / "embedder.md")}
+
+    # 已删除的笔记按文件名匹配
+    changed = obsidian_export.find_dependent_notes(
+        {str(vault / "gone.md")}, note_paths, note_records)
+    assert changed == {str(vault / "gone.md")}
+
+
+def test_watcher_survives_a_failing_rebuild(vault, monkeypatch, capsys):
+    monkeypatch.setattr(obsidian_export, "INotify", None)
+    changes = iter([{str(vault / "target.md")}, {str(vault / "other.md")}])
+
+    def wait_for_vault_change(vault_path, ignore_patterns, snapshot, inotify=None):
+        try:
+            return snapshot, next(changes)
+        except StopIteration:
+            raise KeyboardInterrupt
+
+    rebuilt = []
+
+    def rebuild_changed_notes(metadata_types, settings, changed_paths, note_records):
+        rebuilt.append(changed_paths)
+        if len(rebuilt) == 1:
+            raise RuntimeError("pandoc crashed")
+
+    monkeypatch.setattr(obsidian_export, "wait_for_vault_change", wait_for_vault_change)
+    monkeypatch.setattr(obsidian_export, "rebuild_changed_notes", rebuild_changed_notes)
+
+    obsidian_export.watch_vault(["tag"], {"ignore": obsidian_export.IGNORE_PATTERNS})
+
+    assert rebuilt == [{str(vault / "target.md")}, {str(vault / "other.md")}]
+    output = capsys.readouterr().out
+    assert "pandoc crashed" in output
+    assert "已停止监听" in output
@@ -0,0 +1,118 @@
+"""
+笔记间 [[链接]] 改写和标题锚点的测试
+"""
+
+import pytest
+
+import obsidian_export
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """建立临时vault和笔记索引"""
+    monkeypatch.setattr(obsidian_export, "VAULT_PATH", tmp_path)
+    monkeypatch.setattr(obsidian_export, "NOTE_INDEX", {})
+    notes = {
+        "目标.md": "# 第一节\n\n正文\n\nSecond  Part\n---\n\n```\n# 代码中的注释\n```\n\n## 自定义 {#custom}\n",
+        "来源.md": "见 [[目标]]\n",
+        "别处.md": "# 别处\n",
+    }
+    for name, content in notes.items():
+        (tmp_path / name).write_text(content, encoding='utf-8')
+    obsidian_export.build_note_index([tmp_path / name for name in notes])
+    return tmp_path
+
+
+def link_context(vault):
+    return obsidian_export.build_link_context(
+        [vault / "目标.md", vault / "来源.md"], {vault / "别处.md": "另一本书"})
+
+
+def test_link_to_note_in_book(vault):
+    context = link_context(vault)
+    anchor = context["anchors"][vault / "目标.md"]
+
+    assert obsidian_export.rewrite_note_links("[[目标]]", context) == f"[目标](#{anchor})"
+    assert (obsidian_export.rewrite_note_links("[[目标|那篇]]", context)
+            == f"[那篇](#{anchor})")
+
+
+def test_link_to_heading_in_book(vault):
+    context = link_context(vault)
+    anchor = context["anchors"][vault / "目标.md"]
+
+    assert (obsidian_export.rewrite_note_links("[[目标#第一节]]", context)
+            == f"[目标 \\> 第一节](#{obsidian_export.heading_anchor_id(anchor, '第一节')})")
+    # setext标题，匹配忽略大小写和多余空白；嵌套标题取最后一级
+    assert (obsidian_export.rewrite_note_links("[[目标#第一节#second part|下文]]", context)
+            == f"[下文](#{obsidian_export.heading_anchor_id(anchor, 'Second Part')})")
+
+
+@pytest.mark.parametrize("heading", ["不存在", "代码中的注释", "自定义 {#custom}", "^block1"])
+def test_unmatched_heading_links_to_note_start(vault, heading):
+    context = link_context(vault)
+    anchor = context["anchors"][vault / "目标.md"]
+
+    assert (obsidian_export.rewrite_note_links(f"[[目标#{heading}|x]]", context)
+            == f"[x](#{anchor})")
+
+
+def test_links_outside_book(vault):
+    context = link_context(vault)
+
+    assert obsidian_export.rewrite_note_links("[[别处]]", context) == "别处（见《另一本书》）"
+    assert obsidian_export.rewrite_note_links("[[不存在#标题]]", context) == "不存在 \\> 标题"
+
+
+def test_labels_are_escaped(vault):
+    context = link_context(vault)
+    anchor = context["anchors"][vault / "目标.md"]
+
+    assert (obsidian_export.rewrite_note_links("[[目标|*c* d_e]]", context)
+            == f"[\\*c\\* d\\_e](#{anchor})")
+    assert (obsidian_export.rewrite_note_links("[[不存在|[x]]]", context)
+            == "\\[x]")
+
+
+def test_links_in_code_are_left_alone(vault):
+    context = link_context(vault)
+    anchor = context["anchors"][vault / "目标.md"]
+    text = ("用 `[[目标]]` 链接，或 ``[[目标|x]]``：[[目标]]\n\n"
+            "```markdown\n[[目标]]\n```\n\n"
+            "~~~~\n```\n[[目标]]\n~~~~\n"
+            "[[目标]]\n")
+
+    assert obsidian_export.rewrite_note_links(text, context) == (
+        f"用 `[[目标]]` 链接，或 ``[[目标|x]]``：[目标](#{anchor})\n\n"
+        "```markdown\n[[目标]]\n```\n\n"
+        "~~~~\n```\n[[目标]]\n~~~~\n"
+        f"[目标](#{anchor})\n")
+
+
+def test_preprocess_adds_heading_anchors(vault, tmp_path):
+    context = link_context(vault)
+    note_path = vault / "目标.md"
+    anchor = context["anchors"][note_path]
+
+    text = obsidian_export.preprocess_note(
+        note_path.read_bytes(), note_path, tmp_path / "cache", context).decode('utf-8')
+
+    assert text.startswith(f"[]{{#{anchor}}}\n\n")
+    assert f"# 第一节 {{#{obsidian_export.heading_anchor_id(anchor, '第一节')}}}\n" in text
+    assert f"Second  Part {{#{obsidian_export.heading_anchor_id(anchor, 'Second Part')}}}\n---" in text
+    assert "# 代码中的注释\n" in text
+    assert "## 自定义 {#custom}\n" in text
+
+
+def test_heading_anchors_skip_duplicates_and_closing_sequence():
+    text = obsidian_export.add_heading_anchors("## 标题 ##\n\n## 标题\n", "note-0")
+    anchor = obsidian_export.heading_anchor_id("note-0", "标题")
+
+    assert text == f"## 标题 ## {{#{anchor}}}\n\n## 标题\n"
+
+
+def test_note_hrefs_keep_heading_fragment():
+    fragment = '<a href="#note-0123abcd-h-89abcdef">x</a><a href="#note-0123abcd">y</a>'
+    matches = [match.groups() for match in obsidian_export.NOTE_HREF_PATTERN.finditer(fragment)]
+
+    assert matches == [("note-0123abcd", "-h-89abcdef"), ("note-0123abcd", None)]